@@ -0,0 +1,241 @@
+import json
+import logging
+import math
+import operator
+import os
+from collections import deque
+from dataclasses import dataclass
+from datetime import timedelta
+import aiohttp
+from models import SERIES_TABLES
+
+# Get the logger
+logger = logging.getLogger('neptune-data.collector')
+
+# Declarative rules file; alerting is off when it does not exist
+ALERT_RULES_PATH = os.getenv('ALERT_RULES_PATH', 'alert_rules.json')
+# Comma-separated sinks: log, webhook
+ALERT_SINKS = os.getenv('ALERT_SINKS', 'log')
+ALERT_WEBHOOK_URL = os.getenv('ALERT_WEBHOOK_URL', '')
+ALERT_WEBHOOK_TIMEOUT_SECONDS = float(os.getenv('ALERT_WEBHOOK_TIMEOUT_SECONDS', '10'))
+SCHEDULE_INTERVAL = int(os.getenv('SCHEDULE_INTERVAL_MINUTES', '30'))
+
+OPERATORS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+}
+RULE_TYPES = ('threshold', 'change', 'zscore')
+
+@dataclass(frozen=True)
+class Rule:
+    """
+    One alert rule over a snapshot column.
+
+    threshold compares the value itself, change the percent change against
+    the value `window` snapshots back, and zscore the deviation from the mean
+    of the previous `window` values in standard deviations.
+    """
+    name: str
+    table: str
+    column: str
+    type: str
+    op: str
+    value: float
+    symbol: str = None  # None matches every series of the table
+    window: int = 1
+    cooldown_minutes: float = 60
+
+    @classmethod
+    def parse(cls, raw):
+        rule = cls(
+            name=str(raw['name']),
+            table=raw['table'],
+            column=raw['column'],
+            type=raw.get('type', 'threshold'),
+            op=raw.get('op', '>'),
+            value=float(raw['value']),
+            symbol=None if raw.get('symbol') in (None, '*') else str(raw['symbol']),
+            window=int(raw.get('window', 1 if raw.get('type') == 'change' else 48)),
+            cooldown_minutes=float(raw.get('cooldown_minutes', 60)),
+        )
+        if rule.table not in SERIES_TABLES:
+            raise ValueError(f"Rule {rule.name}: unknown table {rule.table}")
+        if rule.column not in SERIES_TABLES[rule.table][0].__table__.columns:
+            raise ValueError(f"Rule {rule.name}: unknown column {rule.column}")
+        if rule.type not in RULE_TYPES:
+            raise ValueError(f"Rule {rule.name}: type must be one of {', '.join(RULE_TYPES)}")
+        if rule.op not in OPERATORS:
+            raise ValueError(f"Rule {rule.name}: op must be one of {', '.join(OPERATORS)}")
+        if rule.window < 1 or (rule.type == 'zscore' and rule.window < 2):
+            raise ValueError(f"Rule {rule.name}: window is too small")
+        return rule
+
+    @property
+    def history_size(self):
+        """Previous values the rule needs besides the current one"""
+        return 0 if self.type == 'threshold' else self.window
+
+    def measure(self, current, history):
+        """The quantity compared against value, or None if there is not enough history"""
+        if self.type == 'threshold':
+            return current
+        if len(history) < self.window:
+            return None
+        if self.type == 'change':
+            previous = history[-self.window]
+            if not previous:
+                return None
+            return (current - previous) / abs(previous) * 100
+        mean = sum(history) / len(history)
+        std = math.sqrt(sum((v - mean) ** 2 for v in history) / (len(history) - 1))
+        if std == 0:
+            return None
+        return (current - mean) / std
+
+def load_rules(path=ALERT_RULES_PATH):
+    """Parse the rules file; an invalid rule is reported and skipped"""
+    try:
+        with open(path) as f:
+            raw_rules = json.load(f)
+    except FileNotFoundError:
+        return []
+    rules = []
+    for raw in raw_rules:
+        try:
+            rules.append(Rule.parse(raw))
+        except (KeyError, TypeError, ValueError) as e:
+            logger.error(f"Skipping alert rule {raw.get('name', raw) if isinstance(raw, dict) else raw}: {e}")
+    return rules
+
+class AlertEngine:
+    """
+    Evaluates rules against each new snapshot with a bounded per-series history.
+
+    An alert fires when a rule's condition becomes true for a series and
+    re-fires only after its cooldown while it stays true; a resolve
+    notification is sent when it becomes false again.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        self._history = {}  # (rule name, key) -> deque of previous values
+        self._active = {}  # (rule name, key) -> time last notified
+        self.seeded = False
+
+    def seed(self, db, before):
+        """Fill rule histories from snapshots before the given one so rate-of-change and z-score rules work after a restart"""
+        for table in {rule.table for rule in self.rules if rule.history_size}:
+            rules = [rule for rule in self.rules if rule.table == table and rule.history_size]
+            model, key_column = SERIES_TABLES[table]
+            depth = max(rule.history_size for rule in rules)
+            since = before - timedelta(minutes=SCHEDULE_INTERVAL * depth * 1.5)
+            rows = db.query(model).filter(model.timestamp >= since, model.timestamp < before)
+            for row in rows.order_by(model.timestamp):
+                key = str(getattr(row, key_column)) if key_column else "_"
+                for rule in rules:
+                    value = getattr(row, rule.column)
+                    if value is not None and rule.symbol in (None, key):
+                        self._series_history(rule, key).append(float(value))
+        self.seeded = True
+
+    def _series_history(self, rule, key):
+        history = self._history.get((rule.name, key))
+        if history is None:
+            history = self._history[(rule.name, key)] = deque(maxlen=rule.history_size)
+        return history
+
+    def evaluate(self, timestamp, snapshot):
+        """Check every rule against a snapshot ({table: {key: {column: value}}}); returns the notifications"""
+        notifications = []
+        for rule in self.rules:
+            for key, row in snapshot.get(rule.table, {}).items():
+                if rule.symbol is not None and key != rule.symbol:
+                    continue
+                current = row.get(rule.column)
+                if not isinstance(current, (int, float)):
+                    continue
+                history = self._series_history(rule, key)
+                measured = rule.measure(current, list(history))
+                if rule.history_size:
+                    history.append(current)
+                if measured is None:
+                    continue
+
+                state_key = (rule.name, key)
+                last_notified = self._active.get(state_key)
+                if OPERATORS[rule.op](measured, rule.value):
+                    if last_notified is None or timestamp - last_notified >= timedelta(minutes=rule.cooldown_minutes):
+                        self._active[state_key] = timestamp
+                        notifications.append(self._notification('firing', rule, key, timestamp, current, measured))
+                elif last_notified is not None:
+                    del self._active[state_key]
+                    notifications.append(self._notification('resolved', rule, key, timestamp, current, measured))
+        return notifications
+
+    @staticmethod
+    def _notification(status, rule, key, timestamp, current, measured):
+        return {
+            'status': status,
+            'rule': rule.name,
+            'table': rule.table,
+            'series': key,
+            'column': rule.column,
+            'type': rule.type,
+            'condition': f"{rule.op} {rule.value}",
+            'measured': round(measured, 6),
+            'value': current,
+            'timestamp': timestamp.isoformat(),
+        }
+
+async def deliver(notifications):
+    """Send notifications to the configured sinks; delivery problems are logged, never raised"""
+    sinks = {sink.strip() for sink in ALERT_SINKS.split(',') if sink.strip()}
+    if 'log' in sinks:
+        for notification in notifications:
+            logger.log(
+                logging.WARNING if notification['status'] == 'firing' else logging.INFO,
+                f"Alert {notification['status']}: {notification['rule']} {notification['series']} "
+                f"{notification['column']}={notification['value']} ({notification['type']} "
+                f"{notification['measured']} {notification['condition']})",
+                extra={'alert': notification}
+            )
+    if 'webhook' in sinks and ALERT_WEBHOOK_URL:
+        try:
+            timeout = aiohttp.ClientTimeout(total=ALERT_WEBHOOK_TIMEOUT_SECONDS)
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                async with session.post(ALERT_WEBHOOK_URL, json={'alerts': notifications}) as response:
+                    response.raise_for_status()
+        except Exception as e:
+            logger.error(f"Error delivering {len(notifications)} alerts to webhook: {str(e)}")
+
+_engine = None
+
+def get_engine(session_factory, timestamp):
+    """Engine for this process, created and seeded on first use; None when no rules are configured"""
+    global _engine
+    if _engine is None:
+        _engine = AlertEngine(load_rules())
+        if _engine.rules:
+            db = session_factory()
+            try:
+                _engine.seed(db, timestamp)
+            finally:
+                db.close()
+            logger.info(f"Loaded {len(_engine.rules)} alert rules")
+    return _engine if _engine.rules else None
+
+async def evaluate_snapshot(session_factory, timestamp, snapshot):
+    """Evaluate the rules against a freshly stored snapshot and deliver anything that fired or resolved"""
+    try:
+        engine = get_engine(session_factory, timestamp)
+        if engine is None:
+            return []
+        notifications = engine.evaluate(timestamp, snapshot)
+    except Exception as e:
+        logger.error(f"Error evaluating alert rules: {str(e)}")
+        return []
+    if notifications:
+        await deliver(notifications)
+    return notifications
@@ -0,0 +1,389 @@
+import time
+
+# Measured before anything else is imported, for the startup report
+_import_started = time.perf_counter()
+
+import asyncio
+import json
+import logging
+import os
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from aiohttp import web
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from models import (
+    MarketData, TokenPrices, ContractData, NEPTData, DerivedMetrics, SourceStatus
+)
+import collector
+import profiling
+from log_setup import configure_logging, get_logging_stats, WEB_LOGGER, REQUEST_LOGGER
+from change_feed import feed, start_snapshot_poller
+from leases import COLLECTOR_SHARDING
+from batch_query import fetch_batch, build_batch, BatchQueryError
+from frame_query import fetch_frame, build_frame, columns_to_arrow, ARROW_MIMETYPE
+from staking_model import load_latest_snapshot, simulate, parse_amounts
+from responses import row_to_dict, rows_to_columns, latest_timestamps, etag_for, COMPRESS_MIN_SIZE
+from database import ReadSessionLocal, get_async_read_engine, get_pool_stats
+from series_store import store as series_store, start_series_store
+
+try:
+    import orjson
+
+    def dumps(data):
+        return orjson.dumps(data).decode()
+except ImportError:  # Fall back to the standard library encoder
+    def dumps(data):
+        return json.dumps(data, separators=(',', ':'))
+
+# Run the collector inside the web process; set to false when it runs as its own process (python collector.py)
+RUN_COLLECTOR = os.getenv('RUN_COLLECTOR', 'true').lower() == 'true'
+# Rows serialized and written per chunk of a streamed /historical response
+ASYNC_STREAM_CHUNK_ROWS = int(os.getenv('ASYNC_STREAM_CHUNK_ROWS', '500'))
+# Requests of one worker using a database connection at once; the rest queue in arrival order.
+# Keep it at or below the async read pool size (DB_ASYNC_READ_POOL_SIZE + DB_ASYNC_READ_MAX_OVERFLOW)
+ASYNC_DB_CONCURRENCY = int(os.getenv('ASYNC_DB_CONCURRENCY', '20'))
+ASYNC_API_PORT = int(os.getenv('PORT', '8080'))
+
+# Get the loggers; per-request records go through the sampled request logger
+logger = logging.getLogger(WEB_LOGGER)
+request_logger = logging.getLogger(REQUEST_LOGGER)
+
+# Startup timings reported in the log and on /health
+startup_report = {'import_seconds': round(time.perf_counter() - _import_started, 3)}
+
+HISTORICAL_MODELS = {
+    'market': MarketData,
+    'price': TokenPrices,
+    'contract': ContractData,
+    'nept': NEPTData,
+    'derived': DerivedMetrics,
+    'sources': SourceStatus
+}
+
+routes = web.RouteTableDef()
+
+def json_response(data, status=200):
+    return web.json_response(data, status=status, dumps=dumps)
+
+def make_etag(request, *parts):
+    return etag_for(request.path, request.query_string, *parts)
+
+def is_not_modified(request, etag, last_modified=None):
+    """Conditional GET check matching responses.is_not_modified for the Flask routes"""
+    if request.if_none_match:
+        return any(tag.value in (etag, '*') for tag in request.if_none_match)
+    if last_modified and request.if_modified_since:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+    return False
+
+def set_cache_headers(response, etag, last_modified=None):
+    response.headers['ETag'] = f'W/"{etag}"'
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def not_modified(etag, last_modified=None):
+    return set_cache_headers(web.Response(status=304), etag, last_modified)
+
+@web.middleware
+async def compression_middleware(request, handler):
+    """gzip/deflate JSON responses per Accept-Encoding; streamed responses enable it themselves"""
+    response = await handler(request)
+    if (type(response) is web.Response and response.status == 200
+            and response.content_type == 'application/json'
+            and response.body is not None and len(response.body) >= COMPRESS_MIN_SIZE):
+        response.enable_compression()
+    return response
+
+# Sessions over the shared async read engine and the slots gating them, set up at startup
+AsyncReadSession = None
+db_slots = None
+
+@asynccontextmanager
+async def read_session():
+    """Session from the shared pool; waiting requests queue fairly instead of timing out on checkout"""
+    async with db_slots:
+        async with AsyncReadSession() as db:
+            yield db
+
+async def refresh_series_store():
+    """Top up the in-memory window off the event loop; its refresh uses the sync read pool"""
+    if series_store.ready:
+        await asyncio.to_thread(series_store.refresh_if_stale, ReadSessionLocal)
+
+@routes.get('/')
+async def index(request):
+    """Get the latest data from all categories"""
+    request_logger.info("Received request for latest data")
+    async with read_session() as db:
+        snapshot_timestamps = await db.run_sync(
+            latest_timestamps, [MarketData, TokenPrices, ContractData, NEPTData, DerivedMetrics], complete_only=True
+        )
+        last_modified = max([ts for ts in snapshot_timestamps if ts], default=None)
+        etag = make_etag(request, *snapshot_timestamps)
+        if is_not_modified(request, etag, last_modified):
+            return not_modified(etag, last_modified)
+
+        # Rows of the latest complete snapshot of each table
+        latest_data = {}
+        for (key, model), ts in zip((('market_data', MarketData), ('price_data', TokenPrices),
+                                     ('contract_data', ContractData), ('nept_data', NEPTData)), snapshot_timestamps):
+            latest_data[key] = (await db.scalars(
+                select(model).where(model.timestamp == ts).limit(1)
+            )).first() if ts else None
+        response = {
+            k: row_to_dict(v) if v else None
+            for k, v in latest_data.items()
+        }
+        latest_derived_ts = snapshot_timestamps[-1]
+        response['derived_metrics'] = [
+            row_to_dict(row) for row in await db.scalars(
+                select(DerivedMetrics).where(DerivedMetrics.timestamp == latest_derived_ts)
+                .order_by(DerivedMetrics.token_symbol)
+            )
+        ] if latest_derived_ts else []
+    return set_cache_headers(json_response(response), etag, last_modified)
+
+async def stream_rows(request, rows, etag, last_modified):
+    """
+    Write a JSON array a chunk of rows at a time. Each write waits for the
+    client to drain, so a slow reader parks only this coroutine.
+    """
+    response = set_cache_headers(web.StreamResponse(), etag, last_modified)
+    response.content_type = 'application/json'
+    if rows:
+        response.enable_compression()
+    await response.prepare(request)
+    await response.write(b'[')
+    for start in range(0, len(rows), ASYNC_STREAM_CHUNK_ROWS):
+        chunk = ','.join(dumps(row) for row in rows[start:start + ASYNC_STREAM_CHUNK_ROWS])
+        await response.write(((',' if start else '') + chunk).encode())
+    await response.write(b']')
+    await response.write_eof()
+    return response
+
+@routes.get('/historical/{data_type}/{days:\\d+}')
+async def historical_data(request):
+    """Get historical data for a specific type over a number of days"""
+    data_type = request.match_info['data_type']
+    days = int(request.match_info['days'])
+    request_logger.info("Received request for historical %s data for %d days", data_type, days)
+    if data_type not in HISTORICAL_MODELS:
+        return json_response({'error': 'Invalid data type'}, status=400)
+
+    end_date = datetime.utcnow()
+    start_date = end_date - timedelta(days=days)
+    model = HISTORICAL_MODELS[data_type]
+    table = model.__tablename__
+
+    # Windows inside the in-memory store never touch the database
+    await refresh_series_store()
+    if series_store.covers(table, start_date):
+        last_modified = series_store.latest_timestamp(table)
+        etag = make_etag(request, last_modified, series_store.first_timestamp(table, start_date))
+        if request.if_none_match and is_not_modified(request, etag):
+            return not_modified(etag, last_modified)
+        rows = [
+            dict(row, timestamp=row['timestamp'].isoformat())
+            for row in series_store.query(table, start_date, end_date)
+        ]
+    else:
+        # The connection goes back to the pool before anything is written to the client
+        async with read_session() as db:
+            last_modified = await db.scalar(select(func.max(model.timestamp)))
+            first_in_window = await db.scalar(
+                select(func.min(model.timestamp)).where(model.timestamp >= start_date)
+            )
+            etag = make_etag(request, last_modified, first_in_window)
+            if request.if_none_match and is_not_modified(request, etag):
+                return not_modified(etag, last_modified)
+            rows = [row_to_dict(item) for item in await db.scalars(select(model).where(
+                model.timestamp >= start_date,
+                model.timestamp <= end_date
+            ).order_by(model.timestamp))]
+
+    request_logger.info("Returning %d historical records", len(rows), extra={'data_type': data_type, 'days': days})
+    if request.query.get('format') == 'columnar':
+        return set_cache_headers(json_response(rows_to_columns(rows)), etag, last_modified)
+    return await stream_rows(request, rows, etag, last_modified)
+
+async def read_json(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        return {}
+    return body if isinstance(body, dict) else {}
+
+@routes.post('/batch')
+async def batch(request):
+    """Run several table/symbol/range/resolution selections in one request"""
+    body = await read_json(request)
+    await refresh_series_store()
+    columnar = body.get('format') == 'columnar' or request.query.get('format') == 'columnar'
+    try:
+        async with read_session() as db:
+            fetched = await db.run_sync(fetch_batch, body.get('selections'))
+        # Filtering, downsampling and serialization are CPU-bound; keep them off the event loop
+        results = await asyncio.to_thread(build_batch, fetched, columnar=columnar)
+    except BatchQueryError as e:
+        return json_response({'error': str(e)}, status=400)
+    return json_response({'results': results})
+
+@routes.post('/frame')
+async def frame(request):
+    """Resample several series onto one time grid and as-of join them into a single frame"""
+    body = await read_json(request)
+    output = body.get('format') or request.query.get('format', 'columnar')
+    try:
+        async with read_session() as db:
+            fetched = await db.run_sync(fetch_frame, body)
+        # Resampling and the as-of join are CPU-bound; keep them off the event loop
+        columns = await asyncio.to_thread(build_frame, fetched)
+        if output == 'arrow':
+            return web.Response(body=await asyncio.to_thread(columns_to_arrow, columns), content_type=ARROW_MIMETYPE)
+    except BatchQueryError as e:
+        return json_response({'error': str(e)}, status=400)
+    return json_response({'count': len(columns['timestamp']), 'data': columns})
+
+@routes.get('/staking/simulate')
+async def staking_simulate(request):
+    """APR of every staking pool if each amount of NEPT were added to ?pool=, from the latest snapshot"""
+    async with read_session() as db:
+        snapshot = await db.run_sync(load_latest_snapshot)
+    if snapshot is None:
+        return json_response({'error': 'No staking data available'}, status=404)
+
+    etag = make_etag(request, snapshot.timestamp)
+    if is_not_modified(request, etag, snapshot.timestamp):
+        return not_modified(etag, snapshot.timestamp)
+    try:
+        pool_number = int(request.query.get('pool', ''))
+        results = simulate(snapshot, pool_number, parse_amounts(request.query))
+    except ValueError as e:
+        return json_response({'error': str(e)}, status=400)
+
+    response = json_response({
+        'timestamp': snapshot.timestamp.isoformat(),
+        'emission_rate': snapshot.emission_rate,
+        'pools': snapshot.current(),
+        'pool': pool_number,
+        'results': results
+    })
+    return set_cache_headers(response, etag, snapshot.timestamp)
+
+@routes.get('/tx/{tx_hash}')
+async def transaction(request):
+    """Look up a transaction by hash, decoding Neptune market and nToken messages"""
+    # Deferred so web workers only load the chain client when a lookup needs it
+    from tx_lookup import lookup_transactions_async, normalize_hash, error_http_status, get_cache, TX_LOOKUP_TIMEOUT_SECONDS
+    tx_hash = normalize_hash(request.match_info['tx_hash'])
+    tx = get_cache().get(tx_hash)
+    if tx is None:
+        try:
+            tx = (await asyncio.wait_for(lookup_transactions_async([tx_hash]), TX_LOOKUP_TIMEOUT_SECONDS))[tx_hash]
+        except asyncio.TimeoutError:
+            return json_response({'hash': tx_hash, 'error': 'Lookup timed out'}, status=504)
+    if 'error' in tx:
+        return json_response(tx, status=error_http_status(tx))
+    return json_response(tx)
+
+@routes.get('/stream')
+async def stream(request):
+    """Server-sent events feed of new snapshots (?mode=diff for changes only)"""
+    mode = request.query.get('mode', 'full')
+    last_event_id = request.headers.get('Last-Event-ID') or request.query.get('last_event_id')
+    events = feed.subscribe_async(mode=mode, last_event_id=last_event_id)
+    if events is None:
+        return json_response({'error': 'Too many subscribers'}, status=503)
+    # The subscription holds a slot and a feed listener until aclose(), which runs even if the client
+    # disconnects before the first event
+    try:
+        logger.info(f"Change feed subscriber connected ({feed.subscriber_count} active)")
+        response = web.StreamResponse(headers={
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+        await response.prepare(request)
+        async for event in events:
+            await response.write(event.encode())
+    except ConnectionResetError:
+        pass
+    finally:
+        await events.aclose()
+    return response
+
+@routes.get('/profiling')
+@routes.post('/profiling')
+async def profiling_settings(request):
+    """Show or change cycle/request profiling settings and list recent profiles"""
+    if request.method == 'POST':
+        if not profiling.is_authorized(request.headers):
+            return json_response({'error': 'Changing profiling settings requires PROFILE_ADMIN_TOKEN'}, status=403)
+        try:
+            profiling.update_settings(await read_json(request))
+        except (TypeError, ValueError) as e:
+            return json_response({'error': str(e)}, status=400)
+        logger.info(f"Profiling settings updated: {profiling.settings}")
+    return json_response({'settings': profiling.settings, 'profiles': profiling.list_profiles()})
+
+@routes.get('/health')
+async def health(request):
+    async with read_session() as db:
+        # Only complete snapshots count as an update
+        last_update = (await db.run_sync(latest_timestamps, [MarketData], complete_only=True))[0]
+    status = {
+        'status': 'healthy',
+        'mode': 'async',
+        'last_update': last_update.isoformat() if last_update else None,
+        'data_available': bool(last_update),
+        **collector.is_running(),
+        'db_pools': get_pool_stats(),
+        'startup': startup_report,
+        'logging': get_logging_stats(),
+        'series_store': series_store.stats()
+    }
+    request_logger.debug("Health check status: %s", status)
+    return json_response(status)
+
+async def start_background_tasks(app):
+    global AsyncReadSession, db_slots
+    try:
+        # One async engine, and so one connection pool, serves every request of this worker
+        AsyncReadSession = async_sessionmaker(get_async_read_engine(), expire_on_commit=False)
+        db_slots = asyncio.Semaphore(ASYNC_DB_CONCURRENCY)
+        start_series_store(ReadSessionLocal)
+        if RUN_COLLECTOR:
+            collector.start_background_tasks()
+        else:
+            logger.info("RUN_COLLECTOR is false, not starting data collection in this process")
+        if not RUN_COLLECTOR or COLLECTOR_SHARDING:
+            # Snapshots are (also) stored by other processes; pick them up for /stream subscribers
+            start_snapshot_poller(ReadSessionLocal)
+    except Exception as e:
+        logger.error(f"Failed to start background tasks: {str(e)}", exc_info=True)
+        raise
+    startup_report['ready_seconds'] = round(time.perf_counter() - _import_started, 3)
+    logger.info(f"Startup report (async API): imports {startup_report['import_seconds']}s, ready {startup_report['ready_seconds']}s")
+
+async def dispose_engine(app):
+    await get_async_read_engine().dispose()
+
+async def create_app():
+    """
+    Async serving mode for the read routes, an alternative to the Flask app:
+
+        gunicorn async_api:create_app --worker-class aiohttp.GunicornWebWorker
+    """
+    # Route logging through the non-blocking queue pipeline
+    configure_logging()
+    app = web.Application(middlewares=[compression_middleware])
+    app.add_routes(routes)
+    app.on_startup.append(start_background_tasks)
+    app.on_cleanup.append(dispose_engine)
+    return app
+
+if __name__ == "__main__":
+    web.run_app(create_app(), host='0.0.0.0', port=ASYNC_API_PORT)
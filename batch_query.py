@@ -0,0 +1,164 @@
+import logging
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from models import SERIES_TABLES
+from responses import row_to_dict, rows_to_columns
+from database import ReadSessionLocal
+from series_store import store as series_store
+
+# Get the logger
+logger = logging.getLogger('neptune-data.web')
+
+BATCH_MAX_SELECTIONS = int(os.getenv('BATCH_MAX_SELECTIONS', '50'))
+BATCH_MAX_DAYS = int(os.getenv('BATCH_MAX_DAYS', '365'))
+
+_RESOLUTION_PATTERN = re.compile(r'^(\d+)([mhd])$')
+_RESOLUTION_UNITS = {'m': 'minutes', 'h': 'hours', 'd': 'days'}
+
+class BatchQueryError(ValueError):
+    """Raised for an invalid batch request; the message is returned to the client"""
+
+def parse_resolution(value):
+    """Parse 'raw' or '<n>m|h|d' into a timedelta (None for raw)"""
+    if value in (None, '', 'raw'):
+        return None
+    match = _RESOLUTION_PATTERN.match(str(value))
+    if not match or int(match.group(1)) == 0:
+        raise BatchQueryError(f"Invalid resolution: {value}")
+    return timedelta(**{_RESOLUTION_UNITS[match.group(2)]: int(match.group(1))})
+
+# Timestamps are stored as naive UTC
+EPOCH = datetime(1970, 1, 1)
+
+def _parse_time(value, field):
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise BatchQueryError(f"Invalid {field}: {value}")
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def parse_range(raw, now, what="range"):
+    """(start, end) from 'start'/'end' or 'days' back from now, at most BATCH_MAX_DAYS long"""
+    if 'start' in raw:
+        start = _parse_time(raw['start'], 'start')
+        end = _parse_time(raw['end'], 'end') if raw.get('end') else now
+    else:
+        days = raw.get('days', 1)
+        # Bounded before building the timedelta, which overflows for huge values
+        if not isinstance(days, (int, float)) or not 0 < days <= BATCH_MAX_DAYS:
+            raise BatchQueryError(f"Invalid days: {days}, at most {BATCH_MAX_DAYS}")
+        end = now
+        start = end - timedelta(days=days)
+    if start > end or end - start > timedelta(days=BATCH_MAX_DAYS):
+        raise BatchQueryError(f"Invalid {what}, at most {BATCH_MAX_DAYS} days")
+    return start, end
+
+def parse_selection(raw, now):
+    """Validate one selection and normalize it to table, symbols, start, end and resolution"""
+    if not isinstance(raw, dict):
+        raise BatchQueryError("Each selection must be an object")
+    table = raw.get('table')
+    if table not in SERIES_TABLES:
+        raise BatchQueryError(f"Invalid table: {table}")
+
+    start, end = parse_range(raw, now, f"range for {table}")
+
+    symbols = raw.get('symbols')
+    if symbols is not None:
+        if not isinstance(symbols, list) or SERIES_TABLES[table][1] is None:
+            raise BatchQueryError(f"Invalid symbols for {table}")
+        symbols = {str(symbol) for symbol in symbols}
+
+    return {
+        'table': table,
+        'symbols': symbols,
+        'start': start,
+        'end': end,
+        'resolution': parse_resolution(raw.get('resolution')),
+    }
+
+def downsample(rows, key_column, resolution):
+    """Keep the last row of each (series, bucket); rows must be sorted by timestamp"""
+    if resolution is None:
+        return rows
+    step = resolution.total_seconds()
+    latest = {}
+    for row in rows:
+        bucket = int((row['timestamp'] - EPOCH).total_seconds() // step)
+        latest[(row.get(key_column) if key_column else None, bucket)] = row
+    return sorted(latest.values(), key=lambda row: row['timestamp'])
+
+def _fetch_table(db, table, selections):
+    """Rows covering every selection on a table, from the in-memory window when it covers them, else one query"""
+    model, key_column = SERIES_TABLES[table]
+    start = min(s['start'] for s in selections)
+    end = max(s['end'] for s in selections)
+    symbols = None
+    if key_column and all(s['symbols'] is not None for s in selections):
+        symbols = set().union(*(s['symbols'] for s in selections))
+
+    series_store.refresh_if_stale(ReadSessionLocal)
+    rows = series_store.query(table, start, end, symbols)
+    if rows is not None:
+        return rows
+
+    query = db.query(model).filter(model.timestamp >= start, model.timestamp <= end)
+    if symbols is not None:
+        query = query.filter(getattr(model, key_column).in_(symbols))
+    rows = []
+    for item in query.order_by(model.timestamp):
+        # Keep the datetime for range checks; it is serialized at the end
+        row = row_to_dict(item)
+        row['timestamp'] = item.timestamp
+        rows.append(row)
+    return rows
+
+def fetch_batch(db, raw_selections):
+    """Validate the selections and load their rows with one query per distinct table"""
+    if not isinstance(raw_selections, list) or not raw_selections:
+        raise BatchQueryError("selections must be a non-empty list")
+    if len(raw_selections) > BATCH_MAX_SELECTIONS:
+        raise BatchQueryError(f"At most {BATCH_MAX_SELECTIONS} selections per batch")
+
+    now = datetime.utcnow()
+    selections = [parse_selection(raw, now) for raw in raw_selections]
+
+    by_table = {}
+    for selection in selections:
+        by_table.setdefault(selection['table'], []).append(selection)
+
+    table_rows = {}
+    for table, table_selections in by_table.items():
+        table_rows[table] = _fetch_table(db, table, table_selections)
+    return raw_selections, selections, table_rows
+
+def build_batch(fetched, columnar=False):
+    """Filter, downsample and serialize the rows of fetch_batch; needs no session"""
+    raw_selections, selections, table_rows = fetched
+    results = []
+    for raw, selection in zip(raw_selections, selections):
+        key_column = SERIES_TABLES[selection['table']][1]
+        rows = [
+            row for row in table_rows[selection['table']]
+            if selection['start'] <= row['timestamp'] <= selection['end']
+            and (selection['symbols'] is None or str(row[key_column]) in selection['symbols'])
+        ]
+        rows = [
+            dict(row, timestamp=row['timestamp'].isoformat())
+            for row in downsample(rows, key_column, selection['resolution'])
+        ]
+        results.append({
+            'selection': raw,
+            'count': len(rows),
+            'data': rows_to_columns(rows) if columnar else rows,
+        })
+
+    logger.info(f"Batch query: {len(selections)} selections over {len(table_rows)} tables")
+    return results
+
+def run_batch(db, raw_selections, columnar=False):
+    """Run a list of selections over one session with one query per distinct table"""
+    return build_batch(fetch_batch(db, raw_selections), columnar=columnar)
@@ -0,0 +1,85 @@
+"""
+Load test for the read API, to compare the Flask and async serving modes.
+
+    python benchmark_api.py http://localhost:8080 /historical/price/30 --concurrency 200 --requests 2000
+    python benchmark_api.py http://localhost:8080 / --slow-read 16384
+
+--slow-read makes every client read its response at that many bytes per
+second, like a client on a slow link, which is what ties up sync workers.
+"""
+import argparse
+import asyncio
+import json
+import time
+import aiohttp
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+async def _fetch(session, url, slow_read, chunk_size=4096):
+    started = time.perf_counter()
+    async with session.get(url) as response:
+        size = 0
+        if slow_read:
+            async for chunk in response.content.iter_chunked(chunk_size):
+                size += len(chunk)
+                await asyncio.sleep(len(chunk) / slow_read)
+        else:
+            size = len(await response.read())
+        return response.status, size, time.perf_counter() - started
+
+async def run(base_url, paths, concurrency, total, slow_read, timeout):
+    """Issue total requests round-robin over paths with at most concurrency in flight"""
+    latencies, statuses, sizes = [], {}, 0
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(base_url.rstrip('/') + paths[i % len(paths)])
+
+    async def worker(session):
+        nonlocal sizes
+        while not queue.empty():
+            url = queue.get_nowait()
+            try:
+                status, size, latency = await _fetch(session, url, slow_read)
+                latencies.append(latency)
+                sizes += size
+            except Exception as e:
+                status = type(e).__name__
+            statuses[status] = statuses.get(status, 0) + 1
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        'requests': total,
+        'concurrency': concurrency,
+        'seconds': round(elapsed, 2),
+        'requests_per_second': round(total / elapsed, 1),
+        'p50_ms': round(_percentile(latencies, 0.5) * 1000, 1) if latencies else None,
+        'p95_ms': round(_percentile(latencies, 0.95) * 1000, 1) if latencies else None,
+        'p99_ms': round(_percentile(latencies, 0.99) * 1000, 1) if latencies else None,
+        'megabytes': round(sizes / 1e6, 1),
+        'statuses': {str(status): count for status, count in statuses.items()},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark read API routes")
+    parser.add_argument('base_url')
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--slow-read', type=float, default=0, help="bytes per second each client reads at")
+    parser.add_argument('--timeout', type=float, default=300)
+    args = parser.parse_args()
+    result = asyncio.run(run(args.base_url, args.paths, args.concurrency, args.requests, args.slow_read, args.timeout))
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
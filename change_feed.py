@@ -0,0 +1,312 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import Numeric, func
+from models import SERIES_TABLES, SourceStatus, SNAPSHOT_MARKER
+
+# Get the loggers; publish runs in the collector thread, the snapshot poller in web processes
+logger = logging.getLogger('neptune-data.collector')
+web_logger = logging.getLogger('neptune-data.web')
+
+# Seconds between keepalive comments on idle streams
+CHANGE_FEED_KEEPALIVE_SECONDS = float(os.getenv('CHANGE_FEED_KEEPALIVE_SECONDS', '15'))
+# Maximum concurrent subscribers per process
+CHANGE_FEED_MAX_SUBSCRIBERS = int(os.getenv('CHANGE_FEED_MAX_SUBSCRIBERS', '1000'))
+# Flask streams each hold a server thread while connected, so the threaded server admits at
+# most this share of its threads as subscribers and keeps the rest for ordinary requests
+CHANGE_FEED_THREAD_SHARE = float(os.getenv('CHANGE_FEED_THREAD_SHARE', '0.25'))
+# Seconds between checks for snapshots stored by another process (separate or sharded collectors)
+CHANGE_FEED_POLL_SECONDS = float(os.getenv('CHANGE_FEED_POLL_SECONDS', '15'))
+
+def thread_subscriber_limit(threads):
+    """Subscriber cap for a server that spends one of its threads on each stream"""
+    return max(1, min(CHANGE_FEED_MAX_SUBSCRIBERS, int(threads * CHANGE_FEED_THREAD_SHARE)))
+
+def _serialize_value(value, column):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    # DECIMAL columns: Decimal once loaded, or the fetched value on records that were never reloaded
+    if value is not None and isinstance(column.type, Numeric):
+        return float(value)
+    return value
+
+def build_snapshot(records):
+    """
+    Build a snapshot dict from ORM records: {table: {key: {column: value}}}.
+
+    The key joins the non-timestamp primary key columns, so rows line up
+    between consecutive snapshots for diffing.
+    """
+    snapshot = {}
+    for record in records:
+        table = record.__table__
+        key_columns = [c.key for c in table.primary_key.columns if c.key != 'timestamp']
+        key = "/".join(str(getattr(record, k)) for k in key_columns) or "_"
+        snapshot.setdefault(table.name, {})[key] = {
+            c.key: _serialize_value(getattr(record, c.key), c)
+            for c in table.columns
+            if c.key != 'timestamp' and c.key not in key_columns
+        }
+    return snapshot
+
+def load_snapshot(db, timestamp):
+    """Snapshot of everything stored at a timestamp, whichever process or node wrote it"""
+    records = []
+    for name, (model, _) in SERIES_TABLES.items():
+        if name == 'contract_execute_buckets':
+            continue
+        query = db.query(model).filter(model.timestamp == timestamp)
+        if model is SourceStatus:
+            query = query.filter(SourceStatus.source != SNAPSHOT_MARKER)
+        records.extend(query)
+    return build_snapshot(records)
+
+def diff_snapshots(previous, current):
+    """Compute a compact diff: changed fields per row, None for rows that disappeared"""
+    diff = {}
+    for table in set(previous) | set(current):
+        old_rows = previous.get(table, {})
+        new_rows = current.get(table, {})
+        table_diff = {}
+        for key, row in new_rows.items():
+            old_row = old_rows.get(key, {})
+            changed = {field: value for field, value in row.items() if old_row.get(field) != value}
+            if changed:
+                table_diff[key] = changed
+        for key in old_rows:
+            if key not in new_rows:
+                table_diff[key] = None
+        if table_diff:
+            diff[table] = table_diff
+    return diff
+
+def _format_event(event_id, event_type, payload):
+    data = json.dumps(payload, separators=(',', ':'))
+    return f"id: {event_id}\nevent: {event_type}\ndata: {data}\n\n"
+
+class Subscription:
+    """
+    SSE event iterator holding one subscriber slot until closed.
+
+    The WSGI server calls close() when the response ends, including when the
+    client went away before the first event, which a generator's finally
+    would not cover because it never started.
+    """
+
+    def __init__(self, events, release):
+        self._events = events
+        self._release = release
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._events)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._events.close()
+            self._release()
+
+class AsyncSubscription:
+    """
+    Async counterpart of Subscription for the async API.
+
+    aclose() releases the slot and detaches the wakeup listener even if the
+    stream was never iterated, e.g. when the client disconnected during
+    response.prepare().
+    """
+
+    def __init__(self, events, release):
+        self._events = events
+        self._release = release
+        self._closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self._events.__anext__()
+
+    async def aclose(self):
+        if not self._closed:
+            self._closed = True
+            await self._events.aclose()
+            self._release()
+
+class ChangeFeed:
+    """
+    In-process fan-out of new snapshots to server-sent event subscribers.
+
+    Each snapshot is serialized once (full and diff) when published; subscribers
+    only wait on a shared condition and write the pre-encoded event.
+    """
+
+    def __init__(self, max_subscribers=CHANGE_FEED_MAX_SUBSCRIBERS):
+        self.max_subscribers = max_subscribers
+        self._condition = threading.Condition()
+        self._timestamp = None
+        self._snapshot = None
+        self._event_id = None
+        self._previous_event_id = None
+        self._full_event = None
+        self._diff_event = None
+        self._subscribers = 0
+        self._listeners = []
+
+    @property
+    def latest_timestamp(self):
+        return self._timestamp
+
+    def publish(self, timestamp, snapshot):
+        """Announce a new snapshot; one that is not newer than the last (e.g. seen by the poller first) is ignored"""
+        with self._condition:
+            if self._timestamp is not None and timestamp <= self._timestamp:
+                return
+        event_id = timestamp.isoformat()
+        full_event = _format_event(event_id, 'snapshot', {'timestamp': event_id, 'data': snapshot})
+        diff_event = None
+        if self._snapshot is not None:
+            diff = diff_snapshots(self._snapshot, snapshot)
+            diff_event = _format_event(event_id, 'diff', {
+                'timestamp': event_id, 'previous': self._event_id, 'data': diff
+            })
+        with self._condition:
+            self._previous_event_id = self._event_id
+            self._event_id = event_id
+            self._timestamp = timestamp
+            self._snapshot = snapshot
+            self._full_event = full_event
+            self._diff_event = diff_event
+            self._condition.notify_all()
+        logger.info(f"Published snapshot {event_id} to {self._subscribers} subscribers")
+        for listener in list(self._listeners):
+            try:
+                listener(timestamp)
+            except Exception as e:
+                logger.error(f"Change feed listener failed: {str(e)}")
+
+    def add_listener(self, callback):
+        """Call callback(timestamp) in the publishing thread after each new snapshot"""
+        self._listeners.append(callback)
+
+    @property
+    def subscriber_count(self):
+        return self._subscribers
+
+    def _acquire(self):
+        with self._condition:
+            if self._subscribers >= self.max_subscribers:
+                return False
+            self._subscribers += 1
+            return True
+
+    def _release(self):
+        with self._condition:
+            self._subscribers -= 1
+
+    def _event_for(self, last_event_id, mode):
+        """Pick the diff if the subscriber saw the previous snapshot, else the full one"""
+        if mode == 'diff' and self._diff_event and last_event_id == self._previous_event_id:
+            return self._diff_event
+        return self._full_event
+
+    def subscribe(self, mode='full', last_event_id=None):
+        """Return an SSE Subscription, or None if the subscriber limit is reached"""
+        if not self._acquire():
+            return None
+
+        def stream():
+            seen = last_event_id
+            yield f"retry: {int(CHANGE_FEED_KEEPALIVE_SECONDS * 1000)}\n\n"
+            while True:
+                with self._condition:
+                    self._condition.wait_for(
+                        lambda: self._event_id is not None and self._event_id != seen,
+                        timeout=CHANGE_FEED_KEEPALIVE_SECONDS
+                    )
+                    if self._event_id is None or self._event_id == seen:
+                        event = None
+                    else:
+                        event = self._event_for(seen, mode)
+                        seen = self._event_id
+                yield event if event else ": keepalive\n\n"
+
+        return Subscription(stream(), self._release)
+
+    def subscribe_async(self, mode='full', last_event_id=None):
+        """
+        Async variant of subscribe for the async API: subscribers wait on the
+        event loop instead of holding a thread each. Must be called from the loop.
+        Returns an AsyncSubscription, or None if the subscriber limit is reached.
+        """
+        if not self._acquire():
+            return None
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+
+        def listener(timestamp):
+            loop.call_soon_threadsafe(wakeup.set)
+
+        self.add_listener(listener)
+
+        def release():
+            self._listeners.remove(listener)
+            self._release()
+
+        async def stream():
+            seen = last_event_id
+            yield f"retry: {int(CHANGE_FEED_KEEPALIVE_SECONDS * 1000)}\n\n"
+            while True:
+                with self._condition:
+                    event = None
+                    if self._event_id is not None and self._event_id != seen:
+                        event = self._event_for(seen, mode)
+                        seen = self._event_id
+                if event:
+                    yield event
+                    continue
+                try:
+                    await asyncio.wait_for(wakeup.wait(), CHANGE_FEED_KEEPALIVE_SECONDS)
+                    wakeup.clear()
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+
+        return AsyncSubscription(stream(), release)
+
+# Process-wide feed the collector publishes to and the web routes subscribe to
+feed = ChangeFeed()
+
+def poll_snapshots(session_factory, interval=CHANGE_FEED_POLL_SECONDS):
+    """
+    Publish snapshots another process stored, following the completion marker in the database.
+
+    The feed is otherwise only filled by a collector running in this process,
+    so web workers with RUN_COLLECTOR=false, and nodes that did not run a
+    sharded cycle's final step, would never send an event.
+    """
+    while True:
+        db = session_factory()
+        try:
+            timestamp = db.query(func.max(SourceStatus.timestamp)).filter(
+                SourceStatus.source == SNAPSHOT_MARKER
+            ).scalar()
+            if timestamp is not None and (feed.latest_timestamp is None or timestamp > feed.latest_timestamp):
+                feed.publish(timestamp, load_snapshot(db, timestamp))
+        except Exception as e:
+            web_logger.error(f"Error polling for new snapshots: {str(e)}")
+        finally:
+            db.close()
+        time.sleep(interval)
+
+def start_snapshot_poller(session_factory):
+    thread = threading.Thread(target=poll_snapshots, args=(session_factory,), daemon=True)
+    thread.start()
+    web_logger.info(f"Following snapshots from the database every {CHANGE_FEED_POLL_SECONDS:.0f}s")
+    return thread
@@ -1,248 +1,439 @@
 import asyncio
 import logging
-from datetime import datetime
-from pyinjective.async_client import AsyncClient
-from pyinjective.core.network import Network
-from queries import get_market_contract_executes, get_all_borrow_accounts, get_NEPT_emission_rate, get_borrow_rates, get_lending_rates, get_NEPT_staking_amounts, get_NEPT_circulating_supply, get_nToken_circulating_supply, get_lent_amount, get_borrowed_amount, get_token_prices, get_nToken_contract_executes, get_NEPT_staking_rates, get_collateral_amounts, get_LP_info
-from models import MarketData, TokenPrices, ContractData, NEPTData, TokenRates, TokenAmounts, NTokenContractExecutes, MarketContractExecutes, StakingPools, CollateralAmounts, LPPoolData
-from database import get_db
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from functools import partial
+from sqlalchemy.exc import IntegrityError
+from rpc_pool import get_client
+from queries import refresh_tokens, get_all_borrow_accounts
+from models import MarketData, ContractData, NEPTData, SourceStatus, SNAPSHOT_MARKER
+from database import get_db, SessionLocal
+from derived_metrics import get_previous_executes, compute_derived_metrics, build_derived_records
+from change_feed import feed, build_snapshot, load_snapshot
+from alerts import evaluate_snapshot
+from source_registry import SOURCES as SOURCE_REGISTRY, account_ranges
+from leases import COLLECTOR_NODE_ID, COLLECTOR_SHARDING, TERMINAL_STATUSES, cycle_timestamp, claim, complete, lease_states, prune_leases
 
 # Get the logger
-logger = logging.getLogger('neptune-data')
+logger = logging.getLogger('neptune-data.collector')
 
-async def collect_and_store_data():
-    """Collect and store all data types."""
-    try:
-        # Initialize Injective client
-        client = AsyncClient(Network.mainnet())
-        
-        # Get database session
-        db = next(get_db())
-        
+# Extra attempts per failed source within one cycle
+COLLECT_SOURCE_RETRIES = int(os.getenv('COLLECT_SOURCE_RETRIES', '3'))
+# Delay before the first retry, doubled after each further failure
+COLLECT_RETRY_BACKOFF_SECONDS = float(os.getenv('COLLECT_RETRY_BACKOFF_SECONDS', '5'))
+# No retry is started after this many seconds into the cycle
+COLLECT_RETRY_WINDOW_SECONDS = float(os.getenv('COLLECT_RETRY_WINDOW_SECONDS', '600'))
+# Seconds between lease table polls while waiting on items held by other nodes
+COLLECT_LEASE_POLL_SECONDS = float(os.getenv('COLLECT_LEASE_POLL_SECONDS', '2'))
+# Work items one node runs at a time; items beyond this are left for other nodes to claim
+COLLECT_ITEM_CONCURRENCY = int(os.getenv('COLLECT_ITEM_CONCURRENCY', '4'))
+
+# Parent tables are written once per snapshot so each source can commit its children on its own
+PARENT_MODELS = (MarketData, ContractData, NEPTData)
+
+@dataclass
+class SourceResult:
+    """Outcome of one source in a cycle: its records, values other steps need, and status"""
+    name: str
+    status: str = 'ok'
+    attempts: int = 0
+    duration: float = 0.0
+    error: str = None
+    records: list = field(default_factory=list)
+    values: dict = field(default_factory=dict)
+
+# Fetcher of each registered source, by name
+SOURCES = {source.name: source.fetch for source in SOURCE_REGISTRY}
+
+# Sources the derived metrics are computed from
+DERIVED_INPUTS = tuple(source.name for source in SOURCE_REGISTRY if source.derived_input)
+
+async def run_source(name, fetch, client, timestamp, deadline):
+    """Fetch one source, retrying failures with exponential backoff until the retry window closes"""
+    result = SourceResult(name)
+    delay = COLLECT_RETRY_BACKOFF_SECONDS
+    start = time.monotonic()
+    while True:
+        result.attempts += 1
         try:
-            # Create timestamp for consistency across records
-            current_timestamp = datetime.utcnow()
-            
-            # Collect and store market data
-            logger.info("Fetching market data...")
-            borrow_accounts_data = await get_all_borrow_accounts(client)
-            
-            market_data_record = MarketData(
-                timestamp=current_timestamp,
-                borrow_accounts_count=borrow_accounts_data['total_accounts_count'],
-                unique_borrow_addresses=borrow_accounts_data['unique_addresses_count']
-            )
-            db.add(market_data_record)
-            logger.info(f"Successfully fetched and stored market data")
-
-            # Collect and store price data
-            logger.info("Fetching price data...")
-            token_prices_data = await get_token_prices(client)
-            
-            # For each token price, create a separate record
-            for token_symbol, price in token_prices_data.items():
-                price_value = price.replace('$', '')  # Remove $ symbol
-                try:
-                    price_data = TokenPrices(
-                        timestamp=current_timestamp,
-                        token_symbol=token_symbol,
-                        price=price_value
-                    )
-                    db.add(price_data)
-                except Exception as e:
-                    logger.warning(f"Error adding token price for {token_symbol}: {str(e)}")
-                    # If there's an error, try to get the existing record and update it
-                    try:
-                        existing_price = db.query(TokenPrices).filter_by(
-                            timestamp=current_timestamp, 
-                            token_symbol=token_symbol
-                        ).first()
-                        if existing_price:
-                            existing_price.price = price_value
-                    except Exception as inner_e:
-                        logger.error(f"Error updating token price for {token_symbol}: {str(inner_e)}")
-            
-            logger.info(f"Successfully fetched and stored token prices")
-
-            # Collect and store contract data
-            logger.info("Fetching contract data...")
-            contract_data_record = ContractData(
-                timestamp=current_timestamp
-            )
-            db.add(contract_data_record)
-            logger.info(f"Successfully added contract data record")
-
-            # Collect and store market executes
-            logger.info("Fetching market contract executes...")
-            market_executes = await get_market_contract_executes(client)
-            if market_executes:
-                market_executes_record = MarketContractExecutes(
-                    timestamp=current_timestamp,
-                    contract_type="market",
-                    execute_count=market_executes
-                )
-                db.add(market_executes_record)
-                logger.info(f"Successfully stored market contract executes")
-
-            # Collect and store NEPT data
-            logger.info("Fetching NEPT data...")
-            emission_rate = await get_NEPT_emission_rate(client)
-            staking_amounts, total_bonded = await get_NEPT_staking_amounts(client)
-            circulating_supply = await get_NEPT_circulating_supply()
-            
-            try:
-                circulating_supply = float(circulating_supply)
-            except ValueError:
-                logger.warning(f"Could not convert circulating supply to float: {circulating_supply}")
-                circulating_supply = 0
-                
-            nept_data_record = NEPTData(
-                timestamp=current_timestamp,
-                circulating_supply=circulating_supply,
-                emission_rate=emission_rate,
-                total_bonded=total_bonded
-            )
-            db.add(nept_data_record)
-            logger.info(f"Successfully stored NEPT data")
-            
-            # Store staking pools data
-            staking_rates = await get_NEPT_staking_rates(client)  # Get rates once
-            for pool_number, staking_amount in staking_amounts.items():
-                # Extract just the numeric part from 'staking_pool_1'
-                pool_num = ''.join(filter(str.isdigit, pool_number))
-                pool_key = f"pool_{pool_num}"
-                staking_rate = staking_rates.get(pool_key, "0%").replace('%', '')
-                
-                pool_record = StakingPools(
-                    timestamp=current_timestamp,
-                    pool_number=int(pool_num),
-                    staking_amount=staking_amount,
-                    staking_rate=float(staking_rate)
-                )
-                db.add(pool_record)
-            
-            # Collect and store token rates
-            logger.info("Fetching token rates...")
-            borrow_rates_data = await get_borrow_rates(client)
-            lending_rates_data = await get_lending_rates(client)
-            
-            # For each token, create a rate record
-            for token_symbol, borrow_rate in borrow_rates_data.items():
-                lend_rate = lending_rates_data.get(token_symbol, "0%")
-                
-                # Remove % symbol and convert to float
-                borrow_rate_value = float(borrow_rate.replace('%', ''))
-                lend_rate_value = float(lend_rate.replace('%', ''))
-                
-                token_rate = TokenRates(
-                    timestamp=current_timestamp,
-                    token_symbol=token_symbol,
-                    borrow_rate=borrow_rate_value,
-                    lend_rate=lend_rate_value
-                )
-                db.add(token_rate)
-            
-            logger.info(f"Successfully stored token rates")
-
-            # Collect and store token amounts
-            logger.info("Fetching token amounts...")
-            lent_amounts = await get_lent_amount(client)
-            borrowed_amounts = await get_borrowed_amount(client)
-            
-            # For each token, create an amount record
-            for token_symbol in set(list(lent_amounts.keys()) + list(borrowed_amounts.keys())):
-                lent_amount_value = lent_amounts.get(token_symbol, 0)
-                borrowed_amount_value = borrowed_amounts.get(token_symbol, 0)
-                
-                token_amount = TokenAmounts(
-                    timestamp=current_timestamp,
-                    token_symbol=token_symbol,
-                    lent_amount=lent_amount_value,
-                    borrowed_amount=borrowed_amount_value
-                )
-                db.add(token_amount)
-            
-            logger.info(f"Successfully stored token amounts")
-
-            # Collect and store nToken contract executes
-            logger.info("Fetching nToken contract executes...")
-            ntoken_executes_data = await get_nToken_contract_executes(client)
-            
-            # For each nToken, create an execute record
-            for token_symbol, execute_count in ntoken_executes_data.items():
-                if execute_count is not None:
-                    ntoken_record = NTokenContractExecutes(
-                        timestamp=current_timestamp,
-                        token_symbol=token_symbol,
-                        execute_count=execute_count
-                    )
-                    db.add(ntoken_record)
-            
-            logger.info(f"Successfully stored nToken contract executes")
-
-            # Collect and store collateral amounts
-            logger.info("Fetching collateral amounts...")
-            collateral_amounts_data = await get_collateral_amounts(client)
-            
-            # For each token, create a collateral amount record
-            for token_symbol, amount in collateral_amounts_data.items():
-                collateral_record = CollateralAmounts(
-                    timestamp=current_timestamp,
-                    token_symbol=token_symbol,
-                    amount=amount
-                )
-                db.add(collateral_record)
-            
-            logger.info(f"Successfully stored collateral amounts")
-
-            # Collect and store LP pool data
-            logger.info("Fetching LP pool data...")
-            lp_pool_data = await get_LP_info(client)
-            
-            if lp_pool_data:
-                # Use a dictionary to store unique pools by pool_address
-                unique_pools = {}
-                for pool in lp_pool_data:
-                    pool_address = pool["pool_address"]
-                    if pool_address not in unique_pools:
-                        unique_pools[pool_address] = pool
-                    else:
-                        logger.warning(f"Duplicate pool address found: {pool_address}. Using first occurrence.")
-                
-                # Store only unique pools
-                for pool in unique_pools.values():
-                    lp_pool_record = LPPoolData(
-                        timestamp=current_timestamp,
-                        pool_address=pool["pool_address"],
-                        LP_symbol=pool["LP_symbol"],
-                        total_liquidity_usd=pool["total_liquidity_usd"],
-                        day_volume_usd=pool["day_volume_usd"],
-                        day_LP_fees_usd=pool["day_LP_fees_usd"],
-                        yield_pool_fees=pool["yield_pool_fees"],
-                        yield_astro_rewards=pool["yield_astro_rewards"],
-                        yield_external_rewards=pool["yield_external_rewards"],
-                        yield_total=pool["yield_total"]
-                    )
-                    db.add(lp_pool_record)
-                logger.info(f"Successfully stored LP pool data for {len(unique_pools)} unique pools")
-            else:
-                logger.warning("No LP pool data was fetched")
+            result.records, result.values = await fetch(client, timestamp)
+            result.status = 'ok'
+            result.error = None
+            break
+        except Exception as e:
+            result.status = 'failed'
+            result.error = str(e) or type(e).__name__
+            if result.attempts > COLLECT_SOURCE_RETRIES or time.monotonic() + delay > deadline:
+                logger.error(f"Source {name} failed after {result.attempts} attempts: {result.error}")
+                break
+            logger.warning(f"Source {name} failed (attempt {result.attempts}), retrying in {delay:.0f}s: {result.error}")
+            await asyncio.sleep(delay)
+            delay *= 2
+    result.duration = time.monotonic() - start
+    return result
+
+def _store_parents(db, timestamp, commit=True):
+    """Write the empty parent rows of this snapshot so child tables can be stored per source"""
+    db.add_all(model(timestamp=timestamp) for model in PARENT_MODELS if db.get(model, timestamp) is None)
+    if not commit:
+        db.flush()
+        return
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another collector node wrote them first
+        db.rollback()
 
-            # Commit all changes
+def store_result(db, result, idempotent=False, commit=True):
+    """
+    Commit one source's records as its own transaction; parent rows are filled in with merge.
+
+    With idempotent, every record is merged, so rerunning an item whose earlier
+    run already committed some rows (a lease takeover) overwrites them. Without
+    commit, the records go into a savepoint of the caller's transaction, so a
+    failing source is still rolled back on its own.
+    """
+    if result.status != 'ok':
+        return
+    savepoint = None if commit else db.begin_nested()
+    try:
+        for record in result.records:
+            if idempotent or isinstance(record, PARENT_MODELS):
+                db.merge(record)
+            else:
+                db.add(record)
+        if savepoint:
+            savepoint.commit()
+        else:
             db.commit()
-            logger.info("All data successfully collected and stored")
+        logger.info(f"Stored {len(result.records)} records from {result.name}")
+    except Exception as e:
+        (savepoint or db).rollback()
+        result.status = 'failed'
+        result.error = f"store: {str(e)}"
+        logger.error(f"Error storing {result.name}: {str(e)}")
 
-        except Exception as e:
-            db.rollback()
-            logger.error(f"Error collecting data: {str(e)}")
-            raise
+def _derived_records(db, timestamp, values):
+    previous_executes = get_previous_executes(db, timestamp)
+    derived = compute_derived_metrics(
+        values['lent'], values['borrowed'], values['prices'],
+        values['borrow_rates'], values['lending_rates'],
+        values['ntoken_executes'], values['market_executes'], previous_executes
+    )
+    return build_derived_records(timestamp, derived)
+
+def store_derived(db, timestamp, results):
+    """Compute derived metrics if all of their inputs were collected in this cycle"""
+    result = SourceResult('derived')
+    missing = [name for name in DERIVED_INPUTS if results[name].status != 'ok']
+    if missing:
+        result.status = 'skipped'
+        result.error = f"missing inputs: {', '.join(missing)}"
+        logger.warning(f"Skipping derived metrics, {result.error}")
+        return result
+
+    values = {}
+    for name in DERIVED_INPUTS:
+        values.update(results[name].values)
+    result.attempts = 1
+    try:
+        result.records = _derived_records(db, timestamp, values)
+    except Exception as e:
+        result.status = 'failed'
+        result.error = str(e)
+        logger.error(f"Error computing derived metrics: {str(e)}")
+        return result
+    store_result(db, result, commit=False)
+    return result
+
+def _merged_parents(timestamp, results):
+    """One row per parent table combining the columns every successful source filled in"""
+    parents = {model: model(timestamp=timestamp) for model in PARENT_MODELS}
+    for result in results:
+        if result.status != 'ok':
+            continue
+        for record in result.records:
+            if isinstance(record, PARENT_MODELS):
+                for column in record.__table__.columns:
+                    if column.key in record.__dict__:
+                        setattr(parents[type(record)], column.key, record.__dict__[column.key])
+    return list(parents.values())
+
+def _status_records(timestamp, results):
+    return [
+        SourceStatus(
+            timestamp=timestamp,
+            source=result.name,
+            status=result.status,
+            attempts=result.attempts,
+            duration=round(result.duration, 3),
+            error=result.error[:255] if result.error else None
+        )
+        for result in results
+    ]
+
+def _snapshot_marker(timestamp, status='ok'):
+    """Status row that marks a snapshot as complete; readers serve snapshots up to the latest marker"""
+    return SourceStatus(timestamp=timestamp, source=SNAPSHOT_MARKER, status=status, attempts=1, duration=0)
+
+async def collect_and_store_data():
+    """
+    Collect and store all data types.
+
+    Every source is fetched concurrently with its own retries and stored in its
+    own savepoint, so one failing source leaves a partial snapshot whose
+    per-source outcome is recorded in source_status. The whole snapshot and its
+    completion marker are committed together, so readers never see it half
+    written. Returns the status list and raises only if nothing could be collected.
+    """
+    if COLLECTOR_SHARDING:
+        return await collect_sharded()
+
+    # Initialize Injective client pooled over the configured endpoints
+    client = get_client()
+
+    # Discover new markets/collaterals if the token metadata cache has expired
+    await refresh_tokens(client)
 
-        finally:
-            db.close()
+    # Create timestamp for consistency across records
+    current_timestamp = datetime.utcnow()
+    deadline = time.monotonic() + COLLECT_RETRY_WINDOW_SECONDS
 
+    logger.info(f"Fetching {len(SOURCES)} sources...")
+    fetched = await asyncio.gather(*(
+        run_source(name, fetch, client, current_timestamp, deadline)
+        for name, fetch in SOURCES.items()
+    ))
+    results = {result.name: result for result in fetched}
+
+    # Get database session
+    db = next(get_db())
+    # Keep committed records readable for the change feed snapshot built at the end
+    db.expire_on_commit = False
+    try:
+        _store_parents(db, current_timestamp, commit=False)
+
+        stored = []
+        for result in fetched:
+            store_result(db, result, commit=False)
+            if result.status == 'ok':
+                stored.extend(r for r in result.records if not isinstance(r, PARENT_MODELS))
+
+        derived = store_derived(db, current_timestamp, results)
+        if derived.status == 'ok':
+            stored.extend(derived.records)
+
+        statuses = _status_records(current_timestamp, list(fetched) + [derived])
+        db.add_all(statuses)
+        db.add(_snapshot_marker(current_timestamp))
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error storing collected data: {str(e)}")
+        raise
+    finally:
+        db.close()
+
+    failed = [status.source for status in statuses if status.status != 'ok']
+    if failed:
+        logger.warning(f"Stored partial snapshot {current_timestamp}, not collected: {', '.join(failed)}")
+    else:
+        logger.info("All data successfully collected and stored")
+
+    # Push the new snapshot to change feed subscribers
+    parents = _merged_parents(current_timestamp, fetched)
+    snapshot = build_snapshot(parents + stored + statuses)
+    feed.publish(current_timestamp, snapshot)
+
+    # Evaluate alert rules once against the new snapshot instead of polling history
+    await evaluate_snapshot(SessionLocal, current_timestamp, snapshot)
+
+    if all(result.status != 'ok' for result in fetched):
+        raise RuntimeError("Every source failed in this cycle")
+    return [
+        {'source': s.source, 'status': s.status, 'attempts': s.attempts, 'duration': s.duration, 'error': s.error}
+        for s in statuses
+    ]
+
+@dataclass(frozen=True)
+class WorkItem:
+    """
+    One unit of a sharded cycle.
+
+    run(client, timestamp, inputs) returns (records, values) like a source
+    fetcher; inputs holds the values of the items in requires, which must all
+    have succeeded. Items in after only have to be finished.
+    """
+    name: str
+    run: object
+    requires: tuple = ()
+    after: tuple = ()
+
+async def fetch_account_range(lower, upper, client, timestamp, inputs):
+    counts = await get_all_borrow_accounts(client, lower, upper)
+    return [], counts
+
+async def merge_market(client, timestamp, inputs):
+    # Ranges are disjoint, so per-range account and unique address counts add up
+    return [MarketData(
+        timestamp=timestamp,
+        borrow_accounts_count=sum(counts['total_accounts_count'] for counts in inputs.values()),
+        unique_borrow_addresses=sum(counts['unique_addresses_count'] for counts in inputs.values())
+    )], {}
+
+async def derive_metrics(client, timestamp, inputs):
+    values = {}
+    for name in DERIVED_INPUTS:
+        values.update(inputs[name])
+    db = SessionLocal()
+    try:
+        return _derived_records(db, timestamp, values), {}
+    finally:
+        db.close()
+
+def _source_item(fetch):
+    async def run(client, timestamp, inputs):
+        return await fetch(client, timestamp)
+    return run
+
+async def publish_snapshot(client, timestamp, inputs):
+    db = SessionLocal()
+    try:
+        snapshot = load_snapshot(db, timestamp)
+        # Mark the snapshot complete before announcing it; run_item then records this step's outcome on the same row
+        db.merge(_snapshot_marker(timestamp))
+        db.commit()
+        prune_leases(db, timestamp - timedelta(days=1))
+    finally:
+        db.close()
+    feed.publish(timestamp, snapshot)
+    await evaluate_snapshot(SessionLocal, timestamp, snapshot)
+    return [], {}
+
+def build_work_items(ranges=None):
+    """Work items of a sharded cycle: sources, account scan ranges, and the steps merging them"""
+    ranges = ranges or account_ranges()
+    account_items = [
+        WorkItem(f"accounts_{index}", partial(fetch_account_range, lower, upper))
+        for index, (lower, upper) in enumerate(ranges)
+    ]
+    items = account_items + [
+        WorkItem(name, _source_item(fetch)) for name, fetch in SOURCES.items() if name != 'market'
+    ]
+    items.append(WorkItem('market', merge_market, requires=tuple(item.name for item in account_items)))
+    items.append(WorkItem('derived', derive_metrics, requires=DERIVED_INPUTS))
+    # Named after the marker: its status row, written once every other item finished, completes the snapshot
+    items.append(WorkItem(SNAPSHOT_MARKER, publish_snapshot, after=tuple(item.name for item in items)))
+    return items
+
+async def run_item(db, item, client, timestamp, states, deadline):
+    """
+    Run one claimed item and record its outcome in the lease table.
+
+    Rows are merged, since a node that took over an expired lease may find
+    some of them already written. The lease is always completed, as failed if
+    anything raised, so the item never stays running.
+    """
+    result = SourceResult(item.name, status='failed')
+    try:
+        failed = [name for name in item.requires if states[name][0] != 'ok']
+        if failed:
+            result = SourceResult(item.name, status='skipped', error=f"missing inputs: {', '.join(failed)}")
+            logger.warning(f"Skipping {item.name}, {result.error}")
+        else:
+            inputs = {name: states[name][1] for name in item.requires}
+            result = await run_source(item.name, partial(item.run, inputs=inputs), client, timestamp, deadline)
+            store_result(db, result, idempotent=True)
+        for status in _status_records(timestamp, [result]):
+            db.merge(status)
+        db.commit()
     except Exception as e:
-        logger.error(f"Error in collect_and_store_data: {str(e)}")
+        db.rollback()
+        result.status = 'failed'
+        result.error = str(e) or type(e).__name__
+        logger.error(f"Error running {item.name}: {result.error}")
+    finally:
+        complete(db, timestamp, item.name, result.status, result.values if result.status == 'ok' else None)
+    return result
+
+async def _run_claimed(item, client, timestamp, states, deadline):
+    """Run a claimed item in its own session, so several can run concurrently"""
+    db = SessionLocal()
+    try:
+        return await run_item(db, item, client, timestamp, states, deadline)
+    finally:
+        db.close()
+
+async def collect_sharded():
+    """
+    Collect this node's share of the current cycle.
+
+    Every node running the same schedule derives the same slot timestamp and
+    claims work items from the lease table until all of them are finished,
+    so sources and account scan ranges are spread over the nodes and their
+    records land in one snapshot. Up to COLLECT_ITEM_CONCURRENCY claimed items
+    run concurrently. Items whose dependencies are held by other nodes are
+    polled for; an item whose node died is taken over once its lease expires.
+    Returns the status of the items this node ran.
+    """
+    client = get_client()
+    await refresh_tokens(client)
+
+    timestamp = cycle_timestamp()
+    deadline = time.monotonic() + COLLECT_RETRY_WINDOW_SECONDS
+    items = build_work_items()
+    ran = []
+
+    running = {}
+    db = next(get_db())
+    try:
+        _store_parents(db, timestamp)
+        logger.info(f"Node {COLLECTOR_NODE_ID} collecting snapshot {timestamp} ({len(items)} work items)")
+        while True:
+            states = lease_states(db, timestamp)
+            pending = [item for item in items if states.get(item.name, (None,))[0] not in TERMINAL_STATUSES]
+            if not pending and not running:
+                break
+            for item in pending:
+                if len(running) >= COLLECT_ITEM_CONCURRENCY:
+                    break
+                if item.name in running:
+                    continue
+                dependencies = item.requires + item.after
+                if any(states.get(name, (None,))[0] not in TERMINAL_STATUSES for name in dependencies):
+                    continue
+                if claim(db, timestamp, item.name):
+                    running[item.name] = asyncio.create_task(
+                        _run_claimed(item, client, timestamp, states, deadline)
+                    )
+            if not running:
+                await asyncio.sleep(COLLECT_LEASE_POLL_SECONDS)
+                continue
+            # Wake up when an item finishes, or after a poll interval to pick up other nodes' progress
+            done, _ = await asyncio.wait(
+                running.values(), timeout=COLLECT_LEASE_POLL_SECONDS, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                result = task.result()
+                del running[result.name]
+                ran.append(result)
+    except BaseException as e:
+        for task in running.values():
+            task.cancel()
+        await asyncio.gather(*running.values(), return_exceptions=True)
+        db.rollback()
+        logger.error(f"Error in sharded collection: {str(e) or type(e).__name__}")
         raise
+    finally:
+        db.close()
+
+    logger.info(f"Node {COLLECTOR_NODE_ID} ran {len(ran)} of {len(items)} work items of snapshot {timestamp}")
+    return [
+        {'source': r.name, 'status': r.status, 'attempts': r.attempts, 'duration': round(r.duration, 3), 'error': r.error}
+        for r in ran
+    ]
 
 if __name__ == "__main__":
-    asyncio.run(collect_and_store_data()) 
\ No newline at end of file
+    asyncio.run(collect_and_store_data())
@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+import schedule
+from sqlalchemy import func
+from database import ReadSessionLocal, is_sqlite, sqlite_maintenance
+from models import MarketData
+from retention import run_retention
+import profiling
+from leases import COLLECTOR_SHARDING, COLLECT_SLOT_JITTER_SECONDS, seconds_until_next_slot
+from log_setup import configure_logging
+
+# Get the logger
+logger = logging.getLogger('neptune-data.collector')
+
+# Get schedule interval from environment variable, default to 30 minutes
+SCHEDULE_INTERVAL = int(os.getenv('SCHEDULE_INTERVAL_MINUTES', '30'))
+
+# Retention/compaction of old raw snapshots, opt-in
+RETENTION_ENABLED = os.getenv('RETENTION_ENABLED', 'false').lower() == 'true'
+RETENTION_INTERVAL_HOURS = int(os.getenv('RETENTION_INTERVAL_HOURS', '24'))
+
+# WAL checkpoint and ANALYZE interval when running on SQLite
+SQLITE_MAINTENANCE_MINUTES = int(os.getenv('SQLITE_MAINTENANCE_MINUTES', '60'))
+
+# Streamed per-minute contract execute activity, opt-in
+EXECUTE_STREAM_ENABLED = os.getenv('EXECUTE_STREAM_ENABLED', 'false').lower() == 'true'
+
+# Global variables for health check
+collection_thread = None
+execute_stream_thread = None
+# Per-source outcome of the most recent collection cycle
+last_source_status = []
+
+async def run_collection():
+    # Deferred so processes that never collect don't import the chain client
+    from collect_data import collect_and_store_data
+    logger.info(f"Starting data collection at {datetime.utcnow()}")
+    global last_source_status
+    last_source_status = await collect_and_store_data()
+
+def job():
+    try:
+        with profiling.profile_cycle():
+            asyncio.run(run_collection())
+    except Exception as e:
+        # Keep the scheduler alive; the next run will try again
+        logger.error(f"Data collection failed: {str(e)}")
+
+def _run_once():
+    job()
+    return schedule.CancelJob
+
+def _slot_delay(seconds):
+    return seconds + random.uniform(0, COLLECT_SLOT_JITTER_SECONDS)
+
+def _run_slot():
+    """Run this node's share of the current slot, then wait for the next slot boundary"""
+    job()
+    delay = _slot_delay(seconds_until_next_slot())
+    schedule.every(delay).seconds.do(_run_slot)
+    logger.info(f"Next sharded collection in {delay/60:.1f} minutes")
+    return schedule.CancelJob
+
+def _initial_delay():
+    """Seconds until the next collection is due, based on the last stored snapshot"""
+    db = ReadSessionLocal()
+    try:
+        last_run = db.query(func.max(MarketData.timestamp)).scalar()
+    finally:
+        db.close()
+
+    if not last_run:
+        logger.info("No previous data found, running immediately")
+        return 0
+    next_run = last_run + timedelta(minutes=SCHEDULE_INTERVAL)
+    now = datetime.utcnow()
+    if next_run <= now:
+        logger.info("Last data collection is older than schedule interval, running immediately")
+        return 0
+    delay = (next_run - now).total_seconds()
+    logger.info(f"Last data collection was at {last_run}, scheduling next run in {delay/60:.1f} minutes")
+    return delay
+
+def schedule_jobs():
+    """Register the recurring jobs; the catch-up run and sharded slots are handled by run_scheduler"""
+    if not COLLECTOR_SHARDING:
+        schedule.every(SCHEDULE_INTERVAL).minutes.do(job)
+        logger.info(f"Scheduled data collection to run every {SCHEDULE_INTERVAL} minutes")
+
+    if RETENTION_ENABLED:
+        schedule.every(RETENTION_INTERVAL_HOURS).hours.do(run_retention)
+        logger.info(f"Scheduled retention to run every {RETENTION_INTERVAL_HOURS} hours")
+
+    if is_sqlite():
+        schedule.every(SQLITE_MAINTENANCE_MINUTES).minutes.do(sqlite_maintenance)
+        logger.info(f"Scheduled SQLite checkpoint/ANALYZE every {SQLITE_MAINTENANCE_MINUTES} minutes")
+
+def run_scheduler():
+    """
+    Catch up if a collection is due, then run the scheduler loop.
+
+    Sharded nodes instead run on the slot boundaries the snapshot timestamp is
+    floored to, joining the current slot right away, so every node works the
+    same slot rather than whichever one its own start time falls into.
+    """
+    logger.info("Starting scheduler thread")
+    if COLLECTOR_SHARDING:
+        schedule_jobs()
+        schedule.every(_slot_delay(0)).seconds.do(_run_slot)
+    else:
+        try:
+            delay = _initial_delay()
+        except Exception as e:
+            logger.error(f"Could not read last collection time: {str(e)}")
+            delay = 0
+        schedule_jobs()
+        if delay:
+            schedule.every(delay).seconds.do(_run_once)
+        else:
+            job()
+
+    while True:
+        schedule.run_pending()
+        time.sleep(1)
+
+def start_execute_stream():
+    global execute_stream_thread
+    from event_stream import run_execute_ingester_thread
+    execute_stream_thread = threading.Thread(target=run_execute_ingester_thread)
+    execute_stream_thread.daemon = True
+    execute_stream_thread.start()
+    logger.info("Started contract execute stream ingester")
+
+def start_background_tasks():
+    """Start collection in background threads without blocking the caller"""
+    global collection_thread
+    logger.info("Starting background tasks thread for data collection")
+
+    # The catch-up check and any immediate collection run inside the thread
+    collection_thread = threading.Thread(target=run_scheduler)
+    collection_thread.daemon = True
+    collection_thread.start()
+
+    if EXECUTE_STREAM_ENABLED:
+        start_execute_stream()
+
+    logger.info("Background tasks started successfully")
+
+def is_running():
+    return {
+        'collection_thread_running': bool(collection_thread and collection_thread.is_alive()),
+        'execute_stream_running': bool(execute_stream_thread and execute_stream_thread.is_alive()),
+        'last_source_status': last_source_status,
+    }
+
+if __name__ == "__main__":
+    # Standalone collector process for deployments that run web workers with RUN_COLLECTOR=false
+    configure_logging()
+    if EXECUTE_STREAM_ENABLED:
+        start_execute_stream()
+    run_scheduler()
@@ -0,0 +1,18 @@
+import os
+
+# Neptune contracts by role; each can be overridden with CONTRACT_<ROLE>, e.g. CONTRACT_MARKET
+_DEFAULT_CONTRACTS = {
+    'market': "inj1nc7gjkf2mhp34a6gquhurg8qahnw5kxs5u3s4u",
+    'interest_model': "inj1ftech0pdjrjawltgejlmpx57cyhsz6frdx2dhq",
+    'oracle': "inj1u6cclz0qh5tep9m2qayry9k97dm46pnlqf8nre",
+    'staking': "inj1v3a4zznudwpukpr8y987pu5gnh4xuf7v36jhva",
+}
+
+CONTRACTS = {
+    role: os.getenv(f'CONTRACT_{role.upper()}', address)
+    for role, address in _DEFAULT_CONTRACTS.items()
+}
+
+def contract_address(role):
+    """Address of the contract playing a role; raises KeyError for unknown roles"""
+    return CONTRACTS[role]
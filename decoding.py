@@ -0,0 +1,104 @@
+import base64
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import orjson
+
+    def loads(data):
+        return orjson.loads(data)
+except ImportError:  # Fall back to the standard library parser
+    def loads(data):
+        return json.loads(data)
+
+def decode_contract_state(contract_state):
+    """Decode the base64 `data` of a smart-query response straight from bytes"""
+    return loads(base64.b64decode(contract_state["data"]))
+
+async def query_contract(client, address, query):
+    """Run a smart query with a dict query and return the decoded response"""
+    query_data = query if isinstance(query, str) else json.dumps(query, separators=(',', ':'))
+    contract_state = await client.fetch_smart_contract_state(address=address, query_data=query_data)
+    return decode_contract_state(contract_state)
+
+def asset_denom(asset):
+    """Denom of a native asset or contract address of a CW20 asset"""
+    if "native_token" in asset:
+        return asset["native_token"]["denom"]
+    return asset["token"]["contract_addr"]
+
+@dataclass(frozen=True)
+class RateEntry:
+    denom: str
+    rate: float
+
+    @classmethod
+    def parse_all(cls, data: List[Any]) -> List["RateEntry"]:
+        return [cls(asset_denom(entry[0]), float(entry[1])) for entry in data]
+
+@dataclass(frozen=True)
+class MarketEntry:
+    denom: str
+    lending_principal: int
+    debt_balance: int
+
+    @classmethod
+    def parse_all(cls, data: List[Any]) -> List["MarketEntry"]:
+        return [
+            cls(asset_denom(entry[0]), int(entry[1]["lending_principal"]), int(entry[1]["debt_pool"]["balance"]))
+            for entry in data
+        ]
+
+@dataclass(frozen=True)
+class CollateralEntry:
+    denom: str
+    balance: int
+
+    @classmethod
+    def parse_all(cls, data: List[Any]) -> List["CollateralEntry"]:
+        return [cls(asset_denom(entry[0]), int(entry[1]["collateral_pool"]["balance"])) for entry in data]
+
+@dataclass(frozen=True)
+class AccountsPage:
+    """One page of get_all_accounts, reduced to the (address, index) keys we use"""
+    keys: List[Tuple[str, Any]]
+
+    @classmethod
+    def parse(cls, data: List[Any]) -> "AccountsPage":
+        return cls([(entry[0][0], entry[0][1]) for entry in data])
+
+@dataclass(frozen=True)
+class StakingParams:
+    emission_rate: float  # NEPT per year
+    reward_weights: Dict[int, float]  # bond duration (ns) -> reward weight
+
+    @classmethod
+    def parse(cls, data: Dict[str, Any]) -> "StakingParams":
+        return cls(
+            float(data["emission_rate"]) / 10**6,
+            {int(duration): float(settings["reward_weight"]) for duration, settings in data["bond_duration_settings"]}
+        )
+
+@dataclass(frozen=True)
+class StakingState:
+    bonded: Dict[int, float]  # bond duration (ns) -> NEPT bonded
+
+    @classmethod
+    def parse(cls, data: Dict[str, Any]) -> "StakingState":
+        return cls({int(duration): float(amount) / 10**6 for duration, amount in data["bonded"]})
+
+@dataclass(frozen=True)
+class PriceResponse:
+    price: float
+
+    @classmethod
+    def parse(cls, data: Dict[str, Any]) -> "PriceResponse":
+        return cls(float(data["price"]))
+
+def parse_number(text: str) -> Optional[float]:
+    """Parse a plain-text numeric API response, None if it is not a number"""
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return None
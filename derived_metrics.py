@@ -0,0 +1,110 @@
+import logging
+from sqlalchemy import func
+from models import NTokenContractExecutes, MarketContractExecutes, DerivedMetrics
+
+# Get the logger
+logger = logging.getLogger('neptune-data.collector')
+
+# Key used for the market contract execute delta row, matches MarketContractExecutes.contract_type
+MARKET_SYMBOL = "market"
+
+def _to_float(value):
+    """Convert a stored/fetched value to float, returning None if it is missing or invalid"""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def parse_counter(value):
+    """Convert a counter (the chain returns them as strings) to int, returning None if it is missing or invalid"""
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def _underlying_symbol(ticker, market_symbols):
+    """Map an nToken ticker (e.g. nINJ) to its market symbol (INJ) if that market exists"""
+    if ticker.startswith('n') and ticker[1:] in market_symbols:
+        return ticker[1:]
+    return ticker
+
+def get_previous_executes(db, before_timestamp):
+    """Get the latest nToken and market execute counters stored before the given timestamp"""
+    previous = {}
+
+    ntoken_ts = db.query(func.max(NTokenContractExecutes.timestamp)).filter(
+        NTokenContractExecutes.timestamp < before_timestamp
+    ).scalar()
+    if ntoken_ts:
+        for row in db.query(NTokenContractExecutes).filter(NTokenContractExecutes.timestamp == ntoken_ts):
+            previous[row.token_symbol] = row.execute_count
+
+    market_ts = db.query(func.max(MarketContractExecutes.timestamp)).filter(
+        MarketContractExecutes.timestamp < before_timestamp
+    ).scalar()
+    if market_ts:
+        for row in db.query(MarketContractExecutes).filter(MarketContractExecutes.timestamp == market_ts):
+            if row.contract_type == MARKET_SYMBOL:
+                previous[MARKET_SYMBOL] = row.execute_count
+
+    return previous
+
+def compute_derived_metrics(lent_amounts, borrowed_amounts, token_prices, borrow_rates, lending_rates,
+                            ntoken_executes, market_executes, previous_executes):
+    """
+    Compute per-symbol derived metrics for one snapshot.
+
+    Inputs are the dicts already fetched by the collector, keyed by token symbol.
+    The symbol set is aligned once into column lists and every metric is computed
+    in a single pass over those columns. Returns a dict of symbol -> metric dict.
+    """
+    symbols = sorted(set(lent_amounts) | set(borrowed_amounts) | set(borrow_rates) | set(lending_rates))
+    market_symbols = set(symbols)
+
+    lent = [_to_float(lent_amounts.get(s)) for s in symbols]
+    borrowed = [_to_float(borrowed_amounts.get(s)) for s in symbols]
+    prices = [_to_float(token_prices.get(s)) for s in symbols]
+    borrow = [_to_float(borrow_rates.get(s)) for s in symbols]
+    lend = [_to_float(lending_rates.get(s)) for s in symbols]
+
+    metrics = {}
+    for s, l, b, p, br, lr in zip(symbols, lent, borrowed, prices, borrow, lend):
+        metrics[s] = {
+            "utilization": round(b / l * 100, 4) if l and b is not None else None,
+            "lent_usd": l * p if l is not None and p is not None else None,
+            "borrowed_usd": b * p if b is not None and p is not None else None,
+            "rate_spread": round(br - lr, 4) if br is not None and lr is not None else None,
+            "execute_delta": None,
+        }
+
+    # Per-interval execute deltas from the cumulative counters
+    counters = dict(ntoken_executes or {})
+    if market_executes is not None:
+        counters[MARKET_SYMBOL] = market_executes
+    for ticker, count in counters.items():
+        count = parse_counter(count)
+        previous = parse_counter(previous_executes.get(ticker))
+        if count is None or previous is None:
+            continue
+        symbol = _underlying_symbol(ticker, market_symbols)
+        entry = metrics.setdefault(symbol, {
+            "utilization": None,
+            "lent_usd": None,
+            "borrowed_usd": None,
+            "rate_spread": None,
+            "execute_delta": None,
+        })
+        entry["execute_delta"] = count - previous
+
+    return metrics
+
+def build_derived_records(timestamp, metrics):
+    """Build DerivedMetrics records for a snapshot from computed metrics"""
+    return [
+        DerivedMetrics(timestamp=timestamp, token_symbol=symbol, **values)
+        for symbol, values in metrics.items()
+    ]
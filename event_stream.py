@@ -0,0 +1,271 @@
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+import aiohttp
+from pyinjective.core.network import Network
+from database import SessionLocal
+from models import ContractExecuteBuckets
+from queries import _load_tokens
+from contracts import contract_address
+
+# Get the logger
+logger = logging.getLogger('neptune-data.collector')
+
+MARKET_CONTRACT_ADDRESS = contract_address("market")
+
+# Width of the execute activity buckets
+EXECUTE_BUCKET_SECONDS = int(os.getenv('EXECUTE_BUCKET_SECONDS', '60'))
+# How often closed buckets are written to the database
+EXECUTE_FLUSH_SECONDS = int(os.getenv('EXECUTE_FLUSH_SECONDS', '60'))
+# Tendermint websocket endpoint, defaults to the mainnet one
+EXECUTE_STREAM_URL = os.getenv('EXECUTE_STREAM_URL', '')
+EXECUTE_STREAM_MAX_BACKOFF_SECONDS = 60
+# Subscriptions opened per websocket connection; CometBFT rejects more than its
+# max_subscriptions_per_client (5 by default), so the queries are spread over connections
+EXECUTE_STREAM_SUBSCRIPTIONS_PER_CONNECTION = int(os.getenv('EXECUTE_STREAM_SUBSCRIPTIONS_PER_CONNECTION', '5'))
+# Block headers remembered to timestamp the Tx events that follow them
+BLOCK_TIME_CACHE_SIZE = 100
+BLOCK_HEADER_QUERY = "tm.event='NewBlockHeader'"
+
+EPOCH = datetime(1970, 1, 1)
+
+def get_execute_contracts():
+    """Map each watched contract address to its label: 'market' or the nToken ticker"""
+    contracts = {MARKET_CONTRACT_ADDRESS: "market"}
+    for token in _load_tokens():
+        if token['token_type'] == "token":
+            contracts[token['denom']] = token['ticker']
+    return contracts
+
+def parse_block_time(value):
+    """Parse an RFC 3339 block time with nanoseconds (2024-01-01T00:00:00.123456789Z) to naive UTC"""
+    value = value.rstrip('Z')
+    if '.' in value:
+        seconds, fraction = value.split('.', 1)
+        value = f"{seconds}.{fraction[:6]}"
+    return datetime.fromisoformat(value)
+
+class TendermintEventStream:
+    """
+    Yields (block time, contract_address) for every execute on the watched contracts.
+
+    Subscribes to Tx events over the Tendermint websocket with one query per
+    contract, plus block headers to timestamp them. The query language has no
+    OR, so the subscriptions are spread over as many connections as the node's
+    per-client limit requires. Each connection reconnects with backoff when it drops.
+    """
+
+    def __init__(self, contract_addresses, url=None, per_connection=EXECUTE_STREAM_SUBSCRIPTIONS_PER_CONNECTION):
+        self.contract_addresses = list(contract_addresses)
+        self.url = url or EXECUTE_STREAM_URL or Network.mainnet().tm_websocket_endpoint
+        self.per_connection = max(1, per_connection)
+        self._queries = {
+            f"tm.event='Tx' AND execute._contract_address='{address}'": address
+            for address in self.contract_addresses
+        }
+        self._block_times = {}
+
+    def connection_groups(self):
+        """The subscription queries of each connection, at most per_connection each"""
+        queries = [BLOCK_HEADER_QUERY] + list(self._queries)
+        return [queries[i:i + self.per_connection] for i in range(0, len(queries), self.per_connection)]
+
+    async def _subscribe(self, ws, queries):
+        """Send the subscribe requests; returns {request id: query} awaiting a reply"""
+        for i, query in enumerate(queries):
+            await ws.send_json({
+                "jsonrpc": "2.0",
+                "method": "subscribe",
+                "id": i,
+                "params": {"query": query}
+            })
+        return dict(enumerate(queries))
+
+    def _check_reply(self, message, pending):
+        """Handle the reply to a subscribe request, logging rejections; False for any other message"""
+        request_id = message.get("id")
+        if request_id not in pending:
+            return False
+        if "error" in message:
+            query = pending.pop(request_id)
+            error = message["error"]
+            detail = f"{error.get('message', '')} {error.get('data', '')}".strip() if isinstance(error, dict) else str(error)
+            if "max_subscriptions" in detail:
+                logger.error(
+                    f"Node subscription limit reached, no executes for {self._queries.get(query, query)}: {detail}. "
+                    f"Lower EXECUTE_STREAM_SUBSCRIPTIONS_PER_CONNECTION (now {self.per_connection})"
+                )
+            else:
+                logger.error(f"Subscription rejected for {self._queries.get(query, query)}: {detail}")
+            return True
+        if message.get("result") == {}:
+            pending.pop(request_id)
+            return True
+        return False
+
+    def _remember_block(self, header):
+        try:
+            self._block_times[str(header["height"])] = parse_block_time(header["time"])
+        except (KeyError, TypeError, ValueError):
+            return
+        while len(self._block_times) > BLOCK_TIME_CACHE_SIZE:
+            del self._block_times[next(iter(self._block_times))]
+
+    def _parse(self, message):
+        """
+        Events of one subscription message. A tx touching several watched
+        contracts arrives once per matching subscription, so each message only
+        counts the executes of its own subscription's contract.
+        """
+        result = message.get("result") or {}
+        query = result.get("query")
+        if query == BLOCK_HEADER_QUERY:
+            self._remember_block(((result.get("data") or {}).get("value") or {}).get("header") or {})
+            return []
+        address = self._queries.get(query)
+        if address is None:
+            return []
+        events = result.get("events") or {}
+        heights = events.get("tx.height") or []
+        # Headers are published before the block's Tx events; fall back to receive time if one was missed
+        timestamp = (self._block_times.get(heights[0]) if heights else None) or datetime.utcnow()
+        count = events.get("execute._contract_address", []).count(address)
+        return [(timestamp, address)] * count
+
+    async def _run_connection(self, number, queries, queue):
+        """Keep one connection subscribed to its queries, putting its events on the shared queue"""
+        backoff = 1
+        while True:
+            try:
+                async with aiohttp.ClientSession() as session:
+                    async with session.ws_connect(self.url, heartbeat=30) as ws:
+                        pending = await self._subscribe(ws, queries)
+                        backoff = 1
+                        async for msg in ws:
+                            if msg.type != aiohttp.WSMsgType.TEXT:
+                                break
+                            message = json.loads(msg.data)
+                            if pending and self._check_reply(message, pending):
+                                if not pending:
+                                    logger.info(f"Execute stream connection {number}: all {len(queries)} subscribe requests answered")
+                                continue
+                            for event in self._parse(message):
+                                queue.put_nowait(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Execute event stream error on connection {number}: {str(e)}")
+            logger.info(f"Reconnecting execute event stream connection {number} in {backoff}s")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, EXECUTE_STREAM_MAX_BACKOFF_SECONDS)
+
+    async def __aiter__(self):
+        queue = asyncio.Queue()
+        groups = self.connection_groups()
+        tasks = [
+            asyncio.create_task(self._run_connection(number, queries, queue))
+            for number, queries in enumerate(groups)
+        ]
+        logger.info(f"Watching executes of {len(self.contract_addresses)} contracts over {len(groups)} connections")
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+class LocalEventStream:
+    """Stand-in stream for tests and local runs: yields the given (timestamp, address) events"""
+
+    def __init__(self, events):
+        self.events = list(events)
+
+    async def __aiter__(self):
+        for event in self.events:
+            yield event
+
+class ExecuteAggregator:
+    """Counts executes per (bucket start, contract address)"""
+
+    def __init__(self, bucket_seconds=EXECUTE_BUCKET_SECONDS):
+        self.bucket_seconds = bucket_seconds
+        self.counts = {}
+
+    def bucket_start(self, timestamp):
+        epoch = int((timestamp - EPOCH).total_seconds())
+        return EPOCH + timedelta(seconds=epoch - epoch % self.bucket_seconds)
+
+    def add(self, timestamp, address):
+        key = (self.bucket_start(timestamp), address)
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+    def drain(self, before=None):
+        """Remove and return counts for buckets starting before the given time (all if None)"""
+        drained = {}
+        for key in list(self.counts):
+            if before is None or key[0] < before:
+                drained[key] = self.counts.pop(key)
+        return drained
+
+def store_buckets(counts, labels):
+    """Add bucket counts to the database, merging with rows already written for the same bucket"""
+    if not counts:
+        return
+    db = SessionLocal()
+    try:
+        for (bucket, address), count in counts.items():
+            label = labels.get(address, address)
+            row = db.get(ContractExecuteBuckets, (bucket, label))
+            if row:
+                row.execute_count += count
+            else:
+                db.add(ContractExecuteBuckets(
+                    timestamp=bucket,
+                    contract_label=label,
+                    contract_address=address,
+                    execute_count=count
+                ))
+        db.commit()
+        logger.info(f"Stored {len(counts)} execute buckets")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error storing execute buckets: {str(e)}")
+        raise
+    finally:
+        db.close()
+
+async def run_execute_ingester(stream=None, contracts=None, flush_seconds=EXECUTE_FLUSH_SECONDS):
+    """Consume an execute event stream and write closed buckets periodically"""
+    contracts = contracts or get_execute_contracts()
+    stream = stream or TendermintEventStream(contracts.keys())
+    aggregator = ExecuteAggregator()
+
+    async def flush_periodically():
+        while True:
+            await asyncio.sleep(flush_seconds)
+            closed = aggregator.drain(before=aggregator.bucket_start(datetime.utcnow()))
+            try:
+                await asyncio.to_thread(store_buckets, closed, contracts)
+            except Exception:
+                # Keep the counts for the next flush
+                for key, count in closed.items():
+                    aggregator.counts[key] = aggregator.counts.get(key, 0) + count
+
+    flusher = asyncio.create_task(flush_periodically())
+    try:
+        async for timestamp, address in stream:
+            aggregator.add(timestamp, address)
+    finally:
+        flusher.cancel()
+        # Write what we have, including the open bucket, when the stream ends
+        await asyncio.to_thread(store_buckets, aggregator.drain(), contracts)
+
+def run_execute_ingester_thread():
+    """Entry point for a background thread running the ingester in its own event loop"""
+    asyncio.run(run_execute_ingester())
+
+if __name__ == "__main__":
+    run_execute_ingester_thread()
@@ -0,0 +1,253 @@
+import io
+import logging
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import Integer, Numeric
+from models import SERIES_TABLES
+from batch_query import BatchQueryError, parse_range, parse_resolution
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:  # Arrow output is optional, columnar JSON is always available
+    pyarrow = None
+
+# Get the logger
+logger = logging.getLogger('neptune-data.web')
+
+FRAME_MAX_SERIES = int(os.getenv('FRAME_MAX_SERIES', '50'))
+# Upper bound on rows in one aligned frame
+FRAME_MAX_POINTS = int(os.getenv('FRAME_MAX_POINTS', '20000'))
+
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+
+# Snapshot timestamps are naive UTC; grid arithmetic is done in seconds from this epoch
+EPOCH = datetime(1970, 1, 1)
+
+AGGREGATES = ('asof', 'last', 'first', 'mean', 'min', 'max', 'sum', 'count')
+FILLS = ('null', 'ffill', 'zero')
+
+class FrameQueryError(BatchQueryError):
+    """Raised for an invalid frame request; the message is returned to the client"""
+
+def _epoch(dt):
+    return (dt - EPOCH).total_seconds()
+
+def parse_series(raw):
+    """Validate one series spec: table, value column, optional symbol, aggregate, fill and output name"""
+    if not isinstance(raw, dict):
+        raise FrameQueryError("Each series must be an object")
+    table = raw.get('table')
+    if table not in SERIES_TABLES:
+        raise FrameQueryError(f"Invalid table: {table}")
+    model, key_column = SERIES_TABLES[table]
+
+    column = raw.get('column')
+    # Only numeric columns can be aggregated and sent as float64
+    value_columns = {
+        c.key for c in model.__table__.columns if isinstance(c.type, (Integer, Numeric))
+    } - {'timestamp', key_column}
+    if column not in value_columns:
+        raise FrameQueryError(f"Invalid column for {table}: {column}")
+
+    symbol = raw.get('symbol')
+    if (symbol is None) != (key_column is None):
+        raise FrameQueryError(f"symbol is {'required' if key_column else 'not allowed'} for {table}")
+
+    agg = raw.get('agg', 'asof')
+    if agg not in AGGREGATES:
+        raise FrameQueryError(f"Invalid agg: {agg}, expected one of {', '.join(AGGREGATES)}")
+    fill = raw.get('fill', 'null')
+    if fill not in FILLS:
+        raise FrameQueryError(f"Invalid fill: {fill}, expected one of {', '.join(FILLS)}")
+
+    name = raw.get('name') or ".".join(str(part) for part in (table, symbol, column) if part is not None)
+    return {
+        'table': table,
+        'column': column,
+        'symbol': None if symbol is None else str(symbol),
+        'agg': agg,
+        'fill': fill,
+        'name': str(name),
+    }
+
+def parse_frame(body, now):
+    """Validate a frame request and normalize its time grid and series"""
+    if not isinstance(body, dict):
+        raise FrameQueryError("Request body must be an object")
+    raw_series = body.get('series')
+    if not isinstance(raw_series, list) or not raw_series:
+        raise FrameQueryError("series must be a non-empty list")
+    if len(raw_series) > FRAME_MAX_SERIES:
+        raise FrameQueryError(f"At most {FRAME_MAX_SERIES} series per frame")
+
+    step = parse_resolution(body.get('step', '1h'))
+    if step is None:
+        raise FrameQueryError("step must be a resolution like 15m, 1h or 1d")
+    # As-of values older than this are treated as missing; defaults to one step
+    tolerance = parse_resolution(body['tolerance']) if body.get('tolerance') else step
+    if tolerance is None:
+        raise FrameQueryError("tolerance must be a duration like 15m, 1h or 1d")
+
+    start, end = parse_range(body, now)
+
+    # Align the grid to whole steps so repeated queries share bucket edges
+    step_seconds = step.total_seconds()
+    origin = EPOCH + timedelta(seconds=_epoch(start) // step_seconds * step_seconds)
+    points = int((end - origin) / step) + 1
+    if points > FRAME_MAX_POINTS:
+        raise FrameQueryError(f"Frame would have {points} rows, at most {FRAME_MAX_POINTS}; use a larger step")
+
+    series = [parse_series(raw) for raw in raw_series]
+    names = [s['name'] for s in series]
+    if len(set(names)) != len(names) or 'timestamp' in names:
+        raise FrameQueryError("Series names must be unique and not 'timestamp'")
+
+    return {
+        'origin': origin,
+        'step': step,
+        'tolerance': tolerance,
+        'points': points,
+        'series': series,
+    }
+
+def _fetch_observations(db, table, series, start, end):
+    """
+    Load the observations of every series on one table with a single query.
+
+    Only the timestamp, key and requested value columns are selected. Returns
+    {(symbol, column): (timestamps, values)} with timestamps in epoch seconds.
+    """
+    model, key_column = SERIES_TABLES[table]
+    columns = sorted({s['column'] for s in series})
+    selected = [model.timestamp] + ([getattr(model, key_column)] if key_column else []) + \
+        [getattr(model, column) for column in columns]
+    query = db.query(*selected).filter(model.timestamp >= start, model.timestamp <= end)
+    if key_column:
+        query = query.filter(getattr(model, key_column).in_({s['symbol'] for s in series}))
+
+    observations = {(s['symbol'], s['column']): ([], []) for s in series}
+    offset = 2 if key_column else 1
+    for row in query.order_by(model.timestamp):
+        symbol = str(row[1]) if key_column else None
+        epoch = _epoch(row[0])
+        for i, column in enumerate(columns):
+            target = observations.get((symbol, column))
+            value = row[offset + i]
+            if target is not None and value is not None:
+                target[0].append(epoch)
+                target[1].append(float(value))
+    return observations
+
+def asof_align(grid, timestamps, values, tolerance):
+    """For each grid point, the latest observation at or before it that is within tolerance"""
+    result = []
+    j = 0
+    count = len(timestamps)
+    for point in grid:
+        # Both sides are sorted, so one forward pass is enough
+        while j < count and timestamps[j] <= point:
+            j += 1
+        if j and point - timestamps[j - 1] <= tolerance:
+            result.append(values[j - 1])
+        else:
+            result.append(None)
+    return result
+
+def bucket_aggregate(grid, step, timestamps, values, agg):
+    """Aggregate observations into [point, point + step) buckets"""
+    buckets = [[] for _ in grid]
+    if grid:
+        origin = grid[0]
+        for ts, value in zip(timestamps, values):
+            index = int((ts - origin) // step)
+            if 0 <= index < len(buckets):
+                buckets[index].append(value)
+
+    result = []
+    for bucket in buckets:
+        if agg == 'count':
+            result.append(len(bucket))
+        elif not bucket:
+            result.append(None)
+        elif agg == 'last':
+            result.append(bucket[-1])
+        elif agg == 'first':
+            result.append(bucket[0])
+        elif agg == 'mean':
+            result.append(sum(bucket) / len(bucket))
+        elif agg == 'min':
+            result.append(min(bucket))
+        elif agg == 'max':
+            result.append(max(bucket))
+        else:
+            result.append(sum(bucket))
+    return result
+
+def fill_missing(values, fill):
+    """Apply the fill rule to points with no value"""
+    if fill == 'zero':
+        return [0.0 if value is None else value for value in values]
+    if fill == 'ffill':
+        filled = []
+        previous = None
+        for value in values:
+            previous = value if value is not None else previous
+            filled.append(previous)
+        return filled
+    return values
+
+def fetch_frame(db, body, now=None):
+    """Validate a frame request and load the observations of its series, one query per table"""
+    frame = parse_frame(body, now or datetime.utcnow())
+    by_table = {}
+    for series in frame['series']:
+        by_table.setdefault(series['table'], []).append(series)
+
+    # As-of lookups may reach back one tolerance before the first grid point
+    start = frame['origin'] - frame['tolerance']
+    end = frame['origin'] + frame['step'] * frame['points']
+    observations = {}
+    for table, table_series in by_table.items():
+        for key, value in _fetch_observations(db, table, table_series, start, end).items():
+            observations[(table, *key)] = value
+    return frame, observations
+
+def build_frame(fetched):
+    """Resample and as-of join the observations of fetch_frame onto its grid; needs no session"""
+    frame, observations = fetched
+    origin, step, tolerance = frame['origin'], frame['step'], frame['tolerance']
+    grid_times = [origin + step * i for i in range(frame['points'])]
+    grid = [_epoch(point) for point in grid_times]
+    step_seconds = step.total_seconds()
+
+    columns = {'timestamp': [point.isoformat() for point in grid_times]}
+    for series in frame['series']:
+        timestamps, values = observations[(series['table'], series['symbol'], series['column'])]
+        if series['agg'] == 'asof':
+            aligned = asof_align(grid, timestamps, values, tolerance.total_seconds())
+        else:
+            aligned = bucket_aggregate(grid, step_seconds, timestamps, values, series['agg'])
+        columns[series['name']] = fill_missing(aligned, series['fill'])
+
+    tables = len({series['table'] for series in frame['series']})
+    logger.info(f"Frame query: {len(frame['series'])} series over {tables} tables, {len(grid)} rows")
+    return columns
+
+def run_frame(db, body, now=None):
+    """Resample and as-of join the requested series onto one time grid, returned as columns"""
+    return build_frame(fetch_frame(db, body, now))
+
+def columns_to_arrow(columns):
+    """Serialize a frame to an Arrow IPC stream; raises FrameQueryError if pyarrow is not installed"""
+    if pyarrow is None:
+        raise FrameQueryError("Arrow output is not available on this server, use format=columnar")
+    table = pyarrow.table({
+        name: pyarrow.array([datetime.fromisoformat(v) for v in values], type=pyarrow.timestamp('us'))
+        if name == 'timestamp' else pyarrow.array(values, type=pyarrow.float64())
+        for name, values in columns.items()
+    })
+    sink = io.BytesIO()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
@@ -0,0 +1,15 @@
+import os
+
+# Threaded workers: a long-lived /stream (server-sent events) client holds one thread, not a whole worker
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+# Each worker runs its own collector unless RUN_COLLECTOR=false, so scale with threads first
+workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+# Upper bound on concurrent requests per worker, stream subscribers included; main.py admits
+# at most CHANGE_FEED_THREAD_SHARE of these threads as /stream subscribers
+threads = int(os.getenv('GUNICORN_THREADS', '64'))
+# gthread workers heartbeat from their main thread, so this only restarts a hung worker and
+# never cuts off a stream; keepalive comments (CHANGE_FEED_KEEPALIVE_SECONDS) keep proxies from idling it out
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
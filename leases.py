@@ -0,0 +1,97 @@
+import json
+import logging
+import os
+import socket
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from models import CollectionLease
+
+# Get the logger
+logger = logging.getLogger('neptune-data.collector')
+
+# Identifies this collector in the lease table; must be unique across nodes
+COLLECTOR_NODE_ID = os.getenv('COLLECTOR_NODE_ID') or f"{socket.gethostname()}:{os.getpid()}"
+# Seconds a claimed work item is reserved before another node may take it over;
+# keep it above the slowest item's fetch time including retries
+COLLECT_LEASE_SECONDS = int(os.getenv('COLLECT_LEASE_SECONDS', '900'))
+
+# Split each cycle into work items that several collector nodes claim through the lease table
+COLLECTOR_SHARDING = os.getenv('COLLECTOR_SHARDING', 'false').lower() == 'true'
+# Sharded nodes start each cycle at the slot boundary plus a random delay up to this many
+# seconds, so they all join the same slot without racing for the first claims at once
+COLLECT_SLOT_JITTER_SECONDS = float(os.getenv('COLLECT_SLOT_JITTER_SECONDS', '5'))
+SCHEDULE_INTERVAL = int(os.getenv('SCHEDULE_INTERVAL_MINUTES', '30'))
+
+TERMINAL_STATUSES = ('ok', 'failed', 'skipped')
+
+# Slot timestamps are naive UTC, counted from this epoch
+EPOCH = datetime(1970, 1, 1)
+
+def cycle_timestamp(now=None, interval_minutes=SCHEDULE_INTERVAL):
+    """Snapshot timestamp every node agrees on: the start of the current schedule slot"""
+    slot = timedelta(minutes=interval_minutes)
+    return EPOCH + ((now or datetime.utcnow()) - EPOCH) // slot * slot
+
+def seconds_until_next_slot(now=None, interval_minutes=SCHEDULE_INTERVAL):
+    """Seconds from now to the start of the next schedule slot"""
+    now = now or datetime.utcnow()
+    return (cycle_timestamp(now, interval_minutes) + timedelta(minutes=interval_minutes) - now).total_seconds()
+
+def claim(db, timestamp, item, owner=COLLECTOR_NODE_ID, now=None):
+    """
+    Try to reserve a work item of a snapshot for this node.
+
+    The first claim is an insert, so concurrent nodes race on the primary key
+    and exactly one wins. A running item whose lease expired (its node died)
+    is taken over with an update conditional on the expired holder, which
+    again lets only one node succeed. Returns True if the item is ours.
+    """
+    now = now or datetime.utcnow()
+    expires_at = now + timedelta(seconds=COLLECT_LEASE_SECONDS)
+    current = db.query(CollectionLease.owner, CollectionLease.status, CollectionLease.expires_at).filter_by(
+        timestamp=timestamp, item=item
+    ).first()
+    if current is None:
+        db.add(CollectionLease(timestamp=timestamp, item=item, owner=owner, status='running', expires_at=expires_at))
+        try:
+            db.commit()
+            return True
+        except IntegrityError:
+            db.rollback()
+            return False
+    if current.status != 'running' or current.expires_at > now:
+        return False
+
+    taken = db.query(CollectionLease).filter_by(
+        timestamp=timestamp, item=item, owner=current.owner, status='running', expires_at=current.expires_at
+    ).update({'owner': owner, 'expires_at': expires_at}, synchronize_session=False)
+    db.commit()
+    if taken:
+        logger.warning(f"Took over expired lease on {item} from {current.owner}")
+    return bool(taken)
+
+def complete(db, timestamp, item, status, values=None, owner=COLLECTOR_NODE_ID):
+    """Record an item's outcome and the values dependent items need; False if the lease was lost meanwhile"""
+    updated = db.query(CollectionLease).filter_by(timestamp=timestamp, item=item, owner=owner).update({
+        'status': status,
+        'expires_at': datetime.utcnow(),
+        'result': json.dumps(values or {}, default=str),
+    }, synchronize_session=False)
+    db.commit()
+    if not updated:
+        logger.warning(f"Lease on {item} was taken over before it completed")
+    return bool(updated)
+
+def lease_states(db, timestamp):
+    """{item: (status, values)} of every claimed item of a snapshot, read fresh from the database"""
+    rows = db.query(CollectionLease.item, CollectionLease.status, CollectionLease.result).filter_by(
+        timestamp=timestamp
+    ).all()
+    db.commit()  # End the read so the next poll sees other nodes' commits
+    return {row.item: (row.status, json.loads(row.result) if row.result else {}) for row in rows}
+
+def prune_leases(db, before):
+    """Delete the leases of snapshots older than before; they are only needed while a cycle runs"""
+    deleted = db.query(CollectionLease).filter(CollectionLease.timestamp < before).delete(synchronize_session=False)
+    db.commit()
+    return deleted
@@ -0,0 +1,136 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+
+# Output format: 'plain' (logger name, message, then key=value fields), or 'json' (one object per line)
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'plain')
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+# Bounded queue between the logging call and the writer thread; records are dropped when full
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+# Fraction of per-request log records kept, and an optional cap per second (0 = no cap)
+LOG_REQUEST_SAMPLE_RATE = float(os.getenv('LOG_REQUEST_SAMPLE_RATE', '1.0'))
+LOG_REQUEST_RATE_LIMIT = float(os.getenv('LOG_REQUEST_RATE_LIMIT', '0'))
+
+# Logger names for the two streams; module loggers are children of these
+WEB_LOGGER = 'neptune-data.web'
+COLLECTOR_LOGGER = 'neptune-data.collector'
+REQUEST_LOGGER = 'neptune-data.web.requests'
+
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+def _stream_name(logger_name):
+    if logger_name.startswith(WEB_LOGGER):
+        return 'web'
+    if logger_name.startswith(COLLECTOR_LOGGER):
+        return 'collector'
+    return 'app'
+
+def _fields(record):
+    """Structured fields passed through `extra=`"""
+    return {key: value for key, value in vars(record).items() if key not in _STANDARD_ATTRS}
+
+class StructuredFormatter(logging.Formatter):
+    """Formats the message lazily on the writer thread, prefixed by the logger name and followed by its key=value fields"""
+
+    def format(self, record):
+        message = record.getMessage()
+        fields = _fields(record)
+        if LOG_FORMAT == 'json':
+            entry = {
+                'ts': self.formatTime(record),
+                'level': record.levelname,
+                'stream': _stream_name(record.name),
+                'logger': record.name,
+                'msg': message,
+                **fields,
+            }
+            if record.exc_info:
+                entry['exc'] = self.formatException(record.exc_info)
+            return json.dumps(entry, default=str)
+
+        message = f"{record.name}: {message}"
+        if fields:
+            message += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_info:
+            message += "\n" + self.formatException(record.exc_info)
+        return message
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the writer thread without formatting them first.
+
+    The stock QueueHandler formats in the caller's thread. Here records stay
+    in-process, so args and exc_info can be passed through untouched. When
+    the queue is full the record is dropped and counted, instead of blocking.
+    """
+
+    dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DeferredQueueHandler.dropped += 1
+
+class SamplingFilter(logging.Filter):
+    """Keeps a random fraction of records and at most `rate_limit` per second"""
+
+    def __init__(self, sample_rate=1.0, rate_limit=0):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.rate_limit = rate_limit
+        self._window = int(time.time())
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return False
+        if self.rate_limit:
+            with self._lock:
+                now = int(time.time())
+                if now != self._window:
+                    self._window, self._count = now, 0
+                self._count += 1
+                if self._count > self.rate_limit:
+                    return False
+        return True
+
+_listener = None
+
+def configure_logging():
+    """Route all logging through one bounded queue and a background writer thread (idempotent)"""
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(StructuredFormatter())
+
+    root = logging.getLogger()
+    root.handlers = [DeferredQueueHandler(log_queue)]
+    root.setLevel(LOG_LEVEL)
+    logging.getLogger('neptune-data').setLevel(LOG_LEVEL)
+
+    request_logger = logging.getLogger(REQUEST_LOGGER)
+    request_logger.filters = [SamplingFilter(LOG_REQUEST_SAMPLE_RATE, LOG_REQUEST_RATE_LIMIT)]
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+def get_logging_stats():
+    return {
+        'queue_size': _listener.queue.qsize() if _listener else 0,
+        'dropped': DeferredQueueHandler.dropped,
+    }
@@ -1,118 +1,111 @@
-import asyncio
+import time
+
+# Measured before anything else is imported, for the startup report
+_import_started = time.perf_counter()
+
 import logging
 from datetime import datetime, timedelta
-from flask import Flask, jsonify
-from pyinjective.async_client import AsyncClient
-from pyinjective.core.network import Network
+from flask import Flask, jsonify, request, Response, g
 from models import (
-    MarketData, TokenPrices, ContractData, NEPTData, SessionLocal
+    MarketData, TokenPrices, ContractData, NEPTData, DerivedMetrics, SourceStatus
 )
-from sqlalchemy import desc
-import threading
-import time
-from collect_data import collect_and_store_data
-import schedule
-from database import get_db
+from sqlalchemy import func
+import collector
+import profiling
+from log_setup import configure_logging, get_logging_stats, WEB_LOGGER, REQUEST_LOGGER
+from change_feed import feed, thread_subscriber_limit, start_snapshot_poller
+from leases import COLLECTOR_SHARDING
+from batch_query import run_batch, BatchQueryError
+from frame_query import run_frame, columns_to_arrow, ARROW_MIMETYPE
+from staking_model import load_latest_snapshot, simulate, parse_amounts
+from responses import (
+    row_to_dict, rows_to_columns, wants_columnar, latest_timestamps,
+    make_etag, is_not_modified, set_cache_headers, compress_response
+)
+from database import get_db, ReadSessionLocal, get_pool_stats
+from series_store import store as series_store, start_series_store
 import os
 
 app = Flask(__name__)
 
-# Get schedule interval from environment variable, default to 30 minutes
-SCHEDULE_INTERVAL = int(os.getenv('SCHEDULE_INTERVAL_MINUTES', '30'))
+# Run the collector inside the web process; set to false when it runs as its own process (python collector.py)
+RUN_COLLECTOR = os.getenv('RUN_COLLECTOR', 'true').lower() == 'true'
 
-# Configure logging to output to stdout
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(message)s',
-    handlers=[logging.StreamHandler()]
-)
+# Each /stream subscriber holds one of the server's threads (GUNICORN_THREADS in gunicorn.conf.py)
+feed.max_subscribers = thread_subscriber_limit(int(os.getenv('GUNICORN_THREADS', '64')))
 
-# Get the logger
-logger = logging.getLogger('neptune-data')
+# Route logging through the non-blocking queue pipeline
+configure_logging()
 
-# Ensure the logger has the correct level
-logger.setLevel(logging.INFO)
+# Get the loggers; per-request records go through the sampled request logger
+logger = logging.getLogger(WEB_LOGGER)
+request_logger = logging.getLogger(REQUEST_LOGGER)
 
-# Add a custom formatter to the logger
-formatter = logging.Formatter('%(message)s')
-for handler in logger.handlers:
-    handler.setFormatter(formatter)
+# Startup timings reported in the log and on /health
+startup_report = {'import_seconds': round(time.perf_counter() - _import_started, 3)}
 
-# Global variables for health check
-collection_thread = None
+@app.before_request
+def before_request():
+    # Sampled request profiling; streams are long-lived and never sampled
+    if request.endpoint != 'stream' and profiling.should_profile_request():
+        g.profile = profiling.capture(f"request {request.method} {request.path}")
+        g.profile.__enter__()
 
-def start_background_tasks():
-    global collection_thread
-    try:
-        # Start data collection thread
-        logger.info("Starting background tasks thread for data collection")
-        
-        # Get the last entry time from the database
-        db = SessionLocal()
-        try:
-            latest_market_data = db.query(MarketData).order_by(desc(MarketData.timestamp)).first()
-            if latest_market_data:
-                # Calculate time until next scheduled run
-                last_run = latest_market_data.timestamp
-                next_run = last_run + timedelta(minutes=SCHEDULE_INTERVAL)
-                now = datetime.utcnow()
-                
-                if next_run > now:
-                    # Schedule for the calculated next run time
-                    delay = (next_run - now).total_seconds()
-                    logger.info(f"Last data collection was at {last_run}, scheduling next run in {delay/60:.1f} minutes")
-                    schedule.every(delay).seconds.do(job)
-                else:
-                    # Run immediately if we're past the scheduled time
-                    logger.info("Last data collection is older than schedule interval, running immediately")
-                    job()
-            else:
-                # No previous data, run immediately
-                logger.info("No previous data found, running immediately")
-                job()
-            
-            # Schedule subsequent runs
-            schedule.every(SCHEDULE_INTERVAL).minutes.do(job)
-            logger.info(f"Scheduled data collection to run every {SCHEDULE_INTERVAL} minutes")
-            
-        finally:
-            db.close()
-        
-        # Start scheduler in a separate thread
-        collection_thread = threading.Thread(target=run_scheduler)
-        collection_thread.daemon = True
-        collection_thread.start()
-            
-        logger.info("Background tasks started successfully")
-    except Exception as e:
-        logger.error(f"Failed to start background tasks: {str(e)}", exc_info=True)
-        raise
+@app.after_request
+def after_request(response):
+    return compress_response(response)
+
+@app.teardown_request
+def teardown_request(exc):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.__exit__(None, None, None)
 
 @app.route('/')
 def index():
     """Get the latest data from all categories"""
-    logger.info("Received request for latest data")
-    db = SessionLocal()
+    request_logger.info("Received request for latest data")
+    db = ReadSessionLocal()
     try:
+        snapshot_timestamps = latest_timestamps(
+            db, [MarketData, TokenPrices, ContractData, NEPTData, DerivedMetrics], complete_only=True
+        )
+        last_modified = max([ts for ts in snapshot_timestamps if ts], default=None)
+        etag = make_etag(*snapshot_timestamps)
+        if is_not_modified(etag, last_modified):
+            return set_cache_headers(Response(status=304), etag, last_modified)
+
+        # Rows of the latest complete snapshot of each table
         latest_data = {
-            'market_data': db.query(MarketData).order_by(desc(MarketData.timestamp)).first(),
-            'price_data': db.query(TokenPrices).order_by(desc(TokenPrices.timestamp)).first(),
-            'contract_data': db.query(ContractData).order_by(desc(ContractData.timestamp)).first(),
-            'nept_data': db.query(NEPTData).order_by(desc(NEPTData.timestamp)).first()
+            key: db.query(model).filter(model.timestamp == ts).first() if ts else None
+            for (key, model), ts in zip(
+                (('market_data', MarketData), ('price_data', TokenPrices),
+                 ('contract_data', ContractData), ('nept_data', NEPTData)),
+                snapshot_timestamps
+            )
         }
-        logger.info(f"Returning latest data: {latest_data}")
-        return jsonify({
-            k: v.__dict__ if v else None 
-            for k, v in latest_data.items()
+        request_logger.debug("Returning latest data", extra={
+            'tables': [k for k, v in latest_data.items() if v is not None]
         })
+        response = {
+            k: row_to_dict(v) if v else None 
+            for k, v in latest_data.items()
+        }
+        latest_derived_ts = snapshot_timestamps[-1]
+        response['derived_metrics'] = [
+            row_to_dict(row) for row in db.query(DerivedMetrics).filter(
+                DerivedMetrics.timestamp == latest_derived_ts
+            ).order_by(DerivedMetrics.token_symbol)
+        ] if latest_derived_ts else []
+        return set_cache_headers(jsonify(response), etag, last_modified)
     finally:
         db.close()
 
 @app.route('/historical/<data_type>/<int:days>')
 def historical_data(data_type, days):
     """Get historical data for a specific type over a number of days"""
-    logger.info(f"Received request for historical {data_type} data for {days} days")
-    db = SessionLocal()
+    request_logger.info("Received request for historical %s data for %d days", data_type, days)
+    db = ReadSessionLocal()
     try:
         end_date = datetime.utcnow()
         start_date = end_date - timedelta(days=days)
@@ -121,57 +114,195 @@ def historical_data(data_type, days):
             'market': MarketData,
             'price': TokenPrices,
             'contract': ContractData,
-            'nept': NEPTData
+            'nept': NEPTData,
+            'derived': DerivedMetrics,
+            'sources': SourceStatus
         }
         
         if data_type not in model_map:
             return jsonify({'error': 'Invalid data type'}), 400
             
         model = model_map[data_type]
-        data = db.query(model).filter(
-            model.timestamp >= start_date,
-            model.timestamp <= end_date
-        ).order_by(model.timestamp).all()
+        table = model.__tablename__
+
+        # Windows inside the in-memory store never touch the database
+        series_store.refresh_if_stale(ReadSessionLocal)
+        in_memory = series_store.covers(table, start_date)
+
+        # The window slides with time, so the ETag covers both ends of it
+        if in_memory:
+            last_modified = series_store.latest_timestamp(table)
+            first_in_window = series_store.first_timestamp(table, start_date)
+        else:
+            last_modified = db.query(func.max(model.timestamp)).scalar()
+            first_in_window = db.query(func.min(model.timestamp)).filter(
+                model.timestamp >= start_date
+            ).scalar()
+        etag = make_etag(last_modified, first_in_window)
+        if request.if_none_match and is_not_modified(etag):
+            return set_cache_headers(Response(status=304), etag, last_modified)
+
+        if in_memory:
+            rows = [
+                dict(row, timestamp=row['timestamp'].isoformat())
+                for row in series_store.query(table, start_date, end_date)
+            ]
+        else:
+            rows = [row_to_dict(item) for item in db.query(model).filter(
+                model.timestamp >= start_date,
+                model.timestamp <= end_date
+            ).order_by(model.timestamp)]
         
-        logger.info(f"Returning {len(data)} historical records")
-        return jsonify([item.__dict__ for item in data])
+        request_logger.info("Returning %d historical records", len(rows), extra={'data_type': data_type, 'days': days})
+        response = jsonify(rows_to_columns(rows) if wants_columnar() else rows)
+        return set_cache_headers(response, etag, last_modified)
+    finally:
+        db.close()
+
+@app.route('/batch', methods=['POST'])
+def batch():
+    """Run several table/symbol/range/resolution selections in one request"""
+    body = request.get_json(silent=True) or {}
+    db = ReadSessionLocal()
+    try:
+        results = run_batch(
+            db, body.get('selections'),
+            columnar=body.get('format') == 'columnar' or wants_columnar()
+        )
+        return jsonify({'results': results})
+    except BatchQueryError as e:
+        return jsonify({'error': str(e)}), 400
+    finally:
+        db.close()
+
+@app.route('/frame', methods=['POST'])
+def frame():
+    """Resample several series onto one time grid and as-of join them into a single frame"""
+    body = request.get_json(silent=True) or {}
+    output = body.get('format') or request.args.get('format', 'columnar')
+    db = ReadSessionLocal()
+    try:
+        columns = run_frame(db, body)
+        if output == 'arrow':
+            return Response(columns_to_arrow(columns), mimetype=ARROW_MIMETYPE)
+        return jsonify({'count': len(columns['timestamp']), 'data': columns})
+    except BatchQueryError as e:
+        return jsonify({'error': str(e)}), 400
     finally:
         db.close()
 
+@app.route('/staking/simulate')
+def staking_simulate():
+    """APR of every staking pool if each amount of NEPT were added to ?pool=, from the latest snapshot"""
+    db = ReadSessionLocal()
+    try:
+        snapshot = load_latest_snapshot(db)
+    finally:
+        db.close()
+    if snapshot is None:
+        return jsonify({'error': 'No staking data available'}), 404
+
+    etag = make_etag(snapshot.timestamp)
+    if is_not_modified(etag, snapshot.timestamp):
+        return set_cache_headers(Response(status=304), etag, snapshot.timestamp)
+    try:
+        pool_number = int(request.args.get('pool', ''))
+        results = simulate(snapshot, pool_number, parse_amounts(request.args))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    response = jsonify({
+        'timestamp': snapshot.timestamp.isoformat(),
+        'emission_rate': snapshot.emission_rate,
+        'pools': snapshot.current(),
+        'pool': pool_number,
+        'results': results
+    })
+    return set_cache_headers(response, etag, snapshot.timestamp)
+
+@app.route('/tx/<tx_hash>')
+def transaction(tx_hash):
+    """Look up a transaction by hash, decoding Neptune market and nToken messages"""
+    # Deferred so web workers only load the chain client when a lookup needs it
+    from tx_lookup import lookup_transactions, normalize_hash, error_http_status, get_cache
+    tx_hash = normalize_hash(tx_hash)
+    tx = get_cache().get(tx_hash)
+    if tx is None:
+        try:
+            tx = lookup_transactions([tx_hash])[tx_hash]
+        except TimeoutError:
+            return jsonify({'hash': tx_hash, 'error': 'Lookup timed out'}), 504
+    if 'error' in tx:
+        return jsonify(tx), error_http_status(tx)
+    return jsonify(tx)
+
+@app.route('/stream')
+def stream():
+    """Server-sent events feed of new snapshots (?mode=diff for changes only)"""
+    mode = request.args.get('mode', 'full')
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    events = feed.subscribe(mode=mode, last_event_id=last_event_id)
+    if events is None:
+        return jsonify({'error': 'Too many subscribers'}), 503
+    logger.info(f"Change feed subscriber connected ({feed.subscriber_count} active)")
+    return Response(events, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/profiling', methods=['GET', 'POST'])
+def profiling_settings():
+    """Show or change cycle/request profiling settings and list recent profiles"""
+    if request.method == 'POST':
+        if not profiling.is_authorized(request.headers):
+            return jsonify({'error': 'Changing profiling settings requires PROFILE_ADMIN_TOKEN'}), 403
+        try:
+            profiling.update_settings(request.get_json(silent=True) or {})
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+        logger.info(f"Profiling settings updated: {profiling.settings}")
+    return jsonify({'settings': profiling.settings, 'profiles': profiling.list_profiles()})
+
 @app.route('/health')
 def health():
-    logger.info("Health check requested")
-    db = SessionLocal()
+    db = ReadSessionLocal()
     try:
-        latest_market_data = db.query(MarketData).order_by(desc(MarketData.timestamp)).first()
+        # Only complete snapshots count as an update
+        last_update = latest_timestamps(db, [MarketData], complete_only=True)[0]
         status = {
             'status': 'healthy',
-            'last_update': latest_market_data.timestamp.isoformat() if latest_market_data else None,
-            'data_available': bool(latest_market_data),
-            'collection_thread_running': bool(collection_thread and collection_thread.is_alive())
+            'last_update': last_update.isoformat() if last_update else None,
+            'data_available': bool(last_update),
+            **collector.is_running(),
+            'db_pools': get_pool_stats(),
+            'startup': startup_report,
+            'logging': get_logging_stats(),
+            'series_store': series_store.stats()
         }
-        logger.info(f"Health check status: {status}")
+        request_logger.debug("Health check status: %s", status)
         return jsonify(status)
     finally:
         db.close()
 
-async def run_collection():
-    logger.info(f"Starting data collection at {datetime.utcnow()}")
-    await collect_and_store_data()
-
-def job():
-    asyncio.run(run_collection())
-
-def run_scheduler():
-    """Run the scheduler in a separate thread"""
-    logger.info("Starting scheduler thread")
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
+def start_background_tasks():
+    try:
+        start_series_store(ReadSessionLocal)
+        if RUN_COLLECTOR:
+            collector.start_background_tasks()
+        else:
+            logger.info("RUN_COLLECTOR is false, not starting data collection in this process")
+        if not RUN_COLLECTOR or COLLECTOR_SHARDING:
+            # Snapshots are (also) stored by other processes; pick them up for /stream subscribers
+            start_snapshot_poller(ReadSessionLocal)
+    except Exception as e:
+        logger.error(f"Failed to start background tasks: {str(e)}", exc_info=True)
+        raise
+    startup_report['ready_seconds'] = round(time.perf_counter() - _import_started, 3)
+    logger.info(f"Startup report: imports {startup_report['import_seconds']}s, ready {startup_report['ready_seconds']}s")
 
 # Start background tasks when the application starts
 start_background_tasks()
 
 if __name__ == "__main__":
     # Start the Flask app
-    app.run(host='0.0.0.0', port=8080)
+    app.run(host='0.0.0.0', port=8080)
\ No newline at end of file
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, Float, String, DateTime, ForeignKey, DECIMAL, UniqueConstraint
+from sqlalchemy import Column, Integer, Float, String, Text, DateTime, ForeignKey, DECIMAL, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 import os
@@ -130,4 +130,77 @@ class LPPoolData(Base):
     
     __table_args__ = (
         UniqueConstraint('timestamp', 'pool_address', name='uix_lp_pool_data'),
-    ) 
\ No newline at end of file
+    )
+
+class DerivedMetrics(Base):
+    __tablename__ = "derived_metrics"
+    
+    timestamp = Column(DateTime, primary_key=True, default=datetime.utcnow)
+    token_symbol = Column(String(10), primary_key=True)
+    utilization = Column(DECIMAL(10,4))
+    lent_usd = Column(DECIMAL(24,8))
+    borrowed_usd = Column(DECIMAL(24,8))
+    rate_spread = Column(DECIMAL(10,4))
+    execute_delta = Column(Integer)
+    
+    __table_args__ = (
+        UniqueConstraint('timestamp', 'token_symbol', name='uix_derived_metrics'),
+    )
+
+class ContractExecuteBuckets(Base):
+    __tablename__ = "contract_execute_buckets"
+    
+    timestamp = Column(DateTime, primary_key=True)  # Bucket start
+    contract_label = Column(String(50), primary_key=True)
+    contract_address = Column(String(100))
+    execute_count = Column(Integer)
+    
+    __table_args__ = (
+        UniqueConstraint('timestamp', 'contract_label', name='uix_contract_execute_buckets'),
+    )
+
+class SourceStatus(Base):
+    __tablename__ = "source_status"
+    
+    timestamp = Column(DateTime, primary_key=True)
+    source = Column(String(20), primary_key=True)
+    status = Column(String(10))  # ok, failed or skipped
+    attempts = Column(Integer)
+    duration = Column(Float)
+    error = Column(String(255))
+    
+    __table_args__ = (
+        UniqueConstraint('timestamp', 'source', name='uix_source_status'),
+    )
+
+# Source name of the status row written once a snapshot is complete; the latest-data
+# routes only serve snapshots up to the newest such row
+SNAPSHOT_MARKER = "snapshot"
+
+class CollectionLease(Base):
+    __tablename__ = "collection_leases"
+    
+    timestamp = Column(DateTime, primary_key=True)  # Snapshot the work item belongs to
+    item = Column(String(20), primary_key=True)
+    owner = Column(String(100))  # Collector node holding or having finished the item
+    status = Column(String(10))  # running, ok, failed or skipped
+    expires_at = Column(DateTime)
+    result = Column(Text)  # JSON values passed on to dependent items
+
+# Snapshot tables by name, with the column that identifies a series within a snapshot (None if one row per snapshot)
+SERIES_TABLES = {
+    'market_data': (MarketData, None),
+    'token_rates': (TokenRates, 'token_symbol'),
+    'token_amounts': (TokenAmounts, 'token_symbol'),
+    'token_prices': (TokenPrices, 'token_symbol'),
+    'contract_data': (ContractData, None),
+    'ntoken_contract_executes': (NTokenContractExecutes, 'token_symbol'),
+    'market_contract_executes': (MarketContractExecutes, 'contract_type'),
+    'nept_data': (NEPTData, None),
+    'staking_pools': (StakingPools, 'pool_number'),
+    'collateral_amounts': (CollateralAmounts, 'token_symbol'),
+    'lp_pool_data': (LPPoolData, 'pool_address'),
+    'derived_metrics': (DerivedMetrics, 'token_symbol'),
+    'contract_execute_buckets': (ContractExecuteBuckets, 'contract_label'),
+    'source_status': (SourceStatus, 'source'),
+}
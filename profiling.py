@@ -0,0 +1,142 @@
+import cProfile
+import hmac
+import io
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+# Get the loggers; request profiles are reported on the web stream, cycle profiles on the collector stream
+web_logger = logging.getLogger('neptune-data.web')
+collector_logger = logging.getLogger('neptune-data.collector')
+
+# Token required to change settings via POST /profiling; unset disables runtime changes
+PROFILE_ADMIN_TOKEN = os.getenv('PROFILE_ADMIN_TOKEN', '')
+# Upper bound on the fraction of requests profiled; profiled requests run several times slower
+PROFILE_MAX_REQUEST_SAMPLE_RATE = float(os.getenv('PROFILE_MAX_REQUEST_SAMPLE_RATE', '0.05'))
+
+def _sample_rate(value):
+    return min(max(float(value), 0.0), PROFILE_MAX_REQUEST_SAMPLE_RATE)
+
+# Runtime-adjustable settings, seeded from the environment and changed via /profiling
+settings = {
+    'cycles': os.getenv('PROFILE_CYCLES', 'false').lower() == 'true',
+    'request_sample_rate': _sample_rate(os.getenv('PROFILE_REQUEST_SAMPLE_RATE', '0')),
+    'trace_memory': os.getenv('PROFILE_TRACE_MEMORY', 'true').lower() == 'true',
+    'top_n': int(os.getenv('PROFILE_TOP_N', '15')),
+}
+# Profiles are written here and only the newest PROFILE_KEEP are kept
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '20'))
+
+# Only one capture at a time: cProfile and tracemalloc are process-wide on recent Pythons
+_capture_lock = threading.Lock()
+
+def is_authorized(headers):
+    """Whether a request may change settings: PROFILE_ADMIN_TOKEN must be set and match its bearer token"""
+    if not PROFILE_ADMIN_TOKEN:
+        return False
+    scheme, _, token = headers.get('Authorization', '').partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(token.strip(), PROFILE_ADMIN_TOKEN)
+
+def update_settings(values):
+    """Apply the known keys from values and return the current settings"""
+    if 'cycles' in values:
+        settings['cycles'] = bool(values['cycles'])
+    if 'request_sample_rate' in values:
+        settings['request_sample_rate'] = _sample_rate(values['request_sample_rate'])
+    if 'trace_memory' in values:
+        settings['trace_memory'] = bool(values['trace_memory'])
+    if 'top_n' in values:
+        settings['top_n'] = max(int(values['top_n']), 1)
+    return dict(settings)
+
+def should_profile_request():
+    rate = settings['request_sample_rate']
+    return rate > 0 and random.random() < rate
+
+def list_profiles():
+    """Recent profile artifacts, newest first"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    return sorted((name for name in os.listdir(PROFILE_DIR) if name.endswith('.prof')), reverse=True)
+
+def _prune():
+    for name in list_profiles()[PROFILE_KEEP:]:
+        base = os.path.join(PROFILE_DIR, name[:-len('.prof')])
+        for path in (base + '.prof', base + '.txt'):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+def _summarize(profiler, memory_snapshot, top_n, elapsed):
+    out = io.StringIO()
+    out.write(f"Wall time: {elapsed:.3f}s\n\nTop {top_n} functions by cumulative time:\n")
+    pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(top_n)
+    if memory_snapshot is not None:
+        out.write(f"\nTop {top_n} allocation sites:\n")
+        for stat in memory_snapshot.statistics('lineno')[:top_n]:
+            out.write(f"{stat}\n")
+    return out.getvalue()
+
+def _write(label, profiler, summary):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    safe_label = re.sub(r'[^A-Za-z0-9_-]+', '_', label).strip('_') or 'profile'
+    base = os.path.join(PROFILE_DIR, f"{datetime.utcnow():%Y%m%dT%H%M%S%f}_{safe_label}")
+    profiler.dump_stats(base + '.prof')
+    with open(base + '.txt', 'w') as f:
+        f.write(summary)
+    _prune()
+    return base + '.prof'
+
+@contextmanager
+def capture(label, logger=web_logger):
+    """
+    Profile the enclosed block with cProfile (and tracemalloc if enabled).
+
+    Writes a .prof artifact plus a .txt top-N summary to PROFILE_DIR and logs
+    the summary head to logger. If another capture is running the block runs
+    unprofiled.
+    """
+    if not _capture_lock.acquire(blocking=False):
+        yield
+        return
+    trace_memory = settings['trace_memory'] and not tracemalloc.is_tracing()
+    profiler = cProfile.Profile()
+    try:
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            elapsed = time.perf_counter() - start
+            memory_snapshot = tracemalloc.take_snapshot() if trace_memory else None
+            if trace_memory:
+                tracemalloc.stop()
+            try:
+                summary = _summarize(profiler, memory_snapshot, settings['top_n'], elapsed)
+                path = _write(label, profiler, summary)
+                logger.info(f"Profile for {label} written to {path}\n" + "\n".join(summary.splitlines()[:settings['top_n'] + 12]))
+            except Exception as e:
+                logger.error(f"Error writing profile for {label}: {str(e)}")
+    finally:
+        _capture_lock.release()
+
+@contextmanager
+def profile_cycle():
+    """Profile a collection cycle when cycle profiling is enabled"""
+    if settings['cycles']:
+        with capture('cycle', logger=collector_logger):
+            yield
+    else:
+        yield
@@ -12,26 +12,41 @@ import aiohttp
 import csv
 import os
 import logging
+from rpc_pool import get_client
+from decoding import (
+    query_contract, AccountsPage, RateEntry, MarketEntry, CollateralEntry,
+    StakingParams, StakingState, PriceResponse, parse_number
+)
+from token_metadata import load_cached_tokens, refresh_token_metadata
+from staking_model import pool_aprs
+from contracts import contract_address
 
 # Get the logger
-logger = logging.getLogger('neptune-data')
+logger = logging.getLogger('neptune-data.collector')
 
-# Cache for CSV data to avoid repeated file access
+# Cache for CSV and discovered token data to avoid repeated file access
 _tokens_cache = None
+_tokens_by_denom = {}
 _staking_pools_cache = None
 
+def _load_csv_tokens():
+    """Load the hand-maintained tokens from CSV; these take precedence over discovered ones"""
+    try:
+        with open('tokens.csv') as f:
+            return list(csv.DictReader(f))
+    except Exception as e:
+        logger.error(f"Error loading tokens: {e}")
+        return []
+
 def _load_tokens():
-    """Load tokens from CSV file and cache them"""
-    global _tokens_cache
+    """Load tokens from CSV plus the persisted discovery cache and cache them"""
+    global _tokens_cache, _tokens_by_denom
     if _tokens_cache is None:
-        _tokens_cache = []
-        try:
-            with open('tokens.csv') as f:
-                tokens = csv.DictReader(f)
-                _tokens_cache = list(tokens)
-        except Exception as e:
-            logger.error(f"Error loading tokens: {e}")
-            _tokens_cache = []
+        csv_tokens = _load_csv_tokens()
+        known_denoms = {token['denom'] for token in csv_tokens}
+        discovered, _ = load_cached_tokens()
+        _tokens_cache = csv_tokens + [token for token in discovered if token['denom'] not in known_denoms]
+        _tokens_by_denom = {token['denom']: token for token in _tokens_cache}
     return _tokens_cache
 
 def _load_staking_pools():
@@ -48,18 +63,25 @@ def _load_staking_pools():
             _staking_pools_cache = []
     return _staking_pools_cache
 
+async def refresh_tokens(client):
+    """Pick up new markets and collaterals from chain once the metadata cache has expired"""
+    global _tokens_cache
+    try:
+        if await refresh_token_metadata(client, _load_csv_tokens()):
+            _tokens_cache = None
+            _load_tokens()
+    except Exception as e:
+        logger.error(f"Error refreshing token metadata: {str(e)}")
+
 def _get_token_info(denom):
     """Get token information from the cached token data"""
-    tokens = _load_tokens()
-    for token in tokens:
-        if token['denom'] == denom:
-            return token
-    return None
+    _load_tokens()
+    return _tokens_by_denom.get(denom)
 
 async def get_market_contract_executes(client):
     logger.info("Getting market contract executes")
 
-    wasm_contract = await client.fetch_wasm_contract_by_address(address="inj1nc7gjkf2mhp34a6gquhurg8qahnw5kxs5u3s4u")
+    wasm_contract = await client.fetch_wasm_contract_by_address(address=contract_address("market"))
 
     if isinstance(wasm_contract, dict) and "executes" in wasm_contract:
         return wasm_contract["executes"]
@@ -67,60 +89,46 @@ async def get_market_contract_executes(client):
         return None
 
 
-async def get_all_borrow_accounts(client):
-    logger.info("Getting all borrow accounts")
-    address = "inj1nc7gjkf2mhp34a6gquhurg8qahnw5kxs5u3s4u"
+async def get_all_borrow_accounts(client, lower=None, upper=None):
+    """
+    Count borrow accounts and unique borrower addresses.
+
+    lower/upper restrict the scan to addresses in [lower, upper) so it can
+    be split across collectors; None scans from the start or to the end.
+    """
+    logger.info(f"Getting borrow accounts in [{lower or 'start'}, {upper or 'end'})")
+    address = contract_address("market")
     limit = 100  # Number of accounts to fetch per request
     
-    all_accounts = []
-    start_after = None
+    total_accounts = 0
+    unique_addresses = set()
+    # Keys are (address, index) and sort by address first, so a bare prefix starts the range
+    start_after = [lower, 0] if lower else None
     
     while True:
         # Build query based on whether we have a start_after cursor
+        query = {"get_all_accounts": {"limit": limit}}
         if start_after:
-            query_data = json.dumps({
-                "get_all_accounts": {
-                    "start_after": start_after,
-                    "limit": limit
-                }
-            })
-        else:
-            query_data = json.dumps({
-                "get_all_accounts": {
-                    "limit": limit
-                }
-            })
+            query["get_all_accounts"]["start_after"] = start_after
         
-        # Fetch data
-        contract_state = await client.fetch_smart_contract_state(address=address, query_data=query_data)
-        decoded_data = base64.b64decode(contract_state["data"]).decode("utf-8")
-        accounts_data = json.loads(decoded_data)
+        # Fetch data, keeping only the (address, index) keys of each account
+        page = AccountsPage.parse(await query_contract(client, address, query))
         
         # If no accounts returned, we've reached the end
-        if not accounts_data:
+        if not page.keys:
             break
-            
-        # Add fetched accounts to our collection
-        all_accounts.extend(accounts_data)
         
-        # If we got fewer accounts than the limit, we've reached the end
-        if len(accounts_data) < limit:
+        in_range = [key for key in page.keys if upper is None or key[0] < upper]
+        total_accounts += len(in_range)
+        unique_addresses.update(account_address for account_address, _ in in_range)
+        
+        # Stop at the end of the accounts or of our range
+        if len(page.keys) < limit or len(in_range) < len(page.keys):
             break
         
         # Set the start_after to the last account for next iteration
         # Format: [account_address, index]
-        last_account = accounts_data[-1]
-        start_after = [last_account[0][0], last_account[0][1]]
-        
-        #print(f"Fetched {len(accounts_data)} accounts. Total so far: {len(all_accounts)}")
-    
-    # Count total accounts and unique addresses
-    total_accounts = len(all_accounts)
-    unique_addresses = set()
-    
-    for account_data in all_accounts:
-        account_address = account_data[0][0]  # Extract account address
-        unique_addresses.add(account_address)
+        start_after = list(page.keys[-1])
     
     # Return data with both total accounts and unique addresses count
     return {
@@ -128,65 +136,60 @@ async def get_all_borrow_accounts(client):
         "unique_addresses_count": len(unique_addresses)
     }
 
-
 async def get_borrow_rates(client):
     logger.info("Getting rates")
-    address = "inj1ftech0pdjrjawltgejlmpx57cyhsz6frdx2dhq"
-    query_data = '{"get_all_borrow_rates": {}}'
-    contract_state = await client.fetch_smart_contract_state(address=address, query_data=query_data)
-    decoded_data = base64.b64decode(contract_state["data"]).decode("utf-8")
-    rates_data = json.loads(decoded_data)
+    address = contract_address("interest_model")
+    rates = RateEntry.parse_all(await query_contract(client, address, {"get_all_borrow_rates": {}}))
     
+    # Rates are returned as percentages
     rates_dict = {}
-    for rate in rates_data:
-        denom = rate[0]["native_token"]["denom"]
-        rate_value = round(float(rate[1])*100,2)
-        token_info = _get_token_info(denom)
+    for rate in rates:
+        token_info = _get_token_info(rate.denom)
         if token_info:
-            ticker = token_info['ticker']
-            rates_dict[ticker] = str(rate_value)+"%"
+            rates_dict[token_info['ticker']] = round(rate.rate * 100, 2)
     
     return rates_dict
 
 async def get_lending_rates(client):
     logger.info("Getting rates")
-    address = "inj1ftech0pdjrjawltgejlmpx57cyhsz6frdx2dhq"
-    query_data = '{"get_all_lending_rates": {}}'
-    contract_state = await client.fetch_smart_contract_state(address=address, query_data=query_data)
-    decoded_data = base64.b64decode(contract_state["data"]).decode("utf-8")
-    rates_data = json.loads(decoded_data)
+    address = contract_address("interest_model")
+    rates = RateEntry.parse_all(await query_contract(client, address, {"get_all_lending_rates": {}}))
     
+    # Rates are returned as percentages
     rates_dict = {}
-    for rate in rates_data:
-        denom = rate[0]["native_token"]["denom"]
-        rate_value = round(float(rate[1])*100,2)
-        token_info = _get_token_info(denom)
+    for rate in rates:
+        token_info = _get_token_info(rate.denom)
         if token_info:
-            ticker = token_info['ticker']
-            rates_dict[ticker] = str(rate_value)+"%"
+            rates_dict[token_info['ticker']] = round(rate.rate * 100, 2)
     
     return rates_dict
 
-async def get_NEPT_staking_amounts(client):
+async def get_NEPT_staking_params(client):
+    return StakingParams.parse(await query_contract(client, contract_address("staking"), {"get_params": {}}))
+
+async def get_NEPT_staking_state(client):
+    return StakingState.parse(await query_contract(client, contract_address("staking"), {"get_state": {}}))
+
+def _staking_pool_names(durations):
+    """Name bond durations after staking_pools.csv, numbering durations it does not list after the known pools"""
+    known = {int(pool['period_nano']): pool['staking_pool'] for pool in _load_staking_pools()}
+    next_number = max((int(''.join(filter(str.isdigit, name)) or 0) for name in known.values()), default=0) + 1
+    names = {}
+    for duration in sorted(durations):
+        if duration in known:
+            names[duration] = known[duration]
+        else:
+            names[duration] = f"staking_pool_{next_number}"
+            next_number += 1
+    return names
+
+async def get_NEPT_staking_amounts(client, staking_state=None):
     logger.info("Getting staking yields")
-    address = "inj1v3a4zznudwpukpr8y987pu5gnh4xuf7v36jhva"
-    query_data = '{"get_state": {}}'
-    contract_state = await client.fetch_smart_contract_state(address=address, query_data=query_data)
-    decoded_data = base64.b64decode(contract_state["data"]).decode("utf-8")
-    staking_data = json.loads(decoded_data)
-
-    bonded_dict = {}
-    # Access the bonded list directly from staking_data
-    staking_pools = _load_staking_pools()
-    for bond_entry in staking_data["bonded"]:
-        pool_duration = bond_entry[0]
-        amount = float(bond_entry[1])/10**6
-        for staking_pool in staking_pools:
-            if str(pool_duration) == staking_pool['period_nano']:  # Convert pool_duration to string for comparison
-                pool = staking_pool['staking_pool']
-                bonded_dict[pool] = amount
-                break
+    if staking_state is None:
+        staking_state = await get_NEPT_staking_state(client)
 
+    names = _staking_pool_names(staking_state.bonded)
+    bonded_dict = {names[duration]: amount for duration, amount in staking_state.bonded.items()}
     total_bonded = sum(bonded_dict.values())
 
     return bonded_dict, total_bonded
@@ -201,14 +204,14 @@ async def get_NEPT_circulating_supply(client=None):
     
     async with aiohttp.ClientSession() as session:
         async with session.get(url) as response:
+            response.raise_for_status()
             nept_circulating_supply = await response.text()
     
-    # Try to convert to float for consistency
-    try:
-        return float(nept_circulating_supply)
-    except ValueError:
-        logger.warning(f"Warning: Could not convert circulating supply to float: {nept_circulating_supply}")
-        return 0
+    supply = parse_number(nept_circulating_supply)
+    if supply is None:
+        # Raise rather than store 0 so the collector retries the source
+        raise ValueError(f"Could not convert circulating supply to float: {nept_circulating_supply}")
+    return supply
 
 async def get_nToken_circulating_supply(client=None):
     """
@@ -216,7 +219,10 @@ async def get_nToken_circulating_supply(client=None):
     Client parameter is optional to maintain compatibility with other function calls.
     """
     logger.info("Getting nTokens circulating supply")
-    nTokens = ["natom","nusdt","nusdc","ninj","nweth","nausd","nsol","ntia"]
+    nTokens = [
+        token['ticker'].lower() for token in _load_tokens()
+        if token['token_type'] == "token" and token['ticker'].startswith('n')
+    ]
     url = "https://api.nept.finance/v1/supply/"
     nToken_circulating_supply = {}
     
@@ -224,82 +230,57 @@ async def get_nToken_circulating_supply(client=None):
         async with aiohttp.ClientSession() as session:
             async with session.get(url + nToken) as response:
                 supply_text = await response.text()
-                # Try to convert to float
-                try:
-                    nToken_circulating_supply[nToken] = float(supply_text)
-                except ValueError:
+                supply = parse_number(supply_text)
+                if supply is None:
                     logger.warning(f"Warning: Could not convert {nToken} supply to float: {supply_text}")
-                    nToken_circulating_supply[nToken] = 0
+                    supply = 0
+                nToken_circulating_supply[nToken] = supply
                 logger.info(f"nToken: {nToken}, Circulating Supply: {nToken_circulating_supply[nToken]}")
     
     return nToken_circulating_supply
 
 async def get_lent_amount(client):
     logger.info("Getting lent amount")
-    address = "inj1nc7gjkf2mhp34a6gquhurg8qahnw5kxs5u3s4u"
-    query_data = '{"get_all_markets": {}}'
-    contract_state = await client.fetch_smart_contract_state(address=address, query_data=query_data)
-    decoded_data = base64.b64decode(contract_state["data"]).decode("utf-8")
-    lent_amounts = json.loads(decoded_data)
-    #print(json.dumps(lent_amounts, indent=2))
+    address = contract_address("market")
+    markets = MarketEntry.parse_all(await query_contract(client, address, {"get_all_markets": {}}))
 
     lent_amounts_dict = {}
-
-    for market in lent_amounts:
-        denom = market[0]["native_token"]["denom"]
-        token_info = _get_token_info(denom)
+    for market in markets:
+        token_info = _get_token_info(market.denom)
         if token_info:
             decimals = int(token_info['decimals'])
-            ticker = token_info['ticker']
-            amount = float(market[1]["lending_principal"]) / 10**decimals
-            #print(f"Denom: {denom}, Amount: {amount}, Ticker: {ticker}")
-            lent_amounts_dict[ticker] = amount
+            lent_amounts_dict[token_info['ticker']] = market.lending_principal / 10**decimals
     
     return lent_amounts_dict
 
-
 async def get_borrowed_amount(client):
     logger.info("Getting borrowed amount")
-    address = "inj1nc7gjkf2mhp34a6gquhurg8qahnw5kxs5u3s4u"
-    query_data = '{"get_all_markets": {}}'
-    contract_state = await client.fetch_smart_contract_state(address=address, query_data=query_data)
-    decoded_data = base64.b64decode(contract_state["data"]).decode("utf-8")
-    borrowed_amounts = json.loads(decoded_data)
-    #print(json.dumps(borrowed_amounts, indent=2))
+    address = contract_address("market")
+    markets = MarketEntry.parse_all(await query_contract(client, address, {"get_all_markets": {}}))
 
     borrowed_amounts_dict = {}
-
-    for market in borrowed_amounts:
-        denom = market[0]["native_token"]["denom"]
-        token_info = _get_token_info(denom)
+    for market in markets:
+        token_info = _get_token_info(market.denom)
         if token_info:
             decimals = int(token_info['decimals'])
-            ticker = token_info['ticker']
-            amount = float(market[1]["debt_pool"]["balance"]) / 10**decimals
-            #print(f"Denom: {denom}, Amount: {amount}, Ticker: {ticker}")
-            borrowed_amounts_dict[ticker] = amount
+            borrowed_amounts_dict[token_info['ticker']] = market.debt_balance / 10**decimals
     
     return borrowed_amounts_dict
 
 async def get_token_prices(client):
     logger.info("Getting token prices")
-    address = "inj1u6cclz0qh5tep9m2qayry9k97dm46pnlqf8nre"
+    address = contract_address("oracle")
 
     token_prices_dict = {}
     tokens = _load_tokens()
     for token in tokens:
         denom = token['denom']
-        token_type = token['token_type']
-        ticker = token['ticker'] 
-        if token_type == "native_token":
-            query_data = '{"get_price": {"asset": {"native_token": {"denom": "' + denom + '"}}}}'
+        if token['token_type'] == "native_token":
+            asset = {"native_token": {"denom": denom}}
         else:
-            query_data = '{"get_price": {"asset": {"token": {"contract_addr": "' + denom + '"}}}}'
-        contract_state = await client.fetch_smart_contract_state(address=address, query_data=query_data)
-        decoded_data = base64.b64decode(contract_state["data"]).decode("utf-8")
-        token_prices = json.loads(decoded_data)
-        token_price = "$" + str(token_prices["price"])
-        token_prices_dict[ticker] = token_price
+            asset = {"token": {"contract_addr": denom}}
+        price = PriceResponse.parse(await query_contract(client, address, {"get_price": {"asset": asset}}))
+        token_prices_dict[token['ticker']] = price.price
 
     return token_prices_dict
 
@@ -320,92 +301,45 @@ async def get_nToken_contract_executes(client):
 
     return nToken_contract_executes
 
-async def get_NEPT_staking_rates(client):
+async def get_NEPT_staking_rates(client, params=None, staking_state=None):
+    """APR (%) per pool for every configured bond duration, keyed pool_<n>"""
     logger.info("Getting NEPT staking rates")
-    address = "inj1v3a4zznudwpukpr8y987pu5gnh4xuf7v36jhva"
-    query_data = '{"get_params": {}}'
-    contract_state = await client.fetch_smart_contract_state(address=address, query_data=query_data)
-    decoded_data = base64.b64decode(contract_state["data"]).decode("utf-8")
-    pool_data = json.loads(decoded_data)
-
-    emission_rate = float(pool_data["emission_rate"])/10**6
-    
-    # Access the reward weights from the bond_duration_settings list
-    pool_1_reward_weight = float(pool_data["bond_duration_settings"][0][1]["reward_weight"])
-    pool_2_reward_weight = float(pool_data["bond_duration_settings"][1][1]["reward_weight"])
-    pool_3_reward_weight = float(pool_data["bond_duration_settings"][2][1]["reward_weight"])
-
-    query_data = '{"get_state": {}}'
-    contract_state = await client.fetch_smart_contract_state(address=address, query_data=query_data)
-    decoded_data = base64.b64decode(contract_state["data"]).decode("utf-8")
-    staking_data = json.loads(decoded_data)
-
-    pool_1_stake = float(staking_data["bonded"][0][1])/10**6
-    pool_2_stake = float(staking_data["bonded"][1][1])/10**6
-    pool_3_stake = float(staking_data["bonded"][2][1])/10**6
-
-    average_yield = emission_rate / sum([pool_1_stake, pool_2_stake, pool_3_stake]) *100
-
-    # Calculate effective stakes
-    eff_stake_1 = pool_1_stake * pool_1_reward_weight
-    eff_stake_2 = pool_2_stake * pool_2_reward_weight
-    eff_stake_3 = pool_3_stake * pool_3_reward_weight
-
-    total_eff_stake = eff_stake_1 + eff_stake_2 + eff_stake_3
-
-    # Fraction of emission going to each pool
-    fraction_1 = eff_stake_1 / total_eff_stake
-    fraction_2 = eff_stake_2 / total_eff_stake
-    fraction_3 = eff_stake_3 / total_eff_stake
-
-    # Emission to each pool
-    emission_pool_1 = emission_rate * fraction_1
-    emission_pool_2 = emission_rate * fraction_2
-    emission_pool_3 = emission_rate * fraction_3
-
-    # Annual percentage rate (or daily, monthly, etc. depending on your timescale)
-    apr_1 = str(round((emission_pool_1 / pool_1_stake) * 100,2))+"%"
-    apr_2 = str(round((emission_pool_2 / pool_2_stake) * 100,2))+"%"
-    apr_3 = str(round((emission_pool_3 / pool_3_stake) * 100,2))+"%"
+    if params is None:
+        params = await get_NEPT_staking_params(client)
+    if staking_state is None:
+        staking_state = await get_NEPT_staking_state(client)
+
+    durations = list(params.reward_weights)
+    names = _staking_pool_names(durations)
+    aprs = pool_aprs(
+        params.emission_rate,
+        [staking_state.bonded.get(duration, 0.0) for duration in durations],
+        [params.reward_weights[duration] for duration in durations]
+    )
 
     pool_yield_dict = {}
-    pool_yield_dict["pool_1"] = apr_1
-    pool_yield_dict["pool_2"] = apr_2
-    pool_yield_dict["pool_3"] = apr_3
-   
+    for duration, apr in zip(durations, aprs):
+        if apr is not None:
+            pool_yield_dict[names[duration].replace("staking_pool_", "pool_")] = round(apr, 2)
     return pool_yield_dict
 
-async def get_NEPT_emission_rate(client):
+async def get_NEPT_emission_rate(client, params=None):
     logger.info("Getting NEPT emission rate")
-    address = "inj1v3a4zznudwpukpr8y987pu5gnh4xuf7v36jhva"
-    query_data = '{"get_params": {}}'
-    contract_state = await client.fetch_smart_contract_state(address=address, query_data=query_data)
-    decoded_data = base64.b64decode(contract_state["data"]).decode("utf-8")
-    pool_data = json.loads(decoded_data)
-
-    emission_rate = float(pool_data["emission_rate"])/10**6
-    return emission_rate
+    if params is None:
+        params = await get_NEPT_staking_params(client)
+    return params.emission_rate
 
 async def get_collateral_amounts(client):
     logger.info("Getting collateral amounts")
-    address = "inj1nc7gjkf2mhp34a6gquhurg8qahnw5kxs5u3s4u"
-    query_data = '{"get_all_collaterals": {}}'
-    contract_state = await client.fetch_smart_contract_state(address=address, query_data=query_data)
-    decoded_data = base64.b64decode(contract_state["data"]).decode("utf-8")
-    collaterals = json.loads(decoded_data)
+    address = contract_address("market")
+    collaterals = CollateralEntry.parse_all(await query_contract(client, address, {"get_all_collaterals": {}}))
 
     collaterals_dict = {}
     for collateral in collaterals:
-        if "native_token" in collateral[0]:
-            denom = collateral[0]["native_token"]["denom"]
-        else:
-            denom = collateral[0]["token"]["contract_addr"]
-        token_info = _get_token_info(denom)
+        token_info = _get_token_info(collateral.denom)
         if token_info:
-            ticker = token_info['ticker']
             decimals = int(token_info['decimals'])
-            amount = float(collateral[1]["collateral_pool"]["balance"]) / 10**decimals
-            collaterals_dict[ticker] = amount
+            collaterals_dict[token_info['ticker']] = collateral.balance / 10**decimals
     return collaterals_dict
 
 def _load_LP_pools():
@@ -420,106 +354,158 @@ def _load_LP_pools():
         logger.error(f"Error loading LP pools: {e}")
     return pools
 
+# Astroport pool API; the listing endpoint returns every pool on the chain in one response
+ASTROPORT_POOLS_URL = "https://api.astroport.fi/api/pools/"
+ASTROPORT_CHAIN_ID = "injective-1"
+LP_USE_POOL_LISTING = os.getenv('LP_USE_POOL_LISTING', 'true').lower() == 'true'
+LP_FETCH_CONCURRENCY = int(os.getenv('LP_FETCH_CONCURRENCY', '8'))
+
+# Last ETag and parsed data per pool, to skip unchanged pools
+_LP_pool_cache = {}
+
+# Fields a listing entry must carry to be stored as is; the listing may return a
+# reduced pool object, and a missing field must not be recorded as 0
+LP_REQUIRED_FIELDS = ("totalLiquidityUSD", "dayVolumeUSD", "dayLpFeesUSD")
+LP_REQUIRED_YIELD_FIELDS = ("poolFees", "astro", "externalRewards", "total")
+
+def _missing_LP_fields(pool_info):
+    """Names of the required fields absent from a pool object"""
+    missing = [field for field in LP_REQUIRED_FIELDS if pool_info.get(field) is None]
+    yield_data = pool_info.get("yield")
+    if not isinstance(yield_data, dict):
+        return missing + ["yield"]
+    return missing + [f"yield.{field}" for field in LP_REQUIRED_YIELD_FIELDS if yield_data.get(field) is None]
+
+def _parse_LP_pool(pool_address, pool_info, strict=False):
+    """
+    Extract the stored LP fields from an Astroport pool response, None if it is unusable.
+
+    With strict, a pool object missing any required field is rejected instead of
+    defaulting that field to 0, so the caller can fall back to the per-pool endpoint.
+    """
+    if strict:
+        missing = _missing_LP_fields(pool_info)
+        if missing:
+            logger.warning(f"Listing entry for pool {pool_address} lacks {', '.join(missing)}; fetching it individually")
+            return None
+    try:
+        # Get token symbols from the assets array
+        assets = pool_info.get("assets", [])
+        if not assets or len(assets) < 2:
+            logger.error(f"Invalid assets data for pool {pool_address}: {assets}")
+            return None
+            
+        # Strip '.peggy' from token symbols if present
+        token1 = assets[0].get("symbol", "Unknown").replace('.peggy', '')
+        token2 = assets[1].get("symbol", "Unknown").replace('.peggy', '')
+        
+        # Get yield data
+        yield_data = pool_info.get("yield", {})
+
+        return {
+            "LP_symbol": token1 + "/" + token2,
+            "pool_address": pool_address,
+            "total_liquidity_usd": float(pool_info.get("totalLiquidityUSD", 0)),
+            "day_volume_usd": float(pool_info.get("dayVolumeUSD", 0)),
+            "day_LP_fees_usd": float(pool_info.get("dayLpFeesUSD", 0)),
+            "yield_pool_fees": float(yield_data.get("poolFees", 0))*100,
+            "yield_astro_rewards": float(yield_data.get("astro", 0))*100,
+            "yield_external_rewards": float(yield_data.get("externalRewards", 0))*100,
+            "yield_total": float(yield_data.get("total", 0))*100
+        }
+    except (IndexError, KeyError, ValueError, TypeError, AttributeError) as e:
+        logger.error(f"Error parsing pool info for {pool_address}: {str(e)}")
+        logger.debug(f"Pool info structure: {json.dumps(pool_info, indent=2)}")
+        return None
+
+async def _fetch_LP_pool_listing(session, addresses):
+    """Fetch all pools in one listing request, keeping only the ones we track"""
+    try:
+        async with session.get(ASTROPORT_POOLS_URL, params={"chainId": ASTROPORT_CHAIN_ID}) as response:
+            if response.status != 200:
+                logger.warning(f"Astroport pool listing unavailable. Status: {response.status}")
+                return {}
+            listing = await response.json()
+    except Exception as e:
+        logger.warning(f"Error fetching Astroport pool listing: {str(e)}")
+        return {}
+
+    wanted = set(addresses)
+    found = {}
+    for pool_info in listing if isinstance(listing, list) else []:
+        if not isinstance(pool_info, dict):
+            continue
+        pool_address = pool_info.get("poolAddress") or pool_info.get("address")
+        if pool_address in wanted:
+            found[pool_address] = pool_info
+    return found
+
+async def _fetch_LP_pool(session, semaphore, pool_address):
+    """Fetch one pool, revalidating with its ETag so unchanged pools are not re-downloaded or re-parsed"""
+    cached = _LP_pool_cache.get(pool_address)
+    headers = {"If-None-Match": cached[0]} if cached and cached[0] else {}
+    async with semaphore:
+        try:
+            async with session.get(ASTROPORT_POOLS_URL + pool_address, headers=headers) as response:
+                if response.status == 304 and cached:
+                    return cached[1]
+                if response.status != 200:
+                    logger.error(f"Failed to fetch LP info for pool {pool_address}. Status: {response.status}")
+                    return None
+                pool_info = await response.json()
+                etag = response.headers.get("ETag")
+        except Exception as e:
+            logger.error(f"Error fetching LP info for pool {pool_address}: {str(e)}")
+            return None
+
+    if not pool_info:
+        logger.error(f"Empty response from API for pool {pool_address}")
+        return None
+    pool_data = _parse_LP_pool(pool_address, pool_info)
+    if pool_data:
+        _LP_pool_cache[pool_address] = (etag, pool_data)
+    return pool_data
+
 async def get_LP_info(client):
     logger.info("Getting LP info for all pools")
-    url = "https://api.astroport.fi/api/pools/"
-    pools_data = []
     
-    # Load pool addresses from CSV
+    # Load pool addresses from CSV, de-duplicated before any request is made
     pools = _load_LP_pools()
-    if not pools:
+    addresses = list(dict.fromkeys(
+        pool.get('LP_pool_address', '').strip() for pool in pools if pool.get('LP_pool_address', '').strip()
+    ))
+    if not addresses:
         logger.error("No LP pools found in CSV file")
         return None
+    if len(addresses) < len(pools):
+        logger.info(f"Skipped {len(pools) - len(addresses)} duplicate or empty LP pool rows")
     
     try:
         async with aiohttp.ClientSession() as session:
-            for pool in pools:
-                pool_address = pool.get('LP_pool_address')
-                if not pool_address:
-                    logger.warning(f"Skipping pool with missing address: {pool}")
-                    continue
-                    
-                try:
-                    async with session.get(url + pool_address) as response:
-                        if response.status != 200:
-                            logger.error(f"Failed to fetch LP info for pool {pool_address}. Status: {response.status}")
-                            continue
-                            
-                        pool_info = await response.json()
-                        
-                        if not pool_info:
-                            logger.error(f"Empty response from API for pool {pool_address}")
-                            continue
-                        
-                        try:
-                            # Get token symbols from the assets array
-                            assets = pool_info.get("assets", [])
-                            if not assets or len(assets) < 2:
-                                logger.error(f"Invalid assets data for pool {pool_address}: {assets}")
-                                continue
-                                
-                            token1 = assets[0].get("symbol", "Unknown")
-                            token2 = assets[1].get("symbol", "Unknown")
-                            
-                            # Strip '.peggy' from token symbols if present
-                            token1 = token1.replace('.peggy', '')
-                            token2 = token2.replace('.peggy', '')
-                            
-                            LP_symbol = token1 + "/" + token2
-                            
-                            # Get liquidity and volume data
-                            total_liquidity_usd = float(pool_info.get("totalLiquidityUSD", 0))
-                            day_volume_usd = float(pool_info.get("dayVolumeUSD", 0))
-                            day_LP_fees_usd = float(pool_info.get("dayLpFeesUSD", 0))
-                            
-                            # Get yield data
-                            yield_data = pool_info.get("yield", {})
-                            yield_total = float(yield_data.get("total", 0))*100
-                            yield_pool_fees = float(yield_data.get("poolFees", 0))*100
-                            yield_astro_rewards = float(yield_data.get("astro", 0))*100
-                            yield_external_rewards = float(yield_data.get("externalRewards", 0))*100
-                            
-                            # Print the extracted information
-                            print(f"\nPool: {LP_symbol}")
-                            print(f"Total Liquidity (USD): ${total_liquidity_usd:,.2f}")
-                            print(f"24h Volume (USD): ${day_volume_usd:,.2f}")
-                            print(f"24h LP Fees (USD): ${day_LP_fees_usd:,.2f}")
-                            print(f"Total Yield: {yield_total}%")
-                            print(f"Pool Fees: {yield_pool_fees}%")
-                            print(f"Astro Rewards: {yield_astro_rewards}%")
-                            print(f"External Rewards: {yield_external_rewards}%")
-                            
-
-                            pools_data.append({
-                                "LP_symbol": LP_symbol,
-                                "pool_address": pool_address,
-                                "total_liquidity_usd": total_liquidity_usd,
-                                "day_volume_usd": day_volume_usd,
-                                "day_LP_fees_usd": day_LP_fees_usd,
-                                "yield_pool_fees": yield_pool_fees,
-                                "yield_astro_rewards": yield_astro_rewards,
-                                "yield_external_rewards": yield_external_rewards,
-                                "yield_total": yield_total
-                            })
-                            
-                        except (IndexError, KeyError, ValueError) as e:
-                            logger.error(f"Error parsing pool info for {pool_address}: {str(e)}")
-                            logger.error(f"Pool info structure: {json.dumps(pool_info, indent=2)}")
-                            continue
-                            
-                except Exception as e:
-                    logger.error(f"Error fetching LP info for pool {pool_address}: {str(e)}")
-                    continue
-                    
+            # Try the multi-pool listing first, then fetch the rest concurrently
+            listed = await _fetch_LP_pool_listing(session, addresses) if LP_USE_POOL_LISTING else {}
+            results = {}
+            for pool_address, pool_info in listed.items():
+                results[pool_address] = _parse_LP_pool(pool_address, pool_info, strict=True)
+
+            remaining = [address for address in addresses if results.get(address) is None]
+            semaphore = asyncio.Semaphore(LP_FETCH_CONCURRENCY)
+            fetched = await asyncio.gather(*(
+                _fetch_LP_pool(session, semaphore, address) for address in remaining
+            ))
+            results.update(zip(remaining, fetched))
     except Exception as e:
         logger.error(f"Error in get_LP_info: {str(e)}")
         return None
-        
+
+    pools_data = [results[address] for address in addresses if results.get(address)]
+    for pool_data in pools_data:
+        logger.debug(f"Pool {pool_data['LP_symbol']}: liquidity ${pool_data['total_liquidity_usd']:,.2f}, total yield {pool_data['yield_total']}%")
+    logger.info(f"Fetched LP info for {len(pools_data)} of {len(addresses)} pools ({len(listed)} from listing)")
     return pools_data
 
 async def main() -> None:
-    network = Network.mainnet()
-    client = AsyncClient(network)
+    client = get_client()
     lp_info = await get_LP_info(client)
     print(lp_info)
 
@@ -2,7 +2,8 @@ from database import Base, engine
 from models import (
     MarketData, TokenRates, TokenAmounts, TokenPrices,
     ContractData, NTokenContractExecutes, MarketContractExecutes,
-    NEPTData, StakingPools, CollateralAmounts
+    NEPTData, StakingPools, CollateralAmounts, DerivedMetrics,
+    ContractExecuteBuckets, SourceStatus, CollectionLease
 )
 import logging
 
@@ -47,6 +48,18 @@ def recreate_tables():
     logger.info("Creating CollateralAmounts table...")
     CollateralAmounts.__table__.create(bind=engine)
     
+    logger.info("Creating DerivedMetrics table...")
+    DerivedMetrics.__table__.create(bind=engine)
+    
+    logger.info("Creating ContractExecuteBuckets table...")
+    ContractExecuteBuckets.__table__.create(bind=engine)
+    
+    logger.info("Creating SourceStatus table...")
+    SourceStatus.__table__.create(bind=engine)
+    
+    logger.info("Creating CollectionLease table...")
+    CollectionLease.__table__.create(bind=engine)
+    
     logger.info("Done!")
 
 if __name__ == "__main__":
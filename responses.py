@@ -0,0 +1,115 @@
+import gzip
+import hashlib
+import os
+from datetime import datetime
+from flask import request
+from sqlalchemy import select, func, or_
+from models import SourceStatus, SNAPSHOT_MARKER
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+# Responses smaller than this are sent uncompressed
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', '1024'))
+COMPRESS_LEVEL = int(os.getenv('COMPRESS_LEVEL', '6'))
+
+def row_to_dict(row):
+    """Convert an ORM row to a JSON-serializable dict of its columns"""
+    result = {}
+    for column in row.__table__.columns:
+        value = getattr(row, column.key)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        elif value is not None and not isinstance(value, (int, str)):
+            value = float(value)
+        result[column.key] = value
+    return result
+
+def rows_to_columns(rows):
+    """Convert a list of row dicts to one array per field"""
+    if not rows:
+        return {}
+    columns = {key: [] for key in rows[0]}
+    for row in rows:
+        for key, values in columns.items():
+            values.append(row.get(key))
+    return columns
+
+def wants_columnar():
+    """Whether the client asked for the column-oriented layout (?format=columnar)"""
+    return request.args.get('format') == 'columnar'
+
+def latest_timestamps(db, models, complete_only=False):
+    """
+    Get the latest snapshot timestamp of each model in a single round trip.
+
+    With complete_only, snapshots newer than the latest completion marker are
+    skipped, so readers never serve one whose sources are still being stored.
+    Without any marker (data collected before markers existed) nothing is skipped.
+    """
+    marker = select(func.max(SourceStatus.timestamp)).where(
+        SourceStatus.source == SNAPSHOT_MARKER
+    ).scalar_subquery()
+    subqueries = []
+    for model in models:
+        subquery = select(func.max(model.timestamp))
+        if complete_only:
+            subquery = subquery.where(or_(marker.is_(None), model.timestamp <= marker))
+        subqueries.append(subquery.scalar_subquery())
+    return list(db.execute(select(*subqueries)).one())
+
+def etag_for(path, query_string, *parts):
+    """ETag of a path and query string at the given snapshot markers, shared by both API modes"""
+    key = "|".join([path, query_string] + [str(part) for part in parts])
+    return hashlib.sha1(key.encode()).hexdigest()
+
+def make_etag(*parts):
+    """Build an ETag from the request path, query string and the given snapshot markers"""
+    return etag_for(request.path, request.query_string.decode(), *parts)
+
+def is_not_modified(etag, last_modified=None):
+    """Check If-None-Match (and If-Modified-Since when no ETag was sent) against the current state"""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified and request.if_modified_since:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+    return False
+
+def set_cache_headers(response, etag, last_modified=None):
+    """Attach validators so clients can revalidate with a conditional GET"""
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+def _choose_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+def compress_response(response):
+    """Compress JSON responses with brotli or gzip according to Accept-Encoding"""
+    if (response.status_code != 200 or response.direct_passthrough
+            or response.mimetype != 'application/json'
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = _choose_encoding()
+    data = response.get_data()
+    if encoding is None or len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    if encoding == 'br':
+        data = brotli.compress(data, quality=min(COMPRESS_LEVEL, 11))
+    else:
+        data = gzip.compress(data, compresslevel=COMPRESS_LEVEL)
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    return response
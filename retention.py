@@ -0,0 +1,287 @@
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from database import SessionLocal
+from models import (
+    MarketData, TokenRates, TokenAmounts, TokenPrices,
+    ContractData, NTokenContractExecutes, MarketContractExecutes,
+    NEPTData, StakingPools, CollateralAmounts, LPPoolData, DerivedMetrics,
+    SourceStatus, ContractExecuteBuckets
+)
+
+# Get the logger
+logger = logging.getLogger('neptune-data.collector')
+
+# Retention tiers as "<resolution>:<days>" pairs, youngest first. 0 days keeps the tier forever.
+RETENTION_TIERS = os.getenv('RETENTION_TIERS', 'raw:30,hourly:365,daily:0')
+# Number of snapshot timestamps (or event count buckets) handled per transaction
+RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', '200'))
+# Pause between batches so the collector and readers can get at the tables
+RETENTION_BATCH_PAUSE_SECONDS = float(os.getenv('RETENTION_BATCH_PAUSE_SECONDS', '0.1'))
+
+RESOLUTIONS = {
+    'raw': None,
+    'hourly': timedelta(hours=1),
+    'daily': timedelta(days=1),
+    'weekly': timedelta(weeks=1),
+}
+
+# Snapshot tables compacted together: the parent decides which timestamps are kept, children are deleted first
+TABLE_GROUPS = [
+    (MarketData, [TokenRates, TokenAmounts]),
+    (ContractData, [NTokenContractExecutes, MarketContractExecutes]),
+    (NEPTData, [StakingPools]),
+    (TokenPrices, []),
+    (CollateralAmounts, []),
+    (LPPoolData, []),
+    (DerivedMetrics, []),
+    (SourceStatus, []),
+]
+
+# Per-interval columns of thinned tables: the deltas of dropped snapshots are added to the
+# snapshot kept for their bucket, so the kept row covers the whole bucket
+SUMMED_COLUMNS = {DerivedMetrics: ['execute_delta']}
+
+# Event count tables: each row counts the events of its own bucket, so they are summed, not thinned
+BUCKET_TABLES = [ContractExecuteBuckets]
+
+def parse_tiers(spec):
+    """Parse a tier spec like 'raw:30,hourly:365,daily:0' into (name, resolution, max_age) tuples"""
+    tiers = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, days = part.partition(':')
+        name = name.strip()
+        if name not in RESOLUTIONS:
+            raise ValueError(f"Unknown retention tier: {name}")
+        days = int(days or 0)
+        max_age = timedelta(days=days) if days > 0 else None
+        tiers.append((name, RESOLUTIONS[name], max_age))
+    if not tiers:
+        raise ValueError("No retention tiers configured")
+    for (_, _, max_age) in tiers[:-1]:
+        if max_age is None:
+            raise ValueError("Only the last retention tier can be kept forever")
+    return tiers
+
+def _tier_for_age(tiers, age):
+    """Return the tier a row of the given age falls into, or None if it is past every tier"""
+    for tier in tiers:
+        max_age = tier[2]
+        if max_age is None or age <= max_age:
+            return tier
+    return None
+
+def plan_drops(timestamps, tiers, now):
+    """
+    Decide which snapshot timestamps to delete, as {dropped: kept}.
+
+    Raw-tier timestamps are kept. In a downsampled tier the latest snapshot of each
+    bucket is kept, which stays valid for both gauges and cumulative counters, and
+    each dropped timestamp maps to it. Timestamps older than every tier map to None.
+    """
+    kept = {}
+    buckets = {}
+    for ts in sorted(timestamps):
+        tier = _tier_for_age(tiers, now - ts)
+        if tier is None:
+            buckets[ts] = None
+            continue
+        name, resolution, _ = tier
+        if resolution is None:
+            continue
+        bucket = (name, int((ts - datetime.min) / resolution))
+        buckets[ts] = bucket
+        kept[bucket] = ts
+    return {ts: kept.get(bucket) for ts, bucket in buckets.items() if bucket is None or kept[bucket] != ts}
+
+def timestamps_to_drop(timestamps, tiers, now):
+    """Sorted snapshot timestamps to delete (see plan_drops)"""
+    return sorted(plan_drops(timestamps, tiers, now))
+
+def _raw_cutoff(tiers, now):
+    """Rows before this time are past the raw tier; None when raw data is kept forever"""
+    name, resolution, max_age = tiers[0]
+    if resolution is not None:
+        return now
+    return None if max_age is None else now - max_age
+
+def _bucket_start(ts, resolution):
+    return datetime.min + (ts - datetime.min) // resolution * resolution
+
+def _carry_deltas(db, model, columns, batch, keepers):
+    """Add the per-interval columns of rows about to be dropped to the row kept for their bucket"""
+    key_columns = [c.key for c in model.__table__.primary_key.columns]
+    sums = {}
+    for row in db.query(model).filter(model.timestamp.in_(batch)):
+        kept = keepers[row.timestamp]
+        if kept is None:
+            continue
+        key = tuple(kept if name == 'timestamp' else getattr(row, name) for name in key_columns)
+        totals = sums.setdefault(key, dict.fromkeys(columns, 0))
+        for column in columns:
+            totals[column] += getattr(row, column) or 0
+    for key, totals in sums.items():
+        target = db.get(model, key)
+        if target is None:
+            # The kept snapshot has no row for this key; keep the deltas on their own row
+            target = model(**dict(zip(key_columns, key)))
+            db.add(target)
+        for column, total in totals.items():
+            setattr(target, column, (getattr(target, column) or 0) + total)
+
+def _delete_batch(db, parent, children, batch, keepers):
+    """Delete one batch of timestamps from a table group in its own short transaction"""
+    deleted = 0
+    for model in children + [parent]:
+        if model in SUMMED_COLUMNS:
+            _carry_deltas(db, model, SUMMED_COLUMNS[model], batch, keepers)
+        deleted += db.query(model).filter(model.timestamp.in_(batch)).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+def compact_group(db, parent, children, tiers, now):
+    """
+    Thin one table group, returning the number of rows deleted.
+
+    Gauges and counters are not aggregated: each downsampled bucket keeps its
+    latest snapshot as it was collected (see plan_drops). Per-interval columns
+    listed in SUMMED_COLUMNS are summed into that snapshot.
+    """
+    cutoff = _raw_cutoff(tiers, now)
+    if cutoff is None:
+        return 0
+    timestamps = [row[0] for row in db.query(parent.timestamp).filter(
+        parent.timestamp < cutoff
+    ).distinct()]
+    db.rollback()  # Release the read snapshot before deleting
+
+    keepers = plan_drops(timestamps, tiers, now)
+    drop = sorted(keepers)
+    deleted = 0
+    for i in range(0, len(drop), RETENTION_BATCH_SIZE):
+        try:
+            deleted += _delete_batch(db, parent, children, drop[i:i + RETENTION_BATCH_SIZE], keepers)
+        except Exception:
+            db.rollback()
+            raise
+        if RETENTION_BATCH_PAUSE_SECONDS:
+            time.sleep(RETENTION_BATCH_PAUSE_SECONDS)
+    logger.info(f"Compacted {parent.__tablename__}: {len(drop)} snapshots, {deleted} rows deleted")
+    return deleted
+
+def _merge_bucket_window(db, model, start, end, resolution):
+    """
+    Sum the event counts in [start, end) into one row per bucket of the given
+    resolution and contract. Returns (rows seen, rows removed) after committing.
+    """
+    groups = {}
+    rows = db.query(model).filter(model.timestamp >= start, model.timestamp < end)
+    seen = 0
+    for row in rows:
+        seen += 1
+        groups.setdefault((_bucket_start(row.timestamp, resolution), row.contract_label), []).append(row)
+    removed = 0
+    for (bucket, label), group in groups.items():
+        if len(group) == 1 and group[0].timestamp == bucket:
+            continue  # Already merged by an earlier run
+        target = next((row for row in group if row.timestamp == bucket), None)
+        if target is None:
+            target = model(timestamp=bucket, contract_label=label, contract_address=group[0].contract_address)
+            db.add(target)
+        target.execute_count = sum(row.execute_count or 0 for row in group)
+        for row in group:
+            if row is not target:
+                db.delete(row)
+                removed += 1
+    db.commit()
+    return seen, removed
+
+def _delete_before(db, model, cutoff):
+    """Delete the rows older than cutoff, a batch of timestamps per transaction"""
+    deleted = 0
+    while True:
+        batch = [row[0] for row in db.query(model.timestamp).filter(
+            model.timestamp < cutoff
+        ).distinct().order_by(model.timestamp).limit(RETENTION_BATCH_SIZE)]
+        if not batch:
+            return deleted
+        deleted += db.query(model).filter(model.timestamp.in_(batch)).delete(synchronize_session=False)
+        db.commit()
+        if RETENTION_BATCH_PAUSE_SECONDS:
+            time.sleep(RETENTION_BATCH_PAUSE_SECONDS)
+
+def compact_buckets(db, model, tiers, now):
+    """
+    Merge old event count buckets into the resolution of their tier by
+    summing their counts, returning the number of rows removed. Buckets past
+    every tier are deleted.
+
+    Only the newly aged range is visited: each downsampled tier is walked
+    back from its young edge RETENTION_BATCH_SIZE buckets per transaction,
+    and the walk stops at the first window an earlier run already merged.
+    """
+    if _raw_cutoff(tiers, now) is None:
+        return 0
+    removed = 0
+    try:
+        _, _, oldest_age = tiers[-1]
+        if oldest_age is not None:
+            removed += _delete_before(db, model, now - oldest_age)
+
+        young_age = timedelta(0)
+        for _, resolution, max_age in tiers:
+            if resolution is not None:
+                # Only whole buckets that have fully aged into this tier
+                edge = _bucket_start(now - young_age, resolution)
+                floor = None if max_age is None else now - max_age
+                oldest = db.query(func.min(model.timestamp)).filter(model.timestamp < edge).scalar()
+                end = edge
+                while oldest is not None and end > oldest and (floor is None or end > floor):
+                    start = end - resolution * RETENTION_BATCH_SIZE
+                    if floor is not None:
+                        start = max(start, _bucket_start(floor, resolution))
+                    seen, merged = _merge_bucket_window(db, model, start, end, resolution)
+                    removed += merged
+                    if seen and not merged:
+                        break
+                    end = start
+                    if RETENTION_BATCH_PAUSE_SECONDS:
+                        time.sleep(RETENTION_BATCH_PAUSE_SECONDS)
+            young_age = max_age
+    except Exception:
+        db.rollback()
+        raise
+    logger.info(f"Compacted {model.__tablename__}: {removed} buckets merged or deleted")
+    return removed
+
+def run_retention(tiers_spec=RETENTION_TIERS, now=None):
+    """Apply the retention policy to all snapshot tables"""
+    tiers = parse_tiers(tiers_spec)
+    now = now or datetime.utcnow()
+    logger.info(f"Running retention with tiers: {tiers_spec}")
+
+    db = SessionLocal()
+    total = 0
+    try:
+        for parent, children in TABLE_GROUPS:
+            try:
+                total += compact_group(db, parent, children, tiers, now)
+            except Exception as e:
+                logger.error(f"Error compacting {parent.__tablename__}: {str(e)}")
+        for model in BUCKET_TABLES:
+            try:
+                total += compact_buckets(db, model, tiers, now)
+            except Exception as e:
+                logger.error(f"Error compacting {model.__tablename__}: {str(e)}")
+    finally:
+        db.close()
+    logger.info(f"Retention finished, {total} rows deleted")
+    return total
+
+if __name__ == "__main__":
+    run_retention()
@@ -0,0 +1,229 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from pyinjective.async_client import AsyncClient
+from pyinjective.core.network import Network
+
+# Get the logger
+logger = logging.getLogger('neptune-data.collector')
+
+# Comma-separated chain gRPC endpoints (host:port); empty uses the default mainnet endpoint only
+RPC_GRPC_ENDPOINTS = os.getenv('RPC_GRPC_ENDPOINTS', '')
+# Comma-separated LCD endpoints, matched by position to RPC_GRPC_ENDPOINTS
+RPC_LCD_ENDPOINTS = os.getenv('RPC_LCD_ENDPOINTS', '')
+# Weight of the newest sample in the latency EWMA
+RPC_EWMA_ALPHA = float(os.getenv('RPC_EWMA_ALPHA', '0.3'))
+# Send a hedged duplicate once a call runs past this latency percentile of its endpoint
+RPC_HEDGE_PERCENTILE = float(os.getenv('RPC_HEDGE_PERCENTILE', '95'))
+# Hedge delay used until an endpoint has enough samples, and the lower bound afterwards
+RPC_HEDGE_DELAY_SECONDS = float(os.getenv('RPC_HEDGE_DELAY_SECONDS', '1.0'))
+RPC_HEDGE_MIN_SAMPLES = 20
+RPC_LATENCY_WINDOW = 200
+# Base cooldown after a failure, doubled per consecutive failure
+RPC_FAILURE_COOLDOWN_SECONDS = float(os.getenv('RPC_FAILURE_COOLDOWN_SECONDS', '5'))
+RPC_MAX_COOLDOWN_SECONDS = 300
+# gRPC status codes that mean the endpoint could not serve the call; anything else
+# (NOT_FOUND, a contract error reported as UNKNOWN, ...) is an answer from a working endpoint
+ENDPOINT_FAILURE_CODES = {'UNAVAILABLE', 'DEADLINE_EXCEEDED', 'RESOURCE_EXHAUSTED', 'INTERNAL'}
+
+def grpc_status(error):
+    """Name of a gRPC error's status code, e.g. 'NOT_FOUND', or None for other exceptions"""
+    code = getattr(error, 'code', None)
+    if not callable(code):
+        return None
+    try:
+        return getattr(code(), 'name', None)
+    except Exception:
+        return None
+
+def is_endpoint_failure(error):
+    """Whether an error is the endpoint's fault (transport, timeout, overload) rather than the request's"""
+    status = grpc_status(error)
+    if status is not None:
+        return status in ENDPOINT_FAILURE_CODES
+    return isinstance(error, (asyncio.TimeoutError, ConnectionError, OSError))
+
+class EndpointStats:
+    """Health and latency tracking for one endpoint, kept across collection cycles"""
+
+    def __init__(self, name):
+        self.name = name
+        self.ewma = None
+        self.latencies = deque(maxlen=RPC_LATENCY_WINDOW)
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.hedges = 0
+
+    def record_success(self, latency):
+        self.requests += 1
+        self.latencies.append(latency)
+        self.ewma = latency if self.ewma is None else RPC_EWMA_ALPHA * latency + (1 - RPC_EWMA_ALPHA) * self.ewma
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+
+    def record_cancelled(self, elapsed):
+        """
+        A call cancelled after losing a hedge race took at least `elapsed`.
+        The bound only ever raises the latency estimate and is not a success,
+        so failures and cooldowns are left alone.
+        """
+        if self.ewma is None:
+            self.ewma = elapsed
+        elif elapsed > self.ewma:
+            self.ewma = RPC_EWMA_ALPHA * elapsed + (1 - RPC_EWMA_ALPHA) * self.ewma
+        else:
+            return
+        self.latencies.append(elapsed)
+
+    def record_failure(self):
+        self.requests += 1
+        self.errors += 1
+        self.consecutive_failures += 1
+        cooldown = min(RPC_FAILURE_COOLDOWN_SECONDS * 2 ** (self.consecutive_failures - 1), RPC_MAX_COOLDOWN_SECONDS)
+        self.cooldown_until = time.monotonic() + cooldown
+
+    @property
+    def healthy(self):
+        return time.monotonic() >= self.cooldown_until
+
+    def hedge_delay(self):
+        """Latency percentile after which a duplicate request is sent"""
+        if len(self.latencies) < RPC_HEDGE_MIN_SAMPLES:
+            return RPC_HEDGE_DELAY_SECONDS
+        ordered = sorted(self.latencies)
+        index = min(int(len(ordered) * RPC_HEDGE_PERCENTILE / 100), len(ordered) - 1)
+        return max(ordered[index], RPC_HEDGE_DELAY_SECONDS / 10)
+
+    def as_dict(self):
+        return {
+            'endpoint': self.name,
+            'ewma_latency': self.ewma,
+            'healthy': self.healthy,
+            'consecutive_failures': self.consecutive_failures,
+            'requests': self.requests,
+            'errors': self.errors,
+            'hedges': self.hedges,
+        }
+
+# Stats survive across cycles even though clients are recreated for each event loop
+_endpoint_stats = {}
+
+def _configured_networks():
+    """Build one Network per configured endpoint, falling back to the default mainnet"""
+    grpc_endpoints = [e.strip() for e in RPC_GRPC_ENDPOINTS.split(',') if e.strip()]
+    lcd_endpoints = [e.strip() for e in RPC_LCD_ENDPOINTS.split(',') if e.strip()]
+    if not grpc_endpoints:
+        network = Network.mainnet()
+        return [(network.grpc_endpoint, network)]
+
+    networks = []
+    for i, grpc_endpoint in enumerate(grpc_endpoints):
+        network = Network.mainnet()
+        network.grpc_endpoint = grpc_endpoint
+        if i < len(lcd_endpoints):
+            network.lcd_endpoint = lcd_endpoints[i]
+        networks.append((grpc_endpoint, network))
+    return networks
+
+def get_endpoint_stats():
+    """Health/latency stats of every endpoint seen so far"""
+    return [stats.as_dict() for stats in _endpoint_stats.values()]
+
+class RpcPool:
+    """
+    Drop-in stand-in for AsyncClient that spreads calls over several endpoints.
+
+    Each async client method is routed to the healthy endpoint with the lowest
+    latency EWMA. If it has not answered by that endpoint's hedge percentile, the
+    same call is sent to the next best endpoint and the first success wins.
+    Endpoints failing at the transport level are cooled down with exponential
+    backoff; application errors are raised to the caller as they are.
+    """
+
+    def __init__(self, networks=None):
+        self._networks = dict(networks or _configured_networks())
+        self._clients = {}
+        for name in self._networks:
+            _endpoint_stats.setdefault(name, EndpointStats(name))
+
+    def _client(self, name):
+        if name not in self._clients:
+            self._clients[name] = AsyncClient(self._networks[name])
+        return self._clients[name]
+
+    def _ranked(self):
+        """Endpoints ordered best first: healthy before cooling down, then by EWMA (unmeasured first)"""
+        stats = [_endpoint_stats[name] for name in self._networks]
+        return sorted(stats, key=lambda s: (not s.healthy, s.ewma if s.ewma is not None else 0.0))
+
+    async def _timed(self, stats, method, args, kwargs):
+        start = time.monotonic()
+        try:
+            result = await getattr(self._client(stats.name), method)(*args, **kwargs)
+        except asyncio.CancelledError:
+            # Lost a hedge race: the elapsed time is only a lower bound on its latency
+            stats.record_cancelled(time.monotonic() - start)
+            raise
+        except Exception as e:
+            if is_endpoint_failure(e):
+                stats.record_failure()
+            else:
+                # The endpoint answered, the request itself was rejected
+                stats.record_success(time.monotonic() - start)
+            raise
+        stats.record_success(time.monotonic() - start)
+        return result
+
+    async def call(self, method, *args, **kwargs):
+        ranked = deque(self._ranked())
+        primary = ranked.popleft()
+        pending = {asyncio.ensure_future(self._timed(primary, method, args, kwargs))}
+        hedge_delay = primary.hedge_delay()
+        hedged = False
+        last_error = None
+        try:
+            while pending:
+                timeout = hedge_delay if ranked and not hedged else None
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Still waiting past the hedge threshold: duplicate to the next best endpoint
+                    hedged = True
+                    backup = ranked.popleft()
+                    backup.hedges += 1
+                    logger.info(f"Hedging {method} to {backup.name} after {hedge_delay:.2f}s")
+                    pending.add(asyncio.ensure_future(self._timed(backup, method, args, kwargs)))
+                    continue
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+                    if not is_endpoint_failure(last_error):
+                        # Every endpoint would give the same answer
+                        raise last_error
+                    logger.warning(f"RPC {method} failed: {str(last_error)}")
+                if not pending and ranked:
+                    # Everything in flight failed, fail over to the next endpoint
+                    endpoint = ranked.popleft()
+                    hedge_delay = endpoint.hedge_delay()
+                    pending.add(asyncio.ensure_future(self._timed(endpoint, method, args, kwargs)))
+        finally:
+            for task in pending:
+                task.cancel()
+        raise last_error
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client(next(iter(self._networks))), name)
+        if not asyncio.iscoroutinefunction(attribute):
+            return attribute
+
+        async def routed(*args, **kwargs):
+            return await self.call(name, *args, **kwargs)
+        return routed
+
+def get_client():
+    """Client used by the collector: a pooled client over the configured endpoints"""
+    return RpcPool()
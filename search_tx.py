@@ -1,14 +1,30 @@
+import argparse
 import asyncio
-from queries import search_transaction_by_hash
-from pyinjective.async_client import AsyncClient
-from pyinjective.core.network import Network
+import json
+from tx_lookup import resolve_transactions
+from rpc_pool import get_client
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Look up transactions by hash and decode Neptune messages")
+    parser.add_argument('hashes', nargs='*', help="Transaction hashes")
+    parser.add_argument('--file', help="File with one transaction hash per line")
+    return parser.parse_args()
 
 async def main():
+    args = parse_args()
+    hashes = list(args.hashes)
+    if args.file:
+        with open(args.file) as f:
+            hashes.extend(line.strip() for line in f if line.strip())
+    if not hashes:
+        print("No transaction hashes given")
+        return
+
     try:
-        network = Network.mainnet()
-        client = AsyncClient(network)
-        print(f"Searching for transaction hash: A475DEB2BD59B5A1345F47F0FF3BC20E42206E2A07413F33A89DAD85A5A2D4D2")
-        await search_transaction_by_hash(client, 'A475DEB2BD59B5A1345F47F0FF3BC20E42206E2A07413F33A89DAD85A5A2D4D2')
+        client = get_client()
+        print(f"Searching for {len(hashes)} transaction hash(es)")
+        results = await resolve_transactions(client, hashes)
+        print(json.dumps(results, indent=2))
         # No need to close the client as it doesn't have a close method
     except Exception as e:
         print(f"Error in main: {e}")
@@ -16,4 +32,4 @@ async def main():
         traceback.print_exc()
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,294 @@
+import logging
+import math
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from sqlalchemy import Integer, Float, Numeric
+from models import SERIES_TABLES
+
+# Get the logger
+logger = logging.getLogger('neptune-data.web')
+
+# Serve recent reads from memory instead of the database
+SERIES_STORE_ENABLED = os.getenv('SERIES_STORE_ENABLED', 'true').lower() == 'true'
+# Days of snapshots kept in memory; queries reaching further back go to the database
+SERIES_STORE_DAYS = float(os.getenv('SERIES_STORE_DAYS', '7'))
+# Seconds between checks for snapshots written by another process
+SERIES_STORE_REFRESH_SECONDS = float(os.getenv('SERIES_STORE_REFRESH_SECONDS', '30'))
+SCHEDULE_INTERVAL = int(os.getenv('SCHEDULE_INTERVAL_MINUTES', '30'))
+
+# Snapshot tables held in memory; event buckets and collection status are read from the database
+STORE_TABLES = [
+    name for name in SERIES_TABLES
+    if name not in ('contract_execute_buckets', 'source_status')
+]
+
+EPOCH = datetime(1970, 1, 1)
+
+def _to_micros(dt):
+    return (dt - EPOCH) // timedelta(microseconds=1)
+
+def _from_micros(micros):
+    return EPOCH + timedelta(microseconds=micros)
+
+def _capacity(days=SERIES_STORE_DAYS, interval_minutes=SCHEDULE_INTERVAL):
+    """Slots per series: one window of scheduled snapshots plus headroom for catch-up runs"""
+    return int(days * 24 * 60 / interval_minutes * 1.5) + 16
+
+class SeriesBuffer:
+    """
+    Fixed-size ring of one series: integer microsecond timestamps plus one
+    preallocated array per numeric column (NaN for missing) and a list per
+    text column. Appends overwrite the oldest slot once full.
+    """
+
+    def __init__(self, capacity, numeric_columns, text_columns):
+        self.capacity = capacity
+        self.size = 0
+        self.head = 0  # Slot of the oldest entry
+        self.timestamps = array('q', [0]) * capacity
+        self.numeric = {name: array('d', [math.nan]) * capacity for name in numeric_columns}
+        self.text = {name: [None] * capacity for name in text_columns}
+
+    def last_timestamp(self):
+        return self.timestamps[(self.head + self.size - 1) % self.capacity] if self.size else None
+
+    def append(self, micros, values):
+        """Append one row; returns the evicted timestamp when the ring was full"""
+        evicted = None
+        if self.size < self.capacity:
+            slot = (self.head + self.size) % self.capacity
+            self.size += 1
+        else:
+            slot = self.head
+            evicted = self.timestamps[slot]
+            self.head = (self.head + 1) % self.capacity
+        self.timestamps[slot] = micros
+        self._write(slot, values)
+        return evicted
+
+    def replace_last(self, values):
+        self._write((self.head + self.size - 1) % self.capacity, values)
+
+    def _write(self, slot, values):
+        for name, column in self.numeric.items():
+            value = values.get(name)
+            column[slot] = math.nan if value is None else float(value)
+        for name, column in self.text.items():
+            column[slot] = values.get(name)
+
+    def ordered_timestamps(self):
+        """Timestamps oldest first, for range lookups"""
+        end = self.head + self.size
+        if end <= self.capacity:
+            return self.timestamps[self.head:end]
+        return self.timestamps[self.head:] + self.timestamps[:end - self.capacity]
+
+    def slots(self, start_micros, end_micros):
+        """Ring slots of the entries within [start, end], oldest first"""
+        ordered = self.ordered_timestamps()
+        first = bisect_left(ordered, start_micros)
+        last = bisect_right(ordered, end_micros)
+        return [(self.head + i) % self.capacity for i in range(first, last)]
+
+class TableWindow:
+    """Ring buffers of one table, one per series key, and how far back they are complete"""
+
+    def __init__(self, name, capacity):
+        self.name = name
+        self.model, self.key_column = SERIES_TABLES[name]
+        self.capacity = capacity
+        columns = [c for c in self.model.__table__.columns if c.key not in ('timestamp', self.key_column)]
+        self.numeric_columns = [c.key for c in columns if isinstance(c.type, (Integer, Float, Numeric))]
+        self.integer_columns = {c.key for c in columns if isinstance(c.type, Integer)}
+        self.text_columns = [c.key for c in columns if c.key not in self.numeric_columns]
+        self.buffers = {}
+        self.covered_since = None  # Every row at or after this time is held
+        self.last_timestamp = None
+
+    def append(self, key, timestamp, values):
+        buffer = self.buffers.get(key)
+        if buffer is None:
+            buffer = self.buffers[key] = SeriesBuffer(self.capacity, self.numeric_columns, self.text_columns)
+        micros = _to_micros(timestamp)
+        last = buffer.last_timestamp()
+        if last is not None and micros < last:
+            return False  # Already held, e.g. seen by an earlier refresh
+        if micros == last:
+            # Parent rows are filled in by several sources after they are first written
+            buffer.replace_last(values)
+            return False
+        evicted = buffer.append(micros, values)
+        if evicted is not None:
+            self.covered_since = max(self.covered_since, _from_micros(evicted + 1))
+        if self.last_timestamp is None or timestamp > self.last_timestamp:
+            self.last_timestamp = timestamp
+        return True
+
+    def load(self, rows):
+        appended = 0
+        columns = self.numeric_columns + self.text_columns
+        for row in rows:
+            key = getattr(row, self.key_column) if self.key_column else None
+            appended += self.append(key, row.timestamp, {name: getattr(row, name) for name in columns})
+        return appended
+
+    def rows(self, start, end, symbols=None):
+        """Row dicts shaped like row_to_dict (timestamp left as datetime), ordered by timestamp"""
+        start_micros, end_micros = _to_micros(start), _to_micros(end)
+        rows = []
+        for key, buffer in self.buffers.items():
+            if symbols is not None and str(key) not in symbols:
+                continue
+            for slot in buffer.slots(start_micros, end_micros):
+                row = {'timestamp': buffer.timestamps[slot]}
+                if self.key_column:
+                    row[self.key_column] = key
+                for name, column in buffer.numeric.items():
+                    value = column[slot]
+                    if math.isnan(value):
+                        row[name] = None
+                    else:
+                        row[name] = int(value) if name in self.integer_columns else value
+                for name, column in buffer.text.items():
+                    row[name] = column[slot]
+                rows.append(row)
+        rows.sort(key=lambda row: row['timestamp'])
+        for row in rows:
+            row['timestamp'] = _from_micros(row['timestamp'])
+        return rows
+
+    def first_timestamp(self, start):
+        """Earliest held timestamp at or after start"""
+        start_micros = _to_micros(start)
+        firsts = []
+        for buffer in self.buffers.values():
+            ordered = buffer.ordered_timestamps()
+            index = bisect_left(ordered, start_micros)
+            if index < len(ordered):
+                firsts.append(ordered[index])
+        return _from_micros(min(firsts)) if firsts else None
+
+    def memory_bytes(self):
+        per_slot = 8 * (1 + len(self.numeric_columns)) + 8 * len(self.text_columns)
+        return per_slot * self.capacity * len(self.buffers)
+
+class SeriesStore:
+    """
+    Rolling in-memory window of recent snapshots for the web process.
+
+    Seeded with one bulk query per table, then topped up with rows newer than
+    the last held snapshot whenever the change feed publishes or the refresh
+    interval has passed. Reads that start inside the window are answered
+    from memory; anything else returns None so the caller uses the database.
+    """
+
+    def __init__(self, tables=STORE_TABLES, days=SERIES_STORE_DAYS):
+        self.window = timedelta(days=days)
+        self.capacity = _capacity(days)
+        self.tables = {name: TableWindow(name, self.capacity) for name in tables}
+        self.ready = False
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        self._last_refresh = 0.0
+
+    def seed(self, session_factory, now=None):
+        start = (now or datetime.utcnow()) - self.window
+        db = session_factory()
+        try:
+            with self._lock:
+                for window in self.tables.values():
+                    model = window.model
+                    window.covered_since = start
+                    window.load(db.query(model).filter(model.timestamp >= start).order_by(model.timestamp))
+                self.ready = True
+                self._last_refresh = time.monotonic()
+        finally:
+            db.close()
+        logger.info(f"Series store seeded with {self.row_count()} rows from {len(self.tables)} tables")
+
+    def refresh(self, session_factory):
+        """Append rows at or after each table's newest held snapshot; concurrent callers skip"""
+        if not self.ready or not self._refresh_lock.acquire(blocking=False):
+            return 0
+        appended = 0
+        try:
+            db = session_factory()
+            try:
+                for window in self.tables.values():
+                    model = window.model
+                    since = window.last_timestamp or window.covered_since
+                    # >= picks up sources committed after an earlier refresh of the same snapshot
+                    rows = db.query(model).filter(model.timestamp >= since).order_by(model.timestamp).all()
+                    with self._lock:
+                        appended += window.load(rows)
+            finally:
+                db.close()
+            self._last_refresh = time.monotonic()
+        except Exception as e:
+            logger.error(f"Error refreshing series store: {str(e)}")
+        finally:
+            self._refresh_lock.release()
+        if appended:
+            logger.debug(f"Series store appended {appended} rows")
+        return appended
+
+    def refresh_if_stale(self, session_factory):
+        if time.monotonic() - self._last_refresh > SERIES_STORE_REFRESH_SECONDS:
+            self.refresh(session_factory)
+
+    def covers(self, table, start):
+        window = self.tables.get(table)
+        return self.ready and window is not None and window.covered_since is not None and start >= window.covered_since
+
+    def query(self, table, start, end, symbols=None):
+        """Rows of a table within [start, end], or None if the window does not cover start"""
+        if not self.covers(table, start):
+            return None
+        with self._lock:
+            return self.tables[table].rows(start, end, symbols)
+
+    def latest_timestamp(self, table):
+        with self._lock:
+            return self.tables[table].last_timestamp
+
+    def first_timestamp(self, table, start):
+        with self._lock:
+            return self.tables[table].first_timestamp(start)
+
+    def row_count(self):
+        return sum(buffer.size for window in self.tables.values() for buffer in window.buffers.values())
+
+    def stats(self):
+        return {
+            'ready': self.ready,
+            'days': self.window.total_seconds() / 86400,
+            'capacity_per_series': self.capacity,
+            'series': sum(len(window.buffers) for window in self.tables.values()),
+            'rows': self.row_count(),
+            'memory_bytes': sum(window.memory_bytes() for window in self.tables.values()),
+        }
+
+# Process-wide store used by the web routes
+store = SeriesStore()
+
+def start_series_store(session_factory):
+    """Seed the store in the background and keep it topped up from the change feed"""
+    if not SERIES_STORE_ENABLED:
+        logger.info("Series store disabled, all reads go to the database")
+        return None
+    from change_feed import feed
+    feed.add_listener(lambda timestamp: store.refresh(session_factory))
+
+    def seed():
+        try:
+            store.seed(session_factory)
+        except Exception as e:
+            logger.error(f"Error seeding series store: {str(e)}")
+
+    thread = threading.Thread(target=seed, daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,166 @@
+import asyncio
+import os
+from dataclasses import dataclass
+from typing import Callable
+from queries import get_market_contract_executes, get_all_borrow_accounts, get_NEPT_emission_rate, get_borrow_rates, get_lending_rates, get_NEPT_staking_amounts, get_NEPT_circulating_supply, get_nToken_contract_executes, get_lent_amount, get_borrowed_amount, get_token_prices, get_NEPT_staking_rates, get_collateral_amounts, get_LP_info, get_NEPT_staking_params, get_NEPT_staking_state
+from models import MarketData, TokenPrices, NEPTData, TokenRates, TokenAmounts, NTokenContractExecutes, MarketContractExecutes, StakingPools, CollateralAmounts, LPPoolData
+from derived_metrics import parse_counter
+
+async def fetch_market(client, timestamp):
+    borrow_accounts_data = await get_all_borrow_accounts(client)
+    return [MarketData(
+        timestamp=timestamp,
+        borrow_accounts_count=borrow_accounts_data['total_accounts_count'],
+        unique_borrow_addresses=borrow_accounts_data['unique_addresses_count']
+    )], {}
+
+async def fetch_prices(client, timestamp):
+    token_prices_data = await get_token_prices(client)
+    records = [
+        TokenPrices(timestamp=timestamp, token_symbol=token_symbol, price=price_value)
+        for token_symbol, price_value in token_prices_data.items()
+    ]
+    return records, {'prices': token_prices_data}
+
+async def fetch_executes(client, timestamp):
+    # The chain returns the counters as strings; store and pass them on as ints
+    market_executes = parse_counter(await get_market_contract_executes(client))
+    ntoken_executes_data = {
+        token_symbol: parse_counter(execute_count)
+        for token_symbol, execute_count in (await get_nToken_contract_executes(client)).items()
+    }
+    records = []
+    if market_executes:
+        records.append(MarketContractExecutes(
+            timestamp=timestamp,
+            contract_type="market",
+            execute_count=market_executes
+        ))
+    for token_symbol, execute_count in ntoken_executes_data.items():
+        if execute_count is not None:
+            records.append(NTokenContractExecutes(
+                timestamp=timestamp,
+                token_symbol=token_symbol,
+                execute_count=execute_count
+            ))
+    return records, {'market_executes': market_executes, 'ntoken_executes': ntoken_executes_data}
+
+async def fetch_nept(client, timestamp):
+    # Params and state are fetched once and shared by the emission, amount and rate calculations
+    params, staking_state = await asyncio.gather(get_NEPT_staking_params(client), get_NEPT_staking_state(client))
+    emission_rate = await get_NEPT_emission_rate(client, params)
+    staking_amounts, total_bonded = await get_NEPT_staking_amounts(client, staking_state)
+    staking_rates = await get_NEPT_staking_rates(client, params, staking_state)
+
+    records = [NEPTData(timestamp=timestamp, emission_rate=emission_rate, total_bonded=total_bonded)]
+    for pool_number, staking_amount in staking_amounts.items():
+        # Extract just the numeric part from 'staking_pool_1'
+        pool_num = ''.join(filter(str.isdigit, pool_number))
+        records.append(StakingPools(
+            timestamp=timestamp,
+            pool_number=int(pool_num),
+            staking_amount=staking_amount,
+            staking_rate=staking_rates.get(f"pool_{pool_num}", 0)
+        ))
+    return records, {}
+
+async def fetch_nept_supply(client, timestamp):
+    circulating_supply = await get_NEPT_circulating_supply()
+    return [NEPTData(timestamp=timestamp, circulating_supply=circulating_supply)], {}
+
+async def fetch_rates(client, timestamp):
+    borrow_rates_data = await get_borrow_rates(client)
+    lending_rates_data = await get_lending_rates(client)
+    records = [
+        TokenRates(
+            timestamp=timestamp,
+            token_symbol=token_symbol,
+            borrow_rate=borrow_rate,
+            lend_rate=lending_rates_data.get(token_symbol, 0)
+        )
+        for token_symbol, borrow_rate in borrow_rates_data.items()
+    ]
+    return records, {'borrow_rates': borrow_rates_data, 'lending_rates': lending_rates_data}
+
+async def fetch_amounts(client, timestamp):
+    lent_amounts = await get_lent_amount(client)
+    borrowed_amounts = await get_borrowed_amount(client)
+    records = [
+        TokenAmounts(
+            timestamp=timestamp,
+            token_symbol=token_symbol,
+            lent_amount=lent_amounts.get(token_symbol, 0),
+            borrowed_amount=borrowed_amounts.get(token_symbol, 0)
+        )
+        for token_symbol in set(lent_amounts) | set(borrowed_amounts)
+    ]
+    return records, {'lent': lent_amounts, 'borrowed': borrowed_amounts}
+
+async def fetch_collateral(client, timestamp):
+    collateral_amounts_data = await get_collateral_amounts(client)
+    records = [
+        CollateralAmounts(timestamp=timestamp, token_symbol=token_symbol, amount=amount)
+        for token_symbol, amount in collateral_amounts_data.items()
+    ]
+    return records, {}
+
+async def fetch_lp_pools(client, timestamp):
+    lp_pool_data = await get_LP_info(client)
+    if not lp_pool_data:
+        raise RuntimeError("No LP pool data was fetched")
+    records = [
+        LPPoolData(
+            timestamp=timestamp,
+            pool_address=pool["pool_address"],
+            LP_symbol=pool["LP_symbol"],
+            total_liquidity_usd=pool["total_liquidity_usd"],
+            day_volume_usd=pool["day_volume_usd"],
+            day_LP_fees_usd=pool["day_LP_fees_usd"],
+            yield_pool_fees=pool["yield_pool_fees"],
+            yield_astro_rewards=pool["yield_astro_rewards"],
+            yield_external_rewards=pool["yield_external_rewards"],
+            yield_total=pool["yield_total"]
+        )
+        for pool in lp_pool_data
+    ]
+    return records, {}
+
+@dataclass(frozen=True)
+class Source:
+    """A collected source: fetch(client, timestamp) returns (records, values), and whether derived metrics use it"""
+    name: str
+    fetch: Callable
+    derived_input: bool = False
+
+# Sources collected every cycle; each is fetched, retried and committed on its own.
+# When collection is sharded, market is replaced by the account scan ranges below.
+SOURCES = (
+    Source('market', fetch_market),
+    Source('prices', fetch_prices, derived_input=True),
+    Source('executes', fetch_executes, derived_input=True),
+    Source('nept', fetch_nept),
+    Source('nept_supply', fetch_nept_supply),
+    Source('rates', fetch_rates, derived_input=True),
+    Source('amounts', fetch_amounts, derived_input=True),
+    Source('collateral', fetch_collateral),
+    Source('lp_pools', fetch_lp_pools),
+)
+
+# Number of address ranges the borrow account scan is split into when collection is sharded
+ACCOUNT_SCAN_SHARDS = int(os.getenv('ACCOUNT_SCAN_SHARDS', '4'))
+
+# Bech32 data characters in sort order; the first one after "inj1" spreads addresses evenly
+_BECH32_SORTED = "023456789acdefghjklmnpqrstuvwxyz"
+
+def account_ranges(shards=ACCOUNT_SCAN_SHARDS, prefix="inj1"):
+    """
+    Split the account address space into contiguous [lower, upper) ranges.
+
+    Ranges are cut on the first data character, so every address falls in
+    exactly one range and per-range unique address counts can be summed.
+    The first lower and last upper bound are None (unbounded).
+    """
+    shards = max(1, min(shards, len(_BECH32_SORTED)))
+    cuts = [round(i * len(_BECH32_SORTED) / shards) for i in range(shards + 1)]
+    bounds = [None] + [prefix + _BECH32_SORTED[cut] for cut in cuts[1:-1]] + [None]
+    return list(zip(bounds[:-1], bounds[1:]))
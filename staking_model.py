@@ -0,0 +1,144 @@
+import logging
+import math
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import func
+from models import NEPTData, StakingPools
+
+# Get the logger
+logger = logging.getLogger('neptune-data.web')
+
+# Largest amount grid one what-if request may sweep
+STAKING_SIM_MAX_POINTS = int(os.getenv('STAKING_SIM_MAX_POINTS', '500'))
+
+def pool_aprs(emission_rate: float, stakes: Sequence[float], weights: Sequence[float]) -> List[Optional[float]]:
+    """
+    APR (%) of every pool in one pass.
+
+    Pool k receives emission * s_k * w_k / sum(s_i * w_i), so its APR is
+    100 * emission * w_k / sum(s_i * w_i) regardless of its own stake. That is
+    also the marginal APR of an empty pool. None if nothing is staked.
+    """
+    total_effective = sum(stake * weight for stake, weight in zip(stakes, weights))
+    if total_effective <= 0:
+        return [None] * len(weights)
+    scale = 100 * emission_rate / total_effective
+    return [scale * weight for weight in weights]
+
+def simulate_additions(emission_rate: float, stakes: Sequence[float], weights: Sequence[float],
+                       pool_index: int, amounts: Sequence[float]) -> List[List[Optional[float]]]:
+    """APRs of every pool after adding each amount to pool_index; one row per amount"""
+    base_effective = sum(stake * weight for stake, weight in zip(stakes, weights))
+    added_weight = weights[pool_index]
+    rows = []
+    for amount in amounts:
+        total_effective = base_effective + amount * added_weight
+        if total_effective <= 0:
+            rows.append([None] * len(weights))
+            continue
+        scale = 100 * emission_rate / total_effective
+        rows.append([scale * weight for weight in weights])
+    return rows
+
+@dataclass(frozen=True)
+class StakingSnapshot:
+    """Emission and per-pool stake/weight at one NEPTData timestamp"""
+    timestamp: object
+    emission_rate: float
+    pool_numbers: Tuple[int, ...]
+    stakes: Tuple[float, ...]
+    weights: Tuple[float, ...]
+
+    @classmethod
+    def from_rates(cls, timestamp, emission_rate, pools):
+        """
+        Build a snapshot from stored (pool_number, staking_amount, staking_rate) rows.
+
+        Reward weights are not stored, but APR_k is proportional to w_k and the
+        scale cancels out in every APR, so the stored rates serve as weights.
+        """
+        pools = sorted(pools)
+        return cls(
+            timestamp,
+            emission_rate,
+            tuple(pool[0] for pool in pools),
+            tuple(pool[1] for pool in pools),
+            tuple(pool[2] for pool in pools),
+        )
+
+    def pool_index(self, pool_number: int) -> int:
+        try:
+            return self.pool_numbers.index(pool_number)
+        except ValueError:
+            raise ValueError(f"Unknown staking pool: {pool_number}")
+
+    def current(self) -> List[Dict]:
+        aprs = pool_aprs(self.emission_rate, self.stakes, self.weights)
+        return [
+            {'pool_number': number, 'staking_amount': stake, 'apr': _round(apr)}
+            for number, stake, apr in zip(self.pool_numbers, self.stakes, aprs)
+        ]
+
+def _round(value):
+    return None if value is None else round(value, 4)
+
+_snapshot_cache = {}
+
+def load_latest_snapshot(db) -> Optional[StakingSnapshot]:
+    """Latest NEPTData emission with its staking pools, reloaded only when a newer snapshot exists"""
+    latest = db.query(func.max(NEPTData.timestamp)).filter(NEPTData.emission_rate.isnot(None)).scalar()
+    if latest is None:
+        return None
+    cached = _snapshot_cache.get('latest')
+    if cached is not None and cached.timestamp == latest:
+        return cached
+
+    nept = db.query(NEPTData).filter(NEPTData.timestamp == latest).one()
+    pools = db.query(StakingPools).filter(StakingPools.timestamp == latest).all()
+    snapshot = StakingSnapshot.from_rates(latest, float(nept.emission_rate), [
+        (pool.pool_number, float(pool.staking_amount or 0), float(pool.staking_rate or 0)) for pool in pools
+    ])
+    _snapshot_cache['latest'] = snapshot
+    logger.info(f"Loaded staking snapshot {latest} with {len(snapshot.pool_numbers)} pools")
+    return snapshot
+
+@lru_cache(maxsize=1024)
+def _simulate_cached(snapshot: StakingSnapshot, pool_number: int, amounts: Tuple[float, ...]):
+    rows = simulate_additions(
+        snapshot.emission_rate, snapshot.stakes, snapshot.weights,
+        snapshot.pool_index(pool_number), amounts
+    )
+    return [
+        {'amount': amount, 'aprs': {str(number): _round(apr) for number, apr in zip(snapshot.pool_numbers, row)}}
+        for amount, row in zip(amounts, rows)
+    ]
+
+def simulate(snapshot: StakingSnapshot, pool_number: int, amounts: Sequence[float]):
+    """What-if APRs for adding each amount to a pool, memoized per snapshot and grid"""
+    if len(amounts) > STAKING_SIM_MAX_POINTS:
+        raise ValueError(f"At most {STAKING_SIM_MAX_POINTS} amounts per simulation")
+    if any(amount < 0 for amount in amounts):
+        raise ValueError("Amounts must not be negative")
+    return _simulate_cached(snapshot, pool_number, tuple(float(amount) for amount in amounts))
+
+def parse_amounts(args) -> List[float]:
+    """Amount grid from ?amounts=a,b,c or ?max=X&steps=N (evenly spaced from 0 to X)"""
+    try:
+        if args.get('amounts'):
+            amounts = [float(amount) for amount in args['amounts'].split(',') if amount.strip()]
+            steps = None
+        else:
+            maximum = float(args['max'])
+            steps = int(args.get('steps', '10'))
+    except (KeyError, ValueError):
+        raise ValueError("Pass amounts=a,b,c or max=X&steps=N")
+    if steps is not None:
+        if steps < 1 or steps > STAKING_SIM_MAX_POINTS:
+            raise ValueError(f"steps must be between 1 and {STAKING_SIM_MAX_POINTS}")
+        amounts = [maximum * i / steps for i in range(steps + 1)]
+    # float() accepts 'nan' and 'inf', which would poison every simulated value
+    if not all(math.isfinite(amount) for amount in amounts):
+        raise ValueError("Amounts must be finite numbers")
+    return amounts
@@ -0,0 +1,104 @@
+import json
+import logging
+import os
+import time
+from decoding import query_contract, asset_denom
+from contracts import contract_address
+
+# Get the logger
+logger = logging.getLogger('neptune-data.collector')
+
+MARKET_CONTRACT_ADDRESS = contract_address("market")
+
+# Where discovered token metadata is persisted, and how long it stays fresh
+TOKEN_METADATA_PATH = os.getenv('TOKEN_METADATA_PATH', 'token_metadata.json')
+TOKEN_METADATA_TTL_SECONDS = int(os.getenv('TOKEN_METADATA_TTL_SECONDS', str(24 * 3600)))
+
+def load_cached_tokens():
+    """Load persisted token metadata; returns (tokens, fetched_at) or ([], 0) if there is none"""
+    try:
+        with open(TOKEN_METADATA_PATH) as f:
+            cached = json.load(f)
+        return cached.get('tokens', []), cached.get('fetched_at', 0)
+    except FileNotFoundError:
+        return [], 0
+    except Exception as e:
+        logger.error(f"Error loading token metadata cache: {e}")
+        return [], 0
+
+def _save_cached_tokens(tokens):
+    tmp_path = TOKEN_METADATA_PATH + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'fetched_at': time.time(), 'tokens': tokens}, f, indent=2)
+    os.replace(tmp_path, TOKEN_METADATA_PATH)
+
+def is_stale(fetched_at):
+    return time.time() - fetched_at > TOKEN_METADATA_TTL_SECONDS
+
+async def _native_token_info(client, denom):
+    """Ticker and decimals from the bank denom metadata"""
+    response = await client.fetch_denom_metadata(denom=denom)
+    metadata = response.get('metadata', {})
+    units = metadata.get('denomUnits') or metadata.get('denom_units') or []
+    if not units or not metadata.get('symbol'):
+        return None
+    decimals = max(int(unit.get('exponent', 0)) for unit in units)
+    return {'ticker': metadata['symbol'], 'denom': denom, 'decimals': str(decimals), 'token_type': 'native_token'}
+
+async def _cw20_token_info(client, address):
+    """Ticker and decimals from the CW20 token_info query"""
+    info = await query_contract(client, address, {"token_info": {}})
+    return {'ticker': info['symbol'], 'denom': address, 'decimals': str(info['decimals']), 'token_type': 'token'}
+
+async def discover_tokens(client, known_tokens):
+    """
+    Find market and collateral denoms on chain that are not in known_tokens.
+
+    Returns metadata rows shaped like tokens.csv. Denoms without usable
+    metadata are skipped, never guessed.
+    """
+    known_denoms = {token['denom'] for token in known_tokens}
+    known_tickers = {token['ticker'] for token in known_tokens}
+
+    markets = await query_contract(client, MARKET_CONTRACT_ADDRESS, {"get_all_markets": {}})
+    collaterals = await query_contract(client, MARKET_CONTRACT_ADDRESS, {"get_all_collaterals": {}})
+
+    discovered = []
+    for entry in markets + collaterals:
+        asset = entry[0]
+        denom = asset_denom(asset)
+        if denom in known_denoms:
+            continue
+        known_denoms.add(denom)
+        try:
+            if "native_token" in asset:
+                info = await _native_token_info(client, denom)
+            else:
+                info = await _cw20_token_info(client, denom)
+        except Exception as e:
+            logger.warning(f"Could not fetch metadata for {denom}: {str(e)}")
+            continue
+        if info is None:
+            logger.warning(f"No usable metadata for {denom}, add it to tokens.csv")
+            continue
+        if info['ticker'] in known_tickers:
+            logger.warning(f"Discovered {denom} as {info['ticker']}, which is already used by another denom")
+            continue
+        known_tickers.add(info['ticker'])
+        discovered.append(info)
+        logger.info(f"Discovered token {info['ticker']} ({denom})")
+    return discovered
+
+async def refresh_token_metadata(client, known_tokens, force=False):
+    """
+    Re-run discovery when the persisted cache is older than the TTL.
+
+    Returns True if the cache was refreshed.
+    """
+    _, fetched_at = load_cached_tokens()
+    if not force and not is_stale(fetched_at):
+        return False
+    logger.info("Refreshing token metadata from chain")
+    discovered = await discover_tokens(client, known_tokens)
+    _save_cached_tokens(discovered)
+    return True
@@ -0,0 +1,212 @@
+import asyncio
+import base64
+import concurrent.futures
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from event_stream import get_execute_contracts
+
+# Get the logger; lookups are served by the web routes
+logger = logging.getLogger('neptune-data.web')
+
+# In-memory LRU size and on-disk cache location for resolved transactions
+TX_CACHE_SIZE = int(os.getenv('TX_CACHE_SIZE', '10000'))
+TX_CACHE_PATH = os.getenv('TX_CACHE_PATH', 'tx_cache.sqlite')
+# Maximum concurrent lookups against the chain
+TX_LOOKUP_CONCURRENCY = int(os.getenv('TX_LOOKUP_CONCURRENCY', '16'))
+# Seconds a web request waits for a lookup before answering 504
+TX_LOOKUP_TIMEOUT_SECONDS = float(os.getenv('TX_LOOKUP_TIMEOUT_SECONDS', '30'))
+
+# HTTP status of a failed lookup by the gRPC status code of the chain error; anything else is 502
+ERROR_HTTP_STATUS = {'NOT_FOUND': 404, 'INVALID_ARGUMENT': 400, 'DEADLINE_EXCEEDED': 504}
+
+EXECUTE_CONTRACT_TYPE = "/cosmwasm.wasm.v1.MsgExecuteContract"
+
+def normalize_hash(tx_hash):
+    tx_hash = tx_hash.strip()
+    if tx_hash.lower().startswith('0x'):
+        tx_hash = tx_hash[2:]
+    return tx_hash.upper()
+
+class TxCache:
+    """
+    Two-level cache for resolved transactions: an in-memory LRU in front of a
+    SQLite file. Committed transactions never change, so entries never expire.
+    """
+
+    def __init__(self, path=TX_CACHE_PATH, size=TX_CACHE_SIZE):
+        self.size = size
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False) if path else None
+        if self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS transactions (hash TEXT PRIMARY KEY, data TEXT NOT NULL)")
+            self._db.commit()
+
+    def _remember(self, tx_hash, tx):
+        self._memory[tx_hash] = tx
+        self._memory.move_to_end(tx_hash)
+        while len(self._memory) > self.size:
+            self._memory.popitem(last=False)
+
+    def get(self, tx_hash):
+        with self._lock:
+            if tx_hash in self._memory:
+                self._memory.move_to_end(tx_hash)
+                return self._memory[tx_hash]
+            if not self._db:
+                return None
+            row = self._db.execute("SELECT data FROM transactions WHERE hash = ?", (tx_hash,)).fetchone()
+            if row is None:
+                return None
+            tx = json.loads(row[0])
+            self._remember(tx_hash, tx)
+            return tx
+
+    def put_many(self, transactions):
+        with self._lock:
+            for tx_hash, tx in transactions.items():
+                self._remember(tx_hash, tx)
+            if self._db and transactions:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO transactions (hash, data) VALUES (?, ?)",
+                    [(tx_hash, json.dumps(tx)) for tx_hash, tx in transactions.items()]
+                )
+                self._db.commit()
+
+_cache = None
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        _cache = TxCache()
+    return _cache
+
+def decode_message(message, contracts):
+    """Decode one tx message; Neptune executes get the contract label, action and decoded msg"""
+    decoded = {"type": message.get("@type")}
+    if decoded["type"] != EXECUTE_CONTRACT_TYPE:
+        return decoded
+
+    contract = message.get("contract")
+    decoded.update({
+        "sender": message.get("sender"),
+        "contract": contract,
+        "contract_label": contracts.get(contract),
+        "funds": message.get("funds", []),
+    })
+    msg = message.get("msg")
+    try:
+        # Protobuf bytes come back base64-encoded from the gRPC client
+        msg = json.loads(base64.b64decode(msg)) if isinstance(msg, str) else msg
+    except (ValueError, TypeError):
+        pass
+    decoded["msg"] = msg
+    if isinstance(msg, dict) and msg:
+        decoded["action"] = next(iter(msg))
+    return decoded
+
+def decode_transaction(tx_hash, raw, contracts):
+    """Reduce a fetch_tx response to the fields we inspect, with decoded messages"""
+    response = raw.get("txResponse", {})
+    messages = raw.get("tx", {}).get("body", {}).get("messages", [])
+    decoded = [decode_message(message, contracts) for message in messages]
+    return {
+        "hash": tx_hash,
+        "height": int(response.get("height", 0)),
+        "timestamp": response.get("timestamp"),
+        "code": response.get("code", 0),
+        "gas_used": int(response.get("gasUsed", 0)),
+        "neptune": any(m.get("contract_label") for m in decoded),
+        "messages": decoded,
+        "raw_log": response.get("rawLog") if response.get("code") else None,
+    }
+
+async def resolve_transactions(client, hashes, cache=None):
+    """
+    Resolve many transaction hashes, serving cached ones and fetching the rest concurrently.
+
+    Returns {hash: decoded tx or {"hash", "error"}} in the order given.
+    """
+    cache = cache or get_cache()
+    hashes = [normalize_hash(h) for h in hashes]
+    results = {}
+    missing = []
+    for tx_hash in dict.fromkeys(hashes):
+        cached = cache.get(tx_hash)
+        if cached is not None:
+            results[tx_hash] = cached
+        else:
+            missing.append(tx_hash)
+
+    if missing:
+        contracts = get_execute_contracts()
+        semaphore = asyncio.Semaphore(TX_LOOKUP_CONCURRENCY)
+
+        async def fetch(tx_hash):
+            async with semaphore:
+                try:
+                    raw = await client.fetch_tx(hash=tx_hash)
+                    return tx_hash, decode_transaction(tx_hash, raw, contracts), True
+                except Exception as e:
+                    from rpc_pool import grpc_status
+                    status = grpc_status(e)
+                    logger.warning(f"Error fetching transaction {tx_hash} ({status}): {str(e)}")
+                    return tx_hash, {"hash": tx_hash, "error": str(e), "status": status}, False
+
+        fetched = await asyncio.gather(*(fetch(tx_hash) for tx_hash in missing))
+        cache.put_many({tx_hash: tx for tx_hash, tx, ok in fetched if ok})
+        results.update({tx_hash: tx for tx_hash, tx, _ in fetched})
+        logger.info(f"Resolved {len(missing)} transactions, {len(hashes) - len(missing)} from cache")
+
+    return {tx_hash: results[tx_hash] for tx_hash in hashes}
+
+def error_http_status(tx):
+    """HTTP status for a failed lookup result"""
+    return ERROR_HTTP_STATUS.get(tx.get("status"), 502)
+
+# Chain client and event loop shared by every lookup of this process, so connections
+# and endpoint state are reused instead of rebuilt per request
+_client = None
+_loop = None
+_loop_lock = threading.Lock()
+
+def _shared_client():
+    global _client
+    if _client is None:
+        # Deferred so web workers only load the chain client when a lookup needs it
+        from rpc_pool import get_client
+        _client = get_client()
+    return _client
+
+async def lookup_transactions_async(hashes):
+    """Resolve hashes with the process-wide client; for callers that own a single event loop"""
+    return await resolve_transactions(_shared_client(), hashes)
+
+def _lookup_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="tx-lookup", daemon=True).start()
+    return _loop
+
+def lookup_transactions(hashes, timeout=TX_LOOKUP_TIMEOUT_SECONDS):
+    """
+    Resolve hashes from sync code (the Flask routes) on a background event
+    loop owned by this process; raises TimeoutError after timeout seconds.
+    """
+    future = asyncio.run_coroutine_threadsafe(lookup_transactions_async(hashes), _lookup_loop())
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise TimeoutError(f"Transaction lookup took longer than {timeout}s")
+
+async def search_transaction_by_hash(client, tx_hash):
+    """Resolve a single transaction hash"""
+    results = await resolve_transactions(client, [tx_hash])
+    return next(iter(results.values()))